@@ -0,0 +1,277 @@
+"""
+Batch synthesis: run many sketches in a pool of processes and stream their results.
+
+A manifest is either a JSON Lines file with one job per line, or a directory in which every
+`*.json` file is a job and every `*.while` file is a program to synthesize without PBEs; other
+files are ignored. A job that is not a valid JSON object gets an `error` result.
+A job is an object with the fields
+    id         a unique name (defaults to the line number or the file name)
+    program    the program text
+    pbes       a list of [input, output] condition pairs (optional)
+    invariant  the loop invariant (optional)
+    timeout    seconds before the job is stopped (optional)
+    options    keyword arguments for `synthesize`, such as {"cegis": true} (optional)
+
+Every result is a JSON object with the job id, a verdict (`solved`, `unsolved`, `timeout`
+or `error`), the wall-clock seconds, and for solved jobs the hole values, the completed
+program and the unfolding depth. With an output file, results are appended as they complete
+and jobs that already have a result there are skipped, so an interrupted batch can be resumed.
+
+Run with `python batch.py MANIFEST [-o RESULTS] [-j WORKERS] [--timeout SECONDS]`.
+"""
+import argparse
+import collections
+import json
+import math
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import typing
+from multiprocessing.connection import Connection, wait
+
+from syntax.while_lang import parse
+from wp import STATS, get_hole_values, get_holes, parse_PBE, pretty_repr, synthesize
+
+Job: typing.TypeAlias = dict[str, typing.Any]
+Result: typing.TypeAlias = dict[str, typing.Any]
+
+
+def read_job(id: str, text: str) -> Job:
+    """
+    Read a job from its JSON text. A job that cannot be read is kept with an `error`,
+    which becomes its result.
+    """
+    try:
+        job = json.loads(text)
+    except ValueError as e:
+        return {"id": id, "error": f"invalid job: {e}"}
+    if not isinstance(job, dict):
+        return {"id": id, "error": "invalid job: not a JSON object"}
+    return {"id": id, **job}
+
+
+def load_manifest(path: str) -> list[Job]:
+    """
+    Read the jobs of a JSON Lines manifest or a manifest directory.
+    Other files in a manifest directory, and its subdirectories, are ignored.
+    """
+    jobs = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            stem, extension = os.path.splitext(name)
+            file_path = os.path.join(path, name)
+            if extension not in (".json", ".while") or not os.path.isfile(file_path):
+                continue
+            with open(file_path) as f:
+                if extension == ".json":
+                    jobs.append(read_job(stem, f.read()))
+                else:
+                    jobs.append({"id": stem, "program": f.read()})
+    else:
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    jobs.append(read_job(str(number), line))
+    return jobs
+
+
+def finished_ids(results_path: str) -> set[str]:
+    """
+    Get the ids of the jobs that have a result in a results file.
+    A line cut short by an interrupted run is ignored, so its job is run again.
+    """
+    ids = set()
+    if os.path.exists(results_path):
+        with open(results_path) as f:
+            for line in f:
+                try:
+                    ids.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    pass
+    return ids
+
+
+def ends_with_newline(path: str) -> bool:
+    """
+    Whether a file is empty or ends with a complete line.
+    """
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def is_timeout(value: typing.Any) -> bool:
+    """
+    Whether a value is a valid timeout: None (no timeout) or a finite, non-negative number of seconds.
+    """
+    if value is None:
+        return True
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value < math.inf
+
+
+def solve_job(job: Job) -> Result:
+    """
+    Synthesize the holes of a single job.
+    """
+    ast = parse(job["program"])
+    if ast is None:
+        return {"verdict": "error", "error": "invalid program"}
+
+    inputs, outputs = [], []
+    for input_text, output_text in job.get("pbes", []):
+        P, Q = parse_PBE(input_text), parse_PBE(output_text)
+        if P is None or Q is None:
+            return {"verdict": "error", "error": f"invalid PBE: {input_text!r} -> {output_text!r}"}
+        inputs.append(P)
+        outputs.append(Q)
+
+    linv = lambda _: True
+    if job.get("invariant"):
+        linv = parse_PBE(job["invariant"])
+        if linv is None:
+            return {"verdict": "error", "error": "invalid invariant"}
+
+    model = synthesize(ast, linv, inputs, outputs, **job.get("options", {}))
+    if model is None:
+        return {"verdict": "unsolved"}
+    return {"verdict": "solved", "holes": get_hole_values(model, get_holes(ast)),
+            "program": pretty_repr(ast, model), "depth": STATS["unfolding_depth"]}
+
+
+def lead_process_group() -> None:
+    """
+    Move the current process to a process group of its own, so that `kill_process_group` also
+    stops the processes it starts, such as the workers of a portfolio search.
+    """
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+
+def kill_process_group(process: multiprocessing.Process) -> None:
+    """
+    Kill a process that called `lead_process_group`, together with its descendants.
+    """
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # the process has not made its group yet, so it has not started any other
+    process.kill()
+    process.join()
+
+
+def run_job(job: Job, connection: Connection) -> None:
+    """
+    The body of a worker process: solve a job and send back its result.
+    """
+    lead_process_group()
+    # the progress messages of `synthesize` would be interleaved with the streamed results
+    sys.stdout = open(os.devnull, "w")
+    try:
+        result = solve_job(job)
+    except Exception as e:
+        result = {"verdict": "error", "error": f"{type(e).__name__}: {e}"}
+    connection.send(result)
+    connection.close()
+
+
+def run_batch(jobs: typing.Iterable[Job], workers: int | None = None,
+              timeout: float | None = None) -> typing.Iterator[Result]:
+    """
+    Run jobs in parallel, one process per job and at most `workers` at a time, and yield
+    their results in the order they complete. A job running for longer than its timeout
+    (or `timeout`, if it has none) is killed, together with any process it started. A job
+    with an `error` is not run, and the error is its result.
+    """
+    pending = collections.deque(jobs)
+    running = {}
+    workers = workers or os.cpu_count()
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                job = pending.popleft()
+                job_timeout = job.get("timeout", timeout)
+                if "error" not in job and not is_timeout(job_timeout):
+                    job = {**job, "error": "timeout must be a non-negative number"}
+                if "error" in job:
+                    yield {"id": job["id"], "verdict": "error", "error": job["error"], "seconds": 0.0}
+                    continue
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                # not a daemon, so that a portfolio search can start its own workers
+                process = multiprocessing.Process(target=run_job, args=(job, sender))
+                process.start()
+                sender.close()
+                start = time.perf_counter()
+                running[receiver] = (job, process, start, None if job_timeout is None else start + job_timeout)
+
+            if not running:
+                continue
+            deadlines = [deadline for *_, deadline in running.values() if deadline is not None]
+            wait_seconds = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+            ready = wait(list(running), wait_seconds)
+
+            now = time.perf_counter()
+            for receiver, (job, process, start, deadline) in list(running.items()):
+                if receiver in ready:
+                    try:
+                        result = receiver.recv()
+                    except EOFError:
+                        process.join()
+                        result = {"verdict": "error", "error": f"worker exited with code {process.exitcode}"}
+                elif deadline is not None and now >= deadline:
+                    kill_process_group(process)
+                    result = {"verdict": "timeout"}
+                else:
+                    continue
+                process.join()
+                receiver.close()
+                del running[receiver]
+                yield {"id": job["id"], **result, "seconds": round(now - start, 3)}
+    finally:
+        # the jobs are not daemons, so would otherwise outlive an interrupted batch
+        for receiver, (_, process, *_) in running.items():
+            kill_process_group(process)
+            receiver.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Synthesize the holes of many programs in parallel.")
+    parser.add_argument("manifest", help="a JSON Lines file of jobs, or a directory of job files")
+    parser.add_argument("-o", "--output", help="append results to this file, skipping jobs already in it")
+    parser.add_argument("-j", "--workers", type=int, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--timeout", type=float, help="default seconds per job")
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    if args.output:
+        done = finished_ids(args.output)
+        jobs = [job for job in jobs if job["id"] not in done]
+
+    verdicts = collections.Counter()
+    output = None
+    if args.output:
+        output = open(args.output, "a")
+        # a line cut short by an interrupted run must not swallow the first new result
+        if not ends_with_newline(args.output):
+            output.write("\n")
+    try:
+        for result in run_batch(jobs, args.workers, args.timeout):
+            verdicts[result["verdict"]] += 1
+            line = json.dumps(result)
+            print(line, flush=True)
+            if output is not None:
+                output.write(line + "\n")
+                output.flush()
+    finally:
+        if output is not None:
+            output.close()
+    print(", ".join(f"{count} {verdict}" for verdict, count in sorted(verdicts.items())) or "nothing to do",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
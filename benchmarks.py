@@ -0,0 +1,559 @@
+"""
+Performance benchmarks for the parser and the synthesizer.
+Run with `python benchmarks.py [benchmark ...]`; without arguments, all benchmarks are run.
+"""
+import contextlib
+import functools
+import io
+import json
+import multiprocessing
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from syntax.parsing.earley.earley import Parser
+from syntax.parsing.silly import SillyLexer
+from z3 import And
+
+import bmc
+import tests
+from cache import ResultCache
+from interp import check_model, compile_program, pinned_values, prescreen
+from peval import partial_eval
+import vectorized
+from wp import (STATS, mk_program_env, parse_PBE, pretty_repr, reset_run, summarize, synthesize, unfold_while,
+                verify)
+from syntax.while_lang import DirectParser, WhileParser, parse, shared_parser
+
+
+def timed(fn, *args, **kwargs):
+    """
+    Call a function and return its result along with the wall-clock seconds it took.
+    """
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def array_init_program(size: int) -> str:
+    """
+    A sketch with a long concrete array initialisation followed by a search loop.
+    """
+    init = ";\n".join(f"arr[{i}] := {3 * i}" for i in range(size))
+    return init + """;
+    index := ??;
+    i := 0;
+    while i < n do (
+        if arr[i] = target then index := i else skip;
+        i := i + ??
+    )
+    """
+
+
+def bench_parse() -> None:
+    """
+    Parse throughput of the While parser on programs of growing size.
+    """
+    parser = shared_parser()
+    for size in [25, 50, 100, 200, 400]:
+        program = array_init_program(size)
+        tokens = list(parser.tokenizer(program))
+        ast, seconds = timed(parse, program)
+        assert ast is not None
+
+        earley = Parser(parser.grammar, tokens)
+        earley.parse()
+        rows = earley.statistics()["rows"]
+        print(f"parse  statements={size:4}  tokens={len(tokens):5}  chart rows={rows:6}  "
+              f"{seconds:7.3f}s  {len(tokens) / seconds:9.0f} tokens/s")
+
+
+def bench_lex() -> None:
+    """
+    Lexing throughput on multi-megabyte programs, streaming with spans versus the plain lexer.
+    """
+    parser = shared_parser()
+    plain = SillyLexer(parser.TOKENS)
+    for size in [10000, 100000]:
+        program = array_init_program(size)
+        for name, lexer in [("silly", plain), ("stream", parser.tokenizer)]:
+            count, seconds = timed(lambda: sum(1 for _ in lexer(program)))
+            print(f"lex    {name:6}  bytes={len(program):8}  tokens={count:7}  "
+                  f"{seconds:7.3f}s  {count / seconds:9.0f} tokens/s")
+
+
+def shape(t) -> list:
+    """
+    The preorder sequence of (root, arity) pairs, which identifies a tree without recursing.
+    """
+    return [(n.root, len(n.subtrees)) for n in t.nodes]
+
+
+def bench_direct() -> None:
+    """
+    Parser construction and parse time of the recursive-descent parser versus the Earley parser.
+    """
+    for name, cls in [("earley", WhileParser), ("direct", DirectParser)]:
+        parser, seconds = timed(cls)
+        print(f"direct {name:6}  construction {seconds:7.3f}s")
+    for size in [25, 100, 200, 400]:
+        program = array_init_program(size)
+        earley, earley_seconds = timed(parse, program)
+        direct, direct_seconds = timed(parse, program, earley=False)
+        assert shape(direct) == shape(earley)
+        print(f"direct statements={size:5}  earley {earley_seconds:7.3f}s  direct {direct_seconds:7.3f}s  "
+              f"speedup {earley_seconds / direct_seconds:6.1f}x")
+
+
+def distinct_nodes(*trees) -> int:
+    """
+    The number of distinct node objects in some trees, counting shared subtrees once.
+    """
+    seen, stack = set(), list(trees)
+    while stack:
+        node = stack.pop()
+        if id(node) not in seen:
+            seen.add(id(node))
+            stack.extend(node.subtrees)
+    return len(seen)
+
+
+UNROLLED_LOOP_PROGRAM = """
+    x := ??;
+    y := 0;
+    i := 0;
+    while i < n do (
+        if a[i] > x then y := y + a[i] else y := y - ??;
+        i := i + 1
+    );
+    assert y >= 0
+"""
+
+
+def bench_hashcons() -> None:
+    """
+    Memory of parsed and unfolded programs with plain and with hash-consed trees, before and
+    after their nodes are annotated with summaries, and the peak memory on the way.
+    Then the memory of the unfoldings of a loop when they are made in one run, which shares
+    their iterations, and when every depth is unfolded in a run of its own.
+    """
+    for size in [100, 400]:
+        program = array_init_program(size)
+        for hashcons in [False, True]:
+            reset_run()
+            tracemalloc.start()
+            ast = parse(program, earley=False, hashcons=hashcons)
+            unfolded = [unfold_while(ast, depth) for depth in range(10)]
+            memory = tracemalloc.get_traced_memory()[0]
+            for tree in unfolded:
+                summarize(tree)
+            annotated, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            nodes = distinct_nodes(*unfolded)
+            print(f"hashcons statements={size:4}  interned={hashcons!s:5}  nodes={nodes:7}  "
+                  f"memory={memory / 1e6:6.2f}MB  annotated={annotated / 1e6:6.2f}MB  peak={peak / 1e6:6.2f}MB")
+
+    ast = parse(UNROLLED_LOOP_PROGRAM)
+    for depths in [10, 40]:
+        for shared in [False, True]:
+            reset_run()
+            tracemalloc.start()
+            unfolded = []
+            for depth in range(depths):
+                if not shared:
+                    reset_run()
+                unfolded.append(unfold_while(ast, depth))
+                summarize(unfolded[-1])
+            annotated = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"hashcons unrolled depths={depths:3}  one run={shared!s:5}  nodes={distinct_nodes(*unfolded):7}  "
+                  f"annotated={annotated / 1e6:6.2f}MB")
+
+
+COMPLEX_PROGRAM = """
+    x := ??;
+    y := ??;
+    z := ??;
+    assert x > y;
+    if x > 5 then
+        z := z + ??
+    else
+        z := z - ??;
+    while x > y do (
+        x := x - ??;
+        assert x > y;
+        if z < 0 then
+            y := y + ??
+        else
+            y := y - ??;
+        assert y >= 0
+    );
+    assert (x = y) or (x = (y - 1))
+"""
+
+IF_2_PROGRAM = """
+    a := 1;
+    (if a = 1 then a := 2 else skip);
+    (if a = 2 then (a := 3; (if a = 4 then a := 5 else skip)) else skip)
+"""
+
+
+def sequential_ifs_program(count: int) -> str:
+    """
+    A chain of `if`s that all update the same variable.
+    """
+    return ";\n".join(f"if x > {i} then y := y + 1 else y := y - 1" for i in range(count))
+
+
+def bench_dag() -> None:
+    """
+    The tree-shaped WP encoding of `if`s versus the encoding that joins the branch states.
+    """
+    true = lambda _: True
+    for dag in [False, True]:
+        _, seconds = timed(synthesize, parse(COMPLEX_PROGRAM), true, [], [], dag=dag)
+        print(f"dag    complex   dag={dag!s:5}  synthesize {seconds:7.3f}s")
+        _, seconds = timed(verify, true, parse(IF_2_PROGRAM), lambda d: d['a'] == 1, true, dag=dag)
+        print(f"dag    if_2      dag={dag!s:5}  verify     {seconds:7.3f}s")
+    for count in [4, 8, 12, 32, 64]:
+        ast = parse(sequential_ifs_program(count))
+        P, Q = lambda d: d['y'] == 0, lambda d: And(d['y'] >= -count, d['y'] <= count)
+        for dag in [False, True] if count <= 12 else [True]:
+            valid, seconds = timed(verify, P, ast, Q, true, dag=dag)
+            assert valid
+            print(f"dag    ifs={count:<4}  dag={dag!s:5}  verify     {seconds:7.3f}s")
+
+
+HARD_SORT_SWAP_PROGRAM = """
+    a[0] := 7;
+    a[1] := 5;
+    a[2] := 13;
+    a[3] := 17;
+    a[??] := a[??];
+    a[??] := a[??];
+    a[??] := a[??];
+    assert (a[0] < a[1]);
+    assert (a[1] < a[2]);
+    assert (a[2] < a[3])
+"""
+
+
+ZEROING_OUT_PROGRAM = """
+    x := ??;
+    y := x;
+    assert x > 2;
+    while x > 0 do (
+        x := x - 1;
+        y := y - ??
+    );
+    assert y = 0
+"""
+
+SEARCH_MODES = [("default", {}), ("cegis", {"cegis": True}), ("incremental", {"incremental": True}),
+                ("portfolio", {"portfolio": True}),
+                ("portfolio2", {"portfolio": True, "solver_configs": [{}, {"smt.random_seed": 1}]})]
+
+
+def bench_modes() -> None:
+    """
+    Synthesis with the single quantified query at every depth versus counterexample-guided search,
+    one solver across depths, and the parallel portfolio of depths with one and two solver configurations.
+    """
+    true = lambda _: True
+    quadratic_pbes = [parse_PBE(i) for i, _ in QUADRATIC_PBES], [parse_PBE(o) for _, o in QUADRATIC_PBES]
+    sketches = [("complex", COMPLEX_PROGRAM, ([], [])), ("zeroing_out", ZEROING_OUT_PROGRAM, ([], [])),
+                ("sort_swap", HARD_SORT_SWAP_PROGRAM, ([], [])), ("quadratic", QUADRATIC_PROGRAM, quadratic_pbes)]
+    for name, program, (ins, outs) in sketches:
+        for mode, options in SEARCH_MODES:
+            with contextlib.redirect_stdout(io.StringIO()):
+                model, seconds = timed(synthesize, parse(program), true, ins, outs, **options)
+            depth = STATS["unfolding_depth"] if model is not None else "-"
+            print(f"modes  {name:11}  {mode:11}  {'found' if model is not None else 'none '}  "
+                  f"depth={depth}  {seconds:7.3f}s", flush=True)
+
+
+def bench_cache() -> None:
+    """
+    Synthesis with a cold and with a warm persistent result cache.
+    """
+    true = lambda _: True
+    with tempfile.TemporaryDirectory() as directory:
+        for name, program in [("complex", COMPLEX_PROGRAM), ("sort_swap", HARD_SORT_SWAP_PROGRAM)]:
+            for run in ["cold", "warm"]:
+                _, seconds = timed(synthesize, parse(program), true, [], [], cache=ResultCache(directory))
+                print(f"cache  {name:9}  {run}  synthesize {seconds:7.3f}s")
+
+
+def bench_server() -> None:
+    """
+    Latency of a small synthesis request in a fresh process versus in the warm server.
+    """
+    job = {"program": "y := x + ??", "pbes": [["x = 1", "y = 3"]]}
+    script = f"import batch; batch.solve_job({job!r})"
+    cold = [timed(subprocess.run, [sys.executable, "-c", script], capture_output=True, check=True)[1]
+            for _ in range(5)]
+    print(f"server cold process  median {statistics.median(cold) * 1000:8.1f}ms")
+
+    server = subprocess.Popen([sys.executable, "server.py", "-j", "1"], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, text=True)
+    warm = []
+    for i in range(20):
+        start = time.perf_counter()
+        server.stdin.write(json.dumps({"jsonrpc": "2.0", "id": i, "method": "synthesize", "params": job}) + "\n")
+        server.stdin.flush()
+        assert json.loads(server.stdout.readline())["result"]["verdict"] == "solved"
+        warm.append(time.perf_counter() - start)
+    server.stdin.close()
+    server.wait()
+    # the first request waits for the worker to warm up
+    print(f"server first request        {warm[0] * 1000:8.1f}ms")
+    print(f"server warm server   median {statistics.median(warm[1:]) * 1000:8.1f}ms")
+
+
+SLOW_TESTS = {"test_binary_search"}
+
+
+def run_test(test, synthesize=None, verify=None) -> tuple[bool, float]:
+    """
+    Run a test of `tests.py`, hiding its output, with its `synthesize` and `verify` calls
+    going to other functions if they are given.
+    """
+    original = tests.synthesize, tests.verify
+    tests.synthesize, tests.verify = synthesize or tests.synthesize, verify or tests.verify
+    try:
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                test()
+            passed = True
+        except AssertionError:
+            passed = False
+        return passed, time.perf_counter() - start
+    finally:
+        tests.synthesize, tests.verify = original
+
+
+def bench_bmc() -> None:
+    """
+    The bounded model checking backend versus the WP backend on the synthesis and verification tests.
+    """
+    totals = Counter()
+    for name in sorted(dir(tests)):
+        test = getattr(tests, name)
+        if not name.startswith("test_") or name in SLOW_TESTS or "verify" not in test.__code__.co_names \
+                and "synthesize" not in test.__code__.co_names:
+            continue
+        # options of the WP backend, such as `cegis`, are dropped for bmc
+        (wp_passed, wp_seconds), (bmc_passed, bmc_seconds) = run_test(test), run_test(
+            test, lambda ast, linv, inputs, outputs, **_: bmc.synthesize(ast, linv, inputs, outputs),
+            lambda P, ast, Q, linv, **_: bmc.verify(P, ast, Q, linv))
+        totals.update(wp=wp_seconds, bmc=bmc_seconds)
+        print(f"bmc    {name:34}  wp {'pass' if wp_passed else 'FAIL'} {wp_seconds:7.3f}s  "
+              f"bmc {'pass' if bmc_passed else 'FAIL'} {bmc_seconds:7.3f}s", flush=True)
+    print(f"bmc    {'total':34}  wp      {totals['wp']:7.3f}s  bmc      {totals['bmc']:7.3f}s")
+
+
+PEVAL_TESTS = ["test_array_access", "test_array_init", "test_array_loop_manipulation", "test_binary_search",
+               "test_hard_sort_swap", "test_sort_swap", "test_simple_initialization"]
+
+
+def concrete_chain_program(length: int) -> str:
+    """
+    A sketch after a long computation on constants.
+    """
+    steps = [f"a := (a * 3) mod 1000" for _ in range(length)]
+    return ";\n".join(["a := 1", *steps, "y := a + ??", "assert y = 0"])
+
+
+CONCRETE_PREFIX_PROGRAMS = {
+    "concrete_loop": "i := 0; s := 0; while i < 8 do (s := s + i; i := i + 1); y := s + ??; assert y = 50",
+    "concrete_chain_150": concrete_chain_program(150),
+    "concrete_chain_300": concrete_chain_program(300),
+    "table_lookup": ";\n".join(f"t[{i}] := {i * i}" for i in range(200)) +
+                    "; y := t[12] + (t[??] * x); assert y = (144 + (49 * x))",
+}
+
+
+def in_fresh_process(fn, *args):
+    """
+    Call a function in a new process and return its result. Whether Z3 solves a query before
+    it times out depends on the queries solved before it in the same process, so comparisons
+    of solver-bound runs are only fair from the same fresh state.
+    """
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def synthesize_quietly(program: str, prepass) -> tuple[bool, float]:
+    """
+    Synthesize the holes of a sketch without PBEs, hiding the progress messages; returns whether
+    it succeeded and the seconds it took.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, seconds = timed(synthesize, parse(program, earley=False), lambda _: True, [], [], prepass=prepass)
+    return model is not None, seconds
+
+
+def bench_peval() -> None:
+    """
+    Synthesis with and without the partial evaluation pre-pass on the array tests, and on
+    sketches whose prefix is concrete: a loop with a constant bound, a long chain of arithmetic,
+    and a table of constants read at a hole. Every run is in a fresh process.
+    """
+    for name in PEVAL_TESTS:
+        test = getattr(tests, name)
+        plain_passed, plain_seconds = in_fresh_process(run_test, test)
+        peval_passed, peval_seconds = in_fresh_process(run_test, test,
+                                                       functools.partial(synthesize, prepass=partial_eval),
+                                                       functools.partial(verify, prepass=partial_eval))
+        print(f"peval  {name:30}  plain {'pass' if plain_passed else 'FAIL'} {plain_seconds:7.3f}s  "
+              f"peval {'pass' if peval_passed else 'FAIL'} {peval_seconds:7.3f}s", flush=True)
+    for name, program in CONCRETE_PREFIX_PROGRAMS.items():
+        (plain_found, plain_seconds), (peval_found, peval_seconds) = [
+            in_fresh_process(synthesize_quietly, program, prepass) for prepass in [None, partial_eval]]
+        assert plain_found and peval_found
+        print(f"peval  {name:30}  plain      {plain_seconds:7.3f}s  peval      {peval_seconds:7.3f}s  "
+              f"speedup {plain_seconds / peval_seconds:5.1f}x", flush=True)
+
+
+TWO_SWAPS_PROGRAM = """
+    a[0] := 7;
+    a[1] := 5;
+    a[2] := 17;
+    a[3] := 13;
+    a[??] := a[??];
+    a[??] := a[??];
+    a[??] := a[??];
+    a[??] := a[??];
+    a[??] := a[??];
+    a[??] := a[??];
+    assert (a[0] < a[1]);
+    assert (a[1] < a[2]);
+    assert (a[2] < a[3])
+"""
+
+
+def bench_scalarize() -> None:
+    """
+    Synthesis of the swap sketches with arrays encoded by the array theory and by scalars.
+    """
+    true = lambda _: True
+    for name, test in [("sort_swap", tests.test_sort_swap), ("array_init", tests.test_array_init),
+                       ("array_access", tests.test_array_access)]:
+        for scalarize in [False, True]:
+            passed, seconds = run_test(test, functools.partial(synthesize, scalarize=scalarize),
+                                       functools.partial(verify, scalarize=scalarize))
+            print(f"scalar {name:14}  scalarize={scalarize!s:5}  {'pass' if passed else 'FAIL'} {seconds:7.3f}s",
+                  flush=True)
+    # `scalarize` is ignored with `cegis`, which is the reference for the quantified query
+    for name, program in [("hard_sort_swap", HARD_SORT_SWAP_PROGRAM), ("two_swaps", TWO_SWAPS_PROGRAM)]:
+        for cegis, scalarize in [(False, False), (False, True), (True, False)]:
+            model, seconds = timed(synthesize, parse(program), true, [], [], cegis=cegis, scalarize=scalarize)
+            print(f"scalar {name:14}  scalarize={scalarize!s:5}  cegis={cegis!s:5}  "
+                  f"{'found' if model is not None else 'none '} {seconds:7.3f}s", flush=True)
+
+
+QUADRATIC_PROGRAM = "y := (((?? * x) * x) + (?? * x)) + ??; assert y > -100"
+QUADRATIC_PBES = [(f"x = {x}", f"y = {2 * x * x - 3 * x + 1}") for x in range(-3, 6)]
+
+
+def bench_interp() -> None:
+    """
+    The concrete interpreter: running a loop, checking a model against PBEs without and with
+    the solver, and counterexample-guided synthesis without and with prescreening.
+    """
+    ast = parse("s := 0; i := 0; while i < n do (s := s + i; i := i + 1)")
+    run, seconds = timed(compile_program, ast, max_iterations=10 ** 6)
+    print(f"interp compile  {seconds * 1000:8.3f}ms")
+    for n in [1000, 100000]:
+        _, seconds = timed(run, {"n": n})
+        print(f"interp run      iterations={n:6}  {seconds:7.3f}s  {n / seconds:9.0f} iterations/s")
+
+    ast = parse(QUADRATIC_PROGRAM)
+    ins, outs = [parse_PBE(i) for i, _ in QUADRATIC_PBES], [parse_PBE(o) for _, o in QUADRATIC_PBES]
+    for screen in [None, prescreen]:
+        model, seconds = timed(synthesize, ast, lambda _: True, ins, outs, cegis=True, prescreen=screen)
+        assert model is not None
+        print(f"interp cegis    prescreen={screen is not None!s:5}  candidates={STATS['cegis_candidates']:3}  "
+              f"prescreened={STATS['cegis_prescreened']:3}  {seconds:7.3f}s")
+
+    full_program = parse(pretty_repr(ast, model))
+    passed, check_seconds = timed(check_model, full_program, {}, ins, outs)
+    assert passed
+    valid, verify_seconds = timed(lambda: all(verify(i, full_program, o, lambda _: True) for i, o in zip(ins, outs)))
+    assert valid
+    print(f"interp check    pbes={len(ins)}  check_model {check_seconds * 1000:8.3f}ms  "
+          f"verify {verify_seconds * 1000:8.3f}ms")
+
+
+def bench_vectorized() -> None:
+    """
+    The vectorized evaluator against the concrete interpreter: running a loop on many states,
+    checking a model against many PBEs, and screening the candidates of counterexample-guided
+    synthesis. Skipped without NumPy.
+    """
+    if vectorized.np is None:
+        print("vectorized      skipped: NumPy is not installed")
+        return
+    ast = parse("s := 0; i := 0; while i < n do (s := s + i; i := i + 1)")
+    run, run_batch = compile_program(ast), vectorized.compile_batch(ast)
+    for count in [1000, 10000]:
+        states = [{"n": n} for n in random.Random(0).choices(range(100), k=count)]
+        _, interp_seconds = timed(lambda: [run(state) for state in states])
+        _, batch_seconds = timed(run_batch, vectorized.Batch.from_states(states))
+        print(f"vectorized run  states={count:5}  interp {interp_seconds * 1000:8.3f}ms  "
+              f"batch {batch_seconds * 1000:8.3f}ms")
+
+    ast = parse(QUADRATIC_PROGRAM)
+    ins, outs = [parse_PBE(i) for i, _ in QUADRATIC_PBES], [parse_PBE(o) for _, o in QUADRATIC_PBES]
+    full_program = parse(pretty_repr(ast, synthesize(ast, lambda _: True, ins, outs, cegis=True)))
+    for count in [1000, 10000]:
+        pbes = [(f"x = {x}", f"y = {2 * x * x - 3 * x + 1}") for x in range(-count // 2, count // 2)]
+        ins, outs = [parse_PBE(i) for i, _ in pbes], [parse_PBE(o) for _, o in pbes]
+        _, model_seconds = timed(check_model, full_program, {}, ins, outs)
+        (passed, _), examples_seconds = timed(vectorized.check_examples, full_program, {}, ins, outs)
+        assert passed.all()
+        # what every candidate costs once the PBEs are read
+        env = mk_program_env(full_program)
+        batch = vectorized.Batch.from_states([pinned_values(i(env)) for i in ins])
+        expectations = vectorized.Expectations(outs, env)
+        _, run_seconds = timed(lambda: expectations.check(vectorized.compile_batch(full_program)(batch)))
+        print(f"vectorized check pbes={count:5}  check_model {model_seconds * 1000:9.3f}ms  "
+              f"check_examples {examples_seconds * 1000:9.3f}ms  run {run_seconds * 1000:7.3f}ms")
+
+    pbes = [(f"x = {x}", f"y = {2 * x * x - 3 * x + 1}") for x in range(-100, 100)]
+    ins, outs = [parse_PBE(i) for i, _ in pbes], [parse_PBE(o) for _, o in pbes]
+    for screen in [None, prescreen, vectorized.prescreen]:
+        model, seconds = timed(synthesize, ast, lambda _: True, ins, outs, cegis=True, prescreen=screen)
+        assert model is not None
+        name = screen and screen.__module__
+        print(f"vectorized cegis pbes={len(ins)}  prescreen={name!s:10}  candidates={STATS['cegis_candidates']:3}  "
+              f"prescreened={STATS['cegis_prescreened']:3}  {seconds:7.3f}s")
+
+
+BENCHMARKS = {
+    "bmc": bench_bmc,
+    "cache": bench_cache,
+    "dag": bench_dag,
+    "direct": bench_direct,
+    "hashcons": bench_hashcons,
+    "interp": bench_interp,
+    "lex": bench_lex,
+    "modes": bench_modes,
+    "parse": bench_parse,
+    "peval": bench_peval,
+    "scalarize": bench_scalarize,
+    "server": bench_server,
+    "vectorized": bench_vectorized,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
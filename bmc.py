@@ -0,0 +1,138 @@
+"""
+A bounded model checking backend with the same `synthesize` / `verify` API as `wp`.
+Loops are unfolded as in `wp`, and the unfolded program is converted to SSA form: every
+assignment and every join after an `if` defines a fresh variable, so the program becomes
+a flat conjunction of per-statement definitions instead of nested substituted terms.
+Loops are only ever unfolded, so the loop invariant is not used.
+"""
+from collections import Counter
+
+from z3 import And, Array, ForAll, Implies, Int, IntSort, Not, ModelRef, If, Store, is_array, sat, unsat
+
+from syntax.tree import Tree
+from wp import (Env, Formula, Invariant, MAX_UNFOLDING, STATS, eval_expr, get_id, hole_name, mk_program_env,
+                mk_solver, report_depth, reset_run, summarize, unfold_to_depth)
+
+
+def ssa(ast: Tree, env: Env) -> tuple[Env, list[Formula], list[Formula], list[Formula]]:
+    """
+    Convert a loop-free program AST to SSA form, starting from the environment of initial values.
+    Returns the environment of final values, the SSA variables, their definitions, and the
+    assertions of the program, each guarded by the condition of the path that reaches it.
+    """
+    variables = []
+    definitions = []
+    assertions = []
+    versions = Counter()
+
+    def fresh(name: str, value: Formula) -> Formula:
+        versions[name] += 1
+        # `!` cannot appear in a program identifier, so SSA names never clash with program variables
+        ssa_name = f"{name}!{versions[name]}"
+        var = Array(ssa_name, IntSort(), IntSort()) if is_array(value) else Int(ssa_name)
+        variables.append(var)
+        definitions.append(var == value)
+        return var
+
+    def run(ast: Tree, env: Env, path: Formula) -> Env:
+        while ast.root == ";":
+            env = run(ast.subtrees[0], env, path)
+            ast = ast.subtrees[1]
+
+        match ast.root, ast.subtrees:
+            case "skip", _:
+                return env
+            case ":=", [x, e]:
+                if x.root == "array":
+                    id = get_id(x.subtrees[0])
+                    value = Store(env[id], eval_expr(x.subtrees[1], env), eval_expr(e, env))
+                else:
+                    id = get_id(x)
+                    if is_array(env[id]):
+                        assert is_array(env[get_id(e)])
+                    value = eval_expr(e, env)
+                return env | {id: fresh(id, value)}
+            case "if", [cond, then_branch, else_branch]:
+                b = eval_expr(cond, env)
+                then_env = run(then_branch, env, And(path, b))
+                else_env = run(else_branch, env, And(path, Not(b)))
+                return {k: v if v.eq(else_env[k]) else fresh(k, If(b, v, else_env[k])) for k, v in then_env.items()}
+            case "assert", [cond]:
+                assertions.append(Implies(path, eval_expr(cond, env)))
+                return env
+            case _:
+                assert False, f"Unknown loop-free command AST node: {ast}"
+
+    final_env = run(ast, env, True)
+    STATS["bmc_definitions"] += len(definitions)
+    return final_env, variables, definitions, assertions
+
+
+def depths(ast: Tree) -> range:
+    """
+    The unfolding depths to search: a program with loops cannot be encoded before it is unfolded.
+    """
+    return range(1 if summarize(ast).loops else 0, MAX_UNFOLDING)
+
+
+def synthesis_formula(ast: Tree, inputs: list[Invariant], outputs: list[Invariant]) -> tuple[list, Formula]:
+    """
+    Build the condition the holes of a loop-free program AST must satisfy, together with
+    the initial and SSA variables it has to hold for.
+    """
+    assert len(inputs) == len(outputs)
+    if not inputs:
+        inputs = [lambda _: True]
+        outputs = [lambda _: True]
+
+    env = mk_program_env(ast)
+    final_env, ssa_vars, definitions, assertions = ssa(ast, env)
+
+    correct = And(assertions)
+    goal = And([Implies(input(env), And(correct, output(final_env))) for input, output in zip(inputs, outputs)])
+    return list(env.values()) + ssa_vars, Implies(And(definitions), goal)
+
+
+def inner_synthesize(ast: Tree, inputs: list[Invariant], outputs: list[Invariant]) -> ModelRef | None:
+    bound_vars, formula = synthesis_formula(ast, inputs, outputs)
+    s = mk_solver()
+    s.add(ForAll(bound_vars, formula))
+    if s.check() == sat:
+        return s.model()
+    return None
+
+
+def synthesize(ast: Tree, linv: Invariant, inputs: list[Invariant], outputs: list[Invariant]) -> ModelRef | None:
+    """
+    Synthesize a model for a program AST node, like `wp.synthesize`.
+    """
+    reset_run()
+    for idx, hole in enumerate(summarize(ast).holes):
+        hole.var = Int(hole_name(idx))
+
+    for depth in depths(ast):
+        model = inner_synthesize(unfold_to_depth(ast, depth), inputs, outputs)
+        if model is not None:
+            report_depth(depth)
+            return model
+
+    return None
+
+
+def inner_verify(P: Invariant, ast: Tree, Q: Invariant) -> bool:
+    env = mk_program_env(ast)
+    final_env, _, definitions, assertions = ssa(ast, env)
+
+    s = mk_solver()
+    s.add(definitions)
+    s.add(P(env))
+    s.add(Not(And(And(assertions), Q(final_env))))
+    return s.check() == unsat
+
+
+def verify(P: Invariant, ast: Tree, Q: Invariant, linv: Invariant) -> bool:
+    """
+    Verify a Hoare triple {P} c {Q}, like `wp.verify`.
+    """
+    reset_run()
+    return any(inner_verify(P, unfold_to_depth(ast, depth), Q) for depth in depths(ast))
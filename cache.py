@@ -0,0 +1,150 @@
+"""
+A persistent cache of synthesis and verification results.
+Entries are JSON files named by the SHA-256 of a canonical key, so the same query asked by
+different runs (or different processes) maps to the same file. Reading an entry touches it,
+and once the cache grows past its size bound the least recently used entries are removed.
+The cache is emptied when it is opened with a different Z3 version than the one that filled it.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+import typing
+
+import z3
+
+CACHE_DIR_VARIABLE = "WHILE_CACHE_DIR"
+MAX_CACHE_BYTES = 64 * 2 ** 20
+# Bump when the encoding of queries changes, so that results of the old encoding are not reused
+CACHE_FORMAT = 1
+VERSION_FILE = "z3-version"
+
+MISS = object()
+
+
+def solver_version() -> str:
+    return z3.get_full_version()
+
+
+class ResultCache:
+    """
+    A directory of cached results, bounded to about `max_bytes` of entries.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None
+        os.makedirs(directory, exist_ok=True)
+        self.check_version()
+
+    @staticmethod
+    def key(*parts: typing.Any) -> str:
+        """
+        The canonical key of a query described by JSON-serializable parts.
+        """
+        text = json.dumps([CACHE_FORMAT, solver_version(), *parts], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def check_version(self) -> None:
+        """
+        Clear the cache if it was filled by another version of the solver.
+        """
+        version_path = os.path.join(self.directory, VERSION_FILE)
+        try:
+            with open(version_path) as f:
+                version = f.read()
+        except FileNotFoundError:
+            version = None
+        if version != solver_version():
+            self.clear()
+            self.write(version_path, solver_version())
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def entries(self) -> typing.Iterator[os.DirEntry]:
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                yield from (entry for entry in os.scandir(shard.path) if entry.name.endswith(".json"))
+
+    def get(self, key: str) -> typing.Any:
+        """
+        Get the value stored for a key, or `MISS`.
+        """
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            self.touch(path)
+        except (FileNotFoundError, ValueError):
+            return MISS
+        return value
+
+    def put(self, key: str, value: typing.Any) -> None:
+        """
+        Store a JSON-serializable value for a key, evicting old entries if the cache is full.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = self.write(path, json.dumps(value))
+        self.touch(path)
+        if self.size is None:
+            self.size = sum(entry.stat().st_size for entry in self.entries())
+        else:
+            self.size += size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def write(self, path: str, text: str) -> int:
+        # Write to a temporary file and rename it, so that concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        return len(text)
+
+    @staticmethod
+    def touch(path: str) -> None:
+        # file system clocks may tick only every few milliseconds, too coarse to order recent uses
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache is back to three quarters of its bound.
+        """
+        entries = sorted(((entry.stat(), entry.path) for entry in self.entries()), key=lambda e: e[0].st_mtime_ns)
+        self.size = sum(stat.st_size for stat, _ in entries)
+        for stat, path in entries:
+            if self.size <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= stat.st_size
+
+    def clear(self) -> None:
+        for entry in list(self.entries()):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self.size = 0
+
+
+_default_caches: dict[str, ResultCache] = {}
+
+
+def default_cache() -> ResultCache | None:
+    """
+    The cache in the directory named by the `WHILE_CACHE_DIR` environment variable, if it is set.
+    """
+    directory = os.environ.get(CACHE_DIR_VARIABLE)
+    if not directory:
+        return None
+    if directory not in _default_caches:
+        _default_caches[directory] = ResultCache(directory)
+    return _default_caches[directory]
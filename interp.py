@@ -0,0 +1,373 @@
+"""
+A concrete interpreter for While programs. A program AST, with the values of its holes, is
+compiled once into nested Python closures, which then run it on concrete states: dicts from
+variable names to integers and, for arrays, to dicts from indices to integers.
+Division follows SMT-LIB, and whatever Z3 leaves unspecified (a division by zero, a cell the
+state does not give) raises `Undefined` rather than picking a value.
+
+Besides running programs, the interpreter checks models against PBEs without a solver call
+(`check_model`) and screens the candidates of counterexample-guided synthesis
+(`synthesize(..., cegis=True, prescreen=prescreen)`): a candidate that fails on a concrete
+state is refuted by that state, instead of by the solver.
+"""
+import collections
+import copy
+import random
+import typing
+
+from z3 import (Ast, BoolVal, IntSort, IntVal, K, ModelRef, Store, is_and, is_array, is_const, is_eq, is_false,
+                is_int_value, is_true, simplify, substitute)
+
+from peval import FOLD
+from syntax.tree import Tree
+from wp import (Env, Formula, Invariant, STATS, get_hole_values, get_holes, get_id, hole_names, mk_program_env,
+                summarize)
+
+MAX_ITERATIONS = 10_000
+SAMPLES = 8
+SAMPLE_RANGE = 10
+
+Value: typing.TypeAlias = int | bool
+State: typing.TypeAlias = dict[str, int | dict[int, int]]
+Expression: typing.TypeAlias = typing.Callable[[State], Value]
+Command: typing.TypeAlias = typing.Callable[[State], None]
+
+
+class Undefined(Exception):
+    """
+    The program reached a value its semantics leaves unspecified.
+    """
+
+
+class AssertionFailed(Exception):
+    """
+    An assertion of the program does not hold.
+    """
+
+
+class IterationLimit(Exception):
+    """
+    A loop ran for more iterations than allowed.
+    """
+
+
+def divide(op: typing.Callable[[int, int], int]) -> typing.Callable[[int, int], int]:
+    def checked(a: int, b: int) -> int:
+        if b == 0:
+            raise Undefined("division by zero")
+        return op(a, b)
+
+    return checked
+
+
+OPERATIONS = FOLD | {"/": divide(FOLD["/"]), "mod": divide(FOLD["mod"])}
+
+
+class Compiler:
+    """
+    Compiles the nodes of a program AST to closures; a subtree shared by several parts of the
+    program, such as an unfolded loop body, is compiled once.
+    """
+
+    def __init__(self, ast: Tree, holes: dict[str, int], max_iterations: int):
+        self.arrays = summarize(ast).array_ids
+        self.holes = holes
+        self.hole_names = hole_names(ast)
+        self.max_iterations = max_iterations
+        self.compiled: dict[int, Expression | Command] = {}
+
+    def hole_value(self, hole: Tree) -> int:
+        name = self.hole_names[id(hole)]
+        if name not in self.holes:
+            raise ValueError(f"no value for the hole {name}")
+        return self.holes[name]
+
+    def expr(self, ast: Tree) -> Expression:
+        if id(ast) not in self.compiled:
+            self.compiled[id(ast)] = self.compile_expr(ast)
+        return self.compiled[id(ast)]
+
+    def command(self, ast: Tree) -> Command:
+        if id(ast) not in self.compiled:
+            self.compiled[id(ast)] = self.compile_command(ast)
+        return self.compiled[id(ast)]
+
+    def compile_expr(self, ast: Tree) -> Expression:
+        match ast.root, ast.subtrees:
+            case "id", _:
+                name = get_id(ast)
+                return lambda state: state[name]
+            case "num", [num_tree]:
+                value = int(num_tree.root)
+                return lambda state: value
+            case "true", _:
+                return lambda state: True
+            case "false", _:
+                return lambda state: False
+            case "hole", _:
+                value = self.hole_value(ast)
+                return lambda state: value
+            case "array", [id, idx]:
+                name, index = get_id(id), self.expr(idx)
+                return lambda state: state[name][index(state)]
+            case "not", [cond]:
+                operand = self.expr(cond)
+                return lambda state: not operand(state)
+            case "and", [l, r]:
+                left, right = self.expr(l), self.expr(r)
+                return lambda state: left(state) and right(state)
+            case "or", [l, r]:
+                left, right = self.expr(l), self.expr(r)
+                return lambda state: left(state) or right(state)
+            case op, [l, r]:
+                left, right, operation = self.expr(l), self.expr(r), OPERATIONS[op]
+                return lambda state: operation(left(state), right(state))
+            case _:
+                assert False, f"Unknown expression AST node: {ast}"
+
+    def compile_command(self, ast: Tree) -> Command:
+        match ast.root, ast.subtrees:
+            case "skip", _:
+                return lambda state: None
+            case ":=", [x, e] if x.root == "array":
+                name, index, value = get_id(x.subtrees[0]), self.expr(x.subtrees[1]), self.expr(e)
+
+                def assign(state: State) -> None:
+                    state[name][index(state)] = value(state)
+
+                return assign
+            case ":=", [x, e]:
+                name = get_id(x)
+                if name in self.arrays:
+                    source = get_id(e)
+
+                    def copy_array(state: State) -> None:
+                        state[name] = copy.copy(state[source])
+
+                    return copy_array
+                value = self.expr(e)
+
+                def assign(state: State) -> None:
+                    state[name] = value(state)
+
+                return assign
+            case ";", _:
+                commands = []
+                while ast.root == ";":
+                    commands.append(self.command(ast.subtrees[0]))
+                    ast = ast.subtrees[1]
+                commands.append(self.command(ast))
+
+                def sequence(state: State) -> None:
+                    for command in commands:
+                        command(state)
+
+                return sequence
+            case "if", [cond, then_branch, else_branch]:
+                test, then_command, else_command = self.expr(cond), self.command(then_branch), self.command(else_branch)
+
+                def branch(state: State) -> None:
+                    if test(state):
+                        then_command(state)
+                    else:
+                        else_command(state)
+
+                return branch
+            case "while", [cond, body]:
+                test, body_command, max_iterations = self.expr(cond), self.command(body), self.max_iterations
+
+                def loop(state: State) -> None:
+                    for _ in range(max_iterations):
+                        if not test(state):
+                            return
+                        body_command(state)
+                    raise IterationLimit(f"more than {max_iterations} iterations")
+
+                return loop
+            case "assert", [cond]:
+                test = self.expr(cond)
+
+                def check(state: State) -> None:
+                    if not test(state):
+                        raise AssertionFailed(f"assertion failed: {cond}")
+
+                return check
+            case _:
+                assert False, f"Unknown command AST node: {ast}"
+
+
+def compile_program(ast: Tree, holes: dict[str, int] | ModelRef | None = None,
+                    max_iterations: int = MAX_ITERATIONS) -> typing.Callable[[State], State]:
+    """
+    Compile a program AST, with the values of its holes given by a model or by a dict from the
+    names of the hole variables, to a function from initial to final states. The function
+    raises `AssertionFailed`, `IterationLimit` (per loop) or `Undefined`; the initial state is
+    not modified.
+    The holes of a program that `synthesize` has not seen are named `__hole_0`, `__hole_1`, ...
+    in preorder, as it would name them. Raises `ValueError` if the dict has no value for a hole.
+    """
+    if isinstance(holes, ModelRef):
+        holes = get_hole_values(holes, get_holes(ast))
+    program = Compiler(ast, holes or {}, max_iterations).command(ast)
+
+    def run(state: State) -> State:
+        state = {name: copy.copy(value) for name, value in state.items()}
+        try:
+            program(state)
+        except KeyError as e:
+            raise Undefined(f"no value for {e}") from None
+        return state
+
+    return run
+
+
+def state_env(state: State, env: Env) -> Env:
+    """
+    The Z3 terms of a concrete state, for the variables of an environment. Array cells the
+    state does not give keep the array of the environment, unless the array has a default.
+    """
+    terms = {}
+    for name, value in env.items():
+        if name not in state:
+            terms[name] = value
+        elif is_array(value):
+            cells = state[name]
+            default = getattr(cells, "default_factory", None)
+            term = value if default is None else K(IntSort(), IntVal(default()))
+            for index, cell in sorted(cells.items()):
+                term = Store(term, index, cell)
+            terms[name] = term
+        else:
+            terms[name] = BoolVal(state[name]) if isinstance(state[name], bool) else IntVal(state[name])
+    return terms
+
+
+def holds(invariant: Invariant, state: State, env: Env) -> bool | None:
+    """
+    Evaluate an invariant on a concrete state, or None if the state does not decide it.
+    """
+    formula = invariant(state_env(state, env))
+    if isinstance(formula, bool):
+        return formula
+    formula = simplify(formula)
+    return True if is_true(formula) else False if is_false(formula) else None
+
+
+def pinned_values(formula: Formula) -> dict[str, int]:
+    """
+    The values a formula fixes the variables to, if it is a conjunction of equalities, such as `x = 1 and y = 2`.
+    """
+    if isinstance(formula, bool):
+        return {}
+    formula = simplify(formula)
+    conjuncts = formula.children() if is_and(formula) else [formula]
+    values = {}
+    for conjunct in conjuncts:
+        if not is_eq(conjunct):
+            continue
+        for var, value in [conjunct.children(), reversed(conjunct.children())]:
+            if is_const(var) and not is_int_value(var) and is_int_value(value):
+                values[str(var)] = value.as_long()
+    return values
+
+
+def pbe_states(ast: Tree, inputs: list[Invariant]) -> list[State]:
+    """
+    A state for every PBE input: the values it fixes, and zeros for the other variables and cells.
+    """
+    env = mk_program_env(ast)
+    states = []
+    for input in inputs:
+        state = {name: collections.defaultdict(int) if is_array(value) else 0 for name, value in env.items()}
+        states.append(state | pinned_values(input(env)))
+    return states
+
+
+def sample_states(ast: Tree, count: int = SAMPLES, seed: int = 0) -> list[State]:
+    """
+    Random small states of a program's variables. Arrays hold random values at the first
+    `SAMPLE_RANGE` indices and zero elsewhere.
+    """
+    rng = random.Random(seed)
+    summary = summarize(ast)
+    states = []
+    for _ in range(count):
+        state: State = {name: rng.randint(-SAMPLE_RANGE, SAMPLE_RANGE) for name in sorted(summary.non_array_ids)}
+        for name in sorted(summary.array_ids):
+            state[name] = collections.defaultdict(int, {i: rng.randint(-SAMPLE_RANGE, SAMPLE_RANGE)
+                                                        for i in range(SAMPLE_RANGE)})
+        states.append(state)
+    return states
+
+
+def check_model(ast: Tree, model: ModelRef | dict[str, int], inputs: list[Invariant], outputs: list[Invariant],
+                max_iterations: int = MAX_ITERATIONS) -> bool | None:
+    """
+    Check the model of a program against PBEs by running it on the values their inputs fix.
+    Returns False if it fails one of them, True if it passes all of them, and None if a run
+    reads a variable its input leaves open or is otherwise undecided.
+    """
+    env = mk_program_env(ast)
+    run = compile_program(ast, model, max_iterations)
+    result = True
+    for input, output in zip(inputs, outputs):
+        try:
+            passed = holds(output, run(pinned_values(input(env))), env)
+        except AssertionFailed:
+            passed = False
+        except (Undefined, IterationLimit):
+            passed = None
+        if passed is False:
+            return False
+        if passed is None:
+            result = None
+    return result
+
+
+Screen: typing.TypeAlias = typing.Callable[[ModelRef], Formula | None]
+
+
+def prescreen(ast: Tree, inputs: list[Invariant], outputs: list[Invariant], free_vars: list[Ast],
+              formula: Formula) -> Screen:
+    """
+    Build a screen for the candidates of counterexample-guided synthesis of a program AST,
+    whose synthesis formula over `free_vars` is `formula`. The screen runs a candidate on the
+    states the PBE inputs fix and on random states, and if it fails on one of them returns the
+    formula at that state, which the candidate violates; otherwise it returns None.
+    """
+    if not inputs:
+        inputs = [lambda _: True]
+        outputs = [lambda _: True]
+    env = mk_program_env(ast)
+    if {str(v) for v in free_vars} != env.keys():
+        # the variables are not the program's (see `wp.mk_search_env`), so states do not map to them
+        return lambda candidate: None
+
+    # every state, with the PBEs whose input it satisfies
+    screened = []
+    for state in pbe_states(ast, inputs) + sample_states(ast):
+        pbes = [output for input, output in zip(inputs, outputs) if holds(input, state, env)]
+        if pbes:
+            screened.append((state, pbes))
+
+    def screen(candidate: ModelRef) -> Formula | None:
+        run = compile_program(ast, candidate)
+        for state, pbes in screened:
+            try:
+                final = run(state)
+                passed = all(holds(output, final, env) is not False for output in pbes)
+            except AssertionFailed:
+                passed = False
+            except (Undefined, IterationLimit):
+                continue
+            if passed:
+                continue
+            terms = state_env(state, env)
+            instance = substitute(formula, *[(v, terms[str(v)]) for v in free_vars])
+            # the interpreter is only trusted as far as the formula agrees with it
+            if is_false(candidate.eval(instance, model_completion=True)):
+                STATS["cegis_prescreened"] += 1
+                return instance
+        return None
+
+    return screen
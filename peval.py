@@ -0,0 +1,299 @@
+"""
+A partial evaluator for While programs, used as a pre-pass of `synthesize` and `verify`
+(`prepass=partial_eval`).
+Constants and the concrete cells of arrays are propagated through the statements that
+compute them, conditions that are known are folded, and only the statements that depend on
+inputs or holes are kept in the residual program. The known values are assigned back where
+the residual program could observe them: before a loop, at the end of a branch whose
+values differ from the other branch's, and at the end of the program.
+The residual program has the same final state as the original for every input and every
+value of the holes, and mentions the same variables, so invariants and PBEs apply to it as is.
+"""
+import operator
+import typing
+
+from syntax.tree import Tree
+from wp import get_id, summarize
+
+Value: typing.TypeAlias = int | bool
+Cell: typing.TypeAlias = tuple[str, int]
+
+
+def smt_div(a: int, b: int) -> int:
+    """
+    Integer division as in SMT-LIB (and Z3): the remainder is never negative.
+    """
+    return (a - smt_mod(a, b)) // b
+
+
+def smt_mod(a: int, b: int) -> int:
+    return a % abs(b)
+
+
+FOLD = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": smt_div,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "=": operator.eq,
+    "mod": smt_mod,
+    "and": lambda a, b: a and b,
+    "or": lambda a, b: a or b,
+}
+
+
+class State:
+    """
+    What is known about the variables at a program point: the values of scalars, the values
+    of array cells, and which of these the residual program has not assigned yet.
+    """
+
+    def __init__(self, values: dict[str, Value] | None = None, cells: dict[str, dict[int, Value]] | None = None,
+                 pending: set[str | Cell] | None = None):
+        self.values = values or {}
+        self.cells = cells or {}
+        self.pending = pending or set()
+
+    def copy(self) -> "State":
+        return State(dict(self.values), {a: dict(c) for a, c in self.cells.items()}, set(self.pending))
+
+    def known(self, var: str | Cell) -> tuple[type, Value] | None:
+        # the type tells `true` from `1`, which Python considers equal
+        if isinstance(var, tuple):
+            value = self.cells.get(var[0], {}).get(var[1])
+        else:
+            value = self.values.get(var)
+        return None if value is None else (type(value), value)
+
+    def forget(self, var: str | Cell) -> None:
+        if isinstance(var, tuple):
+            self.cells.get(var[0], {}).pop(var[1], None)
+        else:
+            self.values.pop(var, None)
+        self.pending.discard(var)
+
+
+class PartialEvaluator:
+    """
+    Builds the residual program of an AST, with nodes of the same class as the AST's.
+    """
+
+    def __init__(self, ast: Tree):
+        self.cls = type(ast)
+        self.arrays = summarize(ast).array_ids
+
+    def constant(self, value: Value) -> Tree:
+        if isinstance(value, bool):
+            name = "true" if value else "false"
+            return self.cls(name, [self.cls(name)])
+        return self.cls("num", [self.cls(value)])
+
+    def residual(self, value: Value | Tree) -> Tree:
+        return value if isinstance(value, Tree) else self.constant(value)
+
+    def rebuild(self, ast: Tree, subtrees: list[Tree]) -> Tree:
+        if all(new is old for new, old in zip(subtrees, ast.subtrees)):
+            return ast
+        return self.cls(ast.root, subtrees)
+
+    def sequence(self, statements: list[Tree]) -> Tree:
+        if not statements:
+            return self.cls("skip", [])
+        block = statements[-1]
+        for statement in reversed(statements[:-1]):
+            block = self.cls(";", [statement, block])
+        return block
+
+    def assignment(self, var: str | Cell, value: Value | Tree) -> Tree:
+        if isinstance(var, tuple):
+            target = self.cls("array", [self.cls("id", [self.cls(var[0])]), self.constant(var[1])])
+        else:
+            target = self.cls("id", [self.cls(var)])
+        return self.cls(":=", [target, self.residual(value)])
+
+    def materialize(self, state: State, out: list[Tree], array: str | None = None,
+                    used: frozenset[str] | None = None) -> None:
+        """
+        Assign the known values the residual program has not assigned yet, or only the cells of
+        an array, or only the variables and arrays in `used`.
+        """
+        pending = [v for v in state.pending
+                   if (array is None or isinstance(v, tuple) and v[0] == array)
+                   and (used is None or (v[0] if isinstance(v, tuple) else v) in used)]
+        for var in sorted(pending, key=lambda v: v if isinstance(v, tuple) else (v, -1)):
+            out.append(self.assignment(var, state.known(var)[1]))
+            state.pending.discard(var)
+
+    def expr(self, ast: Tree, state: State, out: list[Tree]) -> Value | Tree:
+        """
+        Evaluate an expression as far as the state allows: returns its value if it is known,
+        otherwise its residual expression.
+        """
+        match ast.root, ast.subtrees:
+            case "id", _:
+                known = state.known(get_id(ast))
+                return ast if known is None else known[1]
+            case "num", [num_tree]:
+                return int(num_tree.root)
+            case "true", _:
+                return True
+            case "false", _:
+                return False
+            case "hole", _:
+                return ast
+            case "array", [id, idx]:
+                name = get_id(id)
+                index = self.expr(idx, state, out)
+                if isinstance(index, Tree):
+                    # the read may hit any cell, so all of them must be assigned
+                    self.materialize(state, out, name)
+                else:
+                    known = state.known((name, index))
+                    if known is not None:
+                        return known[1]
+                return self.rebuild(ast, [id, self.residual(index)])
+            case "not", [cond]:
+                value = self.expr(cond, state, out)
+                return self.rebuild(ast, [value]) if isinstance(value, Tree) else not value
+            case op, [l, r]:
+                left, right = self.expr(l, state, out), self.expr(r, state, out)
+                if op in ("and", "or"):
+                    for value, other in [(left, right), (right, left)]:
+                        if not isinstance(value, Tree):
+                            # `false and e` is false, `true and e` is e, and dually for `or`
+                            return value if value == (op == "or") else other
+                elif not isinstance(left, Tree) and not isinstance(right, Tree):
+                    if op not in ("/", "mod") or right != 0:
+                        return FOLD[op](left, right)
+                return self.rebuild(ast, [self.residual(left), self.residual(right)])
+            case _:
+                assert False, f"Unknown expression AST node: {ast}"
+
+    def statement(self, ast: Tree, state: State, out: list[Tree]) -> None:
+        """
+        Evaluate a command, appending its residual statements to `out` and updating the state.
+        """
+        while ast.root == ";":
+            self.statement(ast.subtrees[0], state, out)
+            ast = ast.subtrees[1]
+
+        match ast.root, ast.subtrees:
+            case "skip", _:
+                pass
+            case ":=", [x, e]:
+                if x.root == "array":
+                    name = get_id(x.subtrees[0])
+                    index = self.expr(x.subtrees[1], state, out)
+                    value = self.expr(e, state, out)
+                    if isinstance(index, Tree):
+                        self.materialize(state, out, name)
+                        out.append(self.rebuild(ast, [self.rebuild(x, [x.subtrees[0], index]), self.residual(value)]))
+                        state.cells.pop(name, None)
+                        state.pending -= {v for v in state.pending if isinstance(v, tuple) and v[0] == name}
+                    elif isinstance(value, Tree):
+                        out.append(self.rebuild(ast, [self.rebuild(x, [x.subtrees[0], self.constant(index)]), value]))
+                        state.forget((name, index))
+                    else:
+                        state.cells.setdefault(name, {})[index] = value
+                        state.pending.add((name, index))
+                    return
+
+                name = get_id(x)
+                if name in self.arrays:
+                    # an array copied as a whole takes the cells the residual program gave it
+                    self.materialize(state, out, get_id(e))
+                    out.append(ast)
+                    state.cells.pop(name, None)
+                    state.pending -= {v for v in state.pending if isinstance(v, tuple) and v[0] == name}
+                    return
+                value = self.expr(e, state, out)
+                if isinstance(value, Tree):
+                    out.append(self.rebuild(ast, [x, value]))
+                    state.forget(name)
+                else:
+                    state.values[name] = value
+                    state.pending.add(name)
+            case "assert", [cond]:
+                value = self.expr(cond, state, out)
+                if value is not True:
+                    out.append(self.rebuild(ast, [self.residual(value)]))
+            case "if", [cond, then_branch, else_branch]:
+                value = self.expr(cond, state, out)
+                if not isinstance(value, Tree):
+                    self.statement(then_branch if value else else_branch, state, out)
+                    return
+                # the values the branches use are assigned once here rather than copied into both
+                used = summarize(then_branch).ids | summarize(else_branch).ids
+                self.materialize(state, out, used=used)
+                then_state, then_out = state.copy(), []
+                self.statement(then_branch, then_state, then_out)
+                else_state, else_out = state.copy(), []
+                self.statement(else_branch, else_state, else_out)
+                self.join(state, then_state, then_out, else_state, else_out)
+                out.append(self.cls("if", [value, self.sequence(then_out), self.sequence(else_out)]))
+            case "while", [cond, body]:
+                # the invariant may refer to any variable, so all of them are assigned before the loop
+                self.materialize(state, out)
+                writes = summarize(body).writes
+                for name in writes:
+                    state.values.pop(name, None)
+                    state.cells.pop(name, None)
+                body_state, body_out = state.copy(), []
+                self.statement(body, body_state, body_out)
+                self.materialize(body_state, body_out)
+                value = self.expr(cond, state, out)
+                out.append(self.rebuild(ast, [self.residual(value), self.sequence(body_out)]))
+            case _:
+                assert False, f"Unknown command AST node: {ast}"
+
+    def join(self, state: State, then_state: State, then_out: list[Tree],
+             else_state: State, else_out: list[Tree]) -> None:
+        """
+        Merge the states at the end of the branches of an `if` into `state`. A value stays
+        known if both branches agree on it; otherwise the branches that did not assign it yet do.
+        """
+        state.values, state.cells, state.pending = {}, {}, set()
+        scalars = then_state.values.keys() | else_state.values.keys()
+        cells = {(a, i) for s in [then_state, else_state] for a, c in s.cells.items() for i in c}
+        for var in sorted(scalars) + sorted(cells):
+            known = then_state.known(var)
+            agree = known is not None and known == else_state.known(var)
+            then_pending, else_pending = var in then_state.pending, var in else_state.pending
+            if agree and then_pending == else_pending:
+                if then_pending:
+                    state.pending.add(var)
+            else:
+                for branch_state, branch_out, pending in [(then_state, then_out, then_pending),
+                                                          (else_state, else_out, else_pending)]:
+                    if pending:
+                        branch_out.append(self.assignment(var, branch_state.known(var)[1]))
+            if agree:
+                if isinstance(var, tuple):
+                    state.cells.setdefault(var[0], {})[var[1]] = known[1]
+                else:
+                    state.values[var] = known[1]
+
+
+def partial_eval(ast: Tree) -> Tree:
+    """
+    Get the residual program of a program AST.
+    """
+    evaluator = PartialEvaluator(ast)
+    state, out = State(), []
+    evaluator.statement(ast, state, out)
+    evaluator.materialize(state, out)
+
+    residual = evaluator.sequence(out)
+    # a variable whose uses were all folded away is still part of the program's state
+    summary, original = summarize(residual), summarize(ast)
+    kept = [evaluator.assignment((name, 0), evaluator.cls("array", [evaluator.cls("id", [evaluator.cls(name)]),
+                                                                    evaluator.constant(0)]))
+            for name in sorted(original.array_ids - summary.array_ids)]
+    kept += [evaluator.assignment(name, evaluator.cls("id", [evaluator.cls(name)]))
+             for name in sorted(original.non_array_ids - summary.non_array_ids)]
+    return evaluator.sequence(kept + [residual]) if kept else residual
@@ -0,0 +1,364 @@
+"""
+A long-running synthesis service speaking JSON-RPC 2.0, one message per line, over
+stdin/stdout or over a Unix socket.
+
+The server keeps a pool of worker processes that have already imported Z3 and built the
+parser, so a small request is answered in milliseconds instead of paying for a fresh process.
+Methods:
+    synthesize  {"program", "pbes"?, "invariant"?, "options"?, "timeout"?}
+                returns the same object as a job of `batch.py`
+    verify      {"program", "pre"?, "post"?, "invariant"?, "options"?, "timeout"?}
+                returns {"valid": bool}
+    cancel      {"id"}: stop the request with that id, which then fails with REQUEST_CANCELLED
+    shutdown    stop the server once the response is sent
+A request without an id is a notification: it is carried out, but never answered.
+A client that closes its input is still sent the responses to its earlier requests; in
+stdin/stdout mode, the server exits once they are all sent.
+A request running for longer than its `timeout` (or the server default) fails with
+REQUEST_TIMEOUT. A cancelled or timed out request is stopped by killing its worker, together
+with any process it started, and the worker is replaced by a fresh one.
+
+Run with `python server.py [--socket PATH] [-j WORKERS] [--timeout SECONDS]`.
+"""
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import typing
+from multiprocessing.connection import Connection, wait
+
+from batch import is_timeout, kill_process_group, lead_process_group, solve_job
+from syntax.while_lang import parse, shared_parser
+from wp import parse_PBE, verify
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+REQUEST_TIMEOUT = -32001
+REQUEST_CANCELLED = -32800
+
+WORKER_METHODS = frozenset(["synthesize", "verify"])
+NOTIFICATION = object()
+"""
+The id of a request sent without one, which is not answered.
+"""
+WARM_UP_JOB = {"program": "x := ??; assert x = 1"}
+
+
+def verify_request(params: dict) -> dict:
+    """
+    Verify the Hoare triple {pre} program {post}.
+    """
+    ast = parse(params["program"])
+    if ast is None:
+        raise ValueError("invalid program")
+    P, Q, linv = (parse_PBE(params.get(name) or "true") for name in ["pre", "post", "invariant"])
+    if P is None or Q is None or linv is None:
+        raise ValueError("invalid condition")
+    return {"valid": verify(P, ast, Q, linv, **params.get("options", {}))}
+
+
+def run_worker(connection: Connection) -> None:
+    """
+    The body of a worker process: answer (method, params) messages until the connection closes.
+    Results are sent as ("result", value) and failures as ("error", (code, message)).
+    """
+    lead_process_group()
+    # progress messages must not reach the stdout of the server, which may be its channel
+    sys.stdout = open(os.devnull, "w")
+    shared_parser()
+    solve_job(WARM_UP_JOB)
+    connection.send(("ready", None))
+    while True:
+        try:
+            method, params = connection.recv()
+        except EOFError:
+            return
+        try:
+            if method == "synthesize":
+                connection.send(("result", solve_job(params)))
+            else:
+                connection.send(("result", verify_request(params)))
+        except (KeyError, TypeError, ValueError) as e:
+            connection.send(("error", (INVALID_PARAMS, f"{type(e).__name__}: {e}")))
+        except Exception as e:
+            connection.send(("error", (INTERNAL_ERROR, f"{type(e).__name__}: {e}")))
+
+
+class Worker:
+    """
+    A worker process and the connection to it.
+    """
+
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        # not a daemon, so that a portfolio search can start its own workers; the server kills it
+        self.process = context.Process(target=run_worker, args=(child_connection,))
+        self.process.start()
+        child_connection.close()
+        # the worker announces itself once it is warm
+        self.ready = False
+
+    def kill(self) -> None:
+        kill_process_group(self.process)
+        self.connection.close()
+
+
+class Request(typing.NamedTuple):
+    client: int
+    id: typing.Any
+    method: str
+    params: dict
+    deadline: float | None
+
+
+class Server:
+    """
+    Dispatches requests from any number of clients to a pool of warm workers.
+    Clients are output streams; their messages arrive through `inbox` as (client, line)
+    pairs, and a None line means the client has no more to send. Such a client is kept in
+    `closing` until its queued and running requests are answered.
+    """
+
+    def __init__(self, workers: int | None = None, timeout: float | None = None):
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            self.context.set_forkserver_preload(["wp", "batch"])
+        self.timeout = timeout
+        self.inbox, self.sender = multiprocessing.Pipe(duplex=False)
+        self.send_lock = threading.Lock()
+        self.clients: dict[int, typing.TextIO] = {}
+        self.closing: set[int] = set()
+        self.queue: collections.deque[Request] = collections.deque()
+        self.busy: dict[Connection, tuple[Worker, Request]] = {}
+        self.workers = [Worker(self.context) for _ in range(workers or os.cpu_count())]
+        self.running = True
+
+    def post(self, client: int, line: str | None) -> None:
+        """
+        Hand a line received from a client to the server loop (called from reader threads).
+        """
+        with self.send_lock:
+            self.sender.send((client, line))
+
+    def add_client(self, client: int, stream: typing.TextIO, output: typing.TextIO) -> threading.Thread:
+        """
+        Start reading the messages of a client from `stream`; responses are written to `output`.
+        """
+        self.clients[client] = output
+
+        def read() -> None:
+            try:
+                for line in stream:
+                    self.post(client, line)
+            except (OSError, ValueError):
+                pass
+            self.post(client, None)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        return reader
+
+    def respond(self, client: int, id: typing.Any, result: typing.Any = None,
+                error: tuple[int, str] | None = None) -> None:
+        output = self.clients.get(client)
+        if output is None or id is NOTIFICATION:
+            return
+        message = {"jsonrpc": "2.0", "id": id}
+        if error is None:
+            message["result"] = result
+        else:
+            message["error"] = {"code": error[0], "message": error[1]}
+        try:
+            output.write(json.dumps(message) + "\n")
+            output.flush()
+        except (OSError, ValueError):
+            self.clients.pop(client, None)
+
+    def receive(self, client: int, line: str) -> None:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            self.respond(client, None, error=(PARSE_ERROR, "invalid JSON"))
+            return
+        if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+            self.respond(client, None, error=(INVALID_REQUEST, "not a JSON-RPC request"))
+            return
+
+        id, method, params = message.get("id", NOTIFICATION), message["method"], message.get("params") or {}
+        if not isinstance(params, dict):
+            self.respond(client, id, error=(INVALID_PARAMS, "params must be an object"))
+        elif method in WORKER_METHODS:
+            if "timeout" in params and (params["timeout"] is None or not is_timeout(params["timeout"])):
+                self.respond(client, id, error=(INVALID_PARAMS, "timeout must be a non-negative number"))
+                return
+            timeout = params.pop("timeout", self.timeout)
+            deadline = None if timeout is None else time.perf_counter() + timeout
+            self.queue.append(Request(client, id, method, params, deadline))
+        elif method == "cancel":
+            self.respond(client, id, self.stop(lambda r: r.client == client and r.id == params.get("id"),
+                                               (REQUEST_CANCELLED, "request cancelled")))
+        elif method == "shutdown":
+            self.respond(client, id, True)
+            self.running = False
+        else:
+            self.respond(client, id, error=(METHOD_NOT_FOUND, f"unknown method {method!r}"))
+
+    def stop(self, matches: typing.Callable[[Request], bool], error: tuple[int, str]) -> bool:
+        """
+        Fail the queued and running requests that match, replacing the workers running them.
+        Returns whether there was any.
+        """
+        stopped = [r for r in self.queue if matches(r)]
+        for request in stopped:
+            self.queue.remove(request)
+        for connection, (worker, request) in list(self.busy.items()):
+            if matches(request):
+                del self.busy[connection]
+                worker.kill()
+                self.workers.remove(worker)
+                self.workers.append(Worker(self.context))
+                stopped.append(request)
+        for request in stopped:
+            self.respond(request.client, request.id, error=error)
+            self.release(request.client)
+        return bool(stopped)
+
+    def pending(self, client: int) -> bool:
+        """
+        Whether a client has requests that are queued or running.
+        """
+        return any(r.client == client for r in self.queue) or any(r.client == client for _, r in self.busy.values())
+
+    def release(self, client: int) -> None:
+        """
+        Forget a closing client once all its requests are answered.
+        """
+        if client in self.closing and not self.pending(client):
+            self.closing.discard(client)
+            self.clients.pop(client, None)
+
+    def dispatch(self) -> None:
+        idle = [w for w in self.workers if w.ready and w.connection not in self.busy]
+        while self.queue and idle:
+            worker, request = idle.pop(), self.queue.popleft()
+            worker.connection.send((request.method, request.params))
+            self.busy[worker.connection] = (worker, request)
+
+    def serve(self) -> None:
+        """
+        Answer requests until a shutdown request, or until every client is gone.
+        """
+        try:
+            while self.running and (self.clients or self.queue or self.busy):
+                self.dispatch()
+                deadlines = [r.deadline for r in self.queue if r.deadline is not None]
+                deadlines += [r.deadline for _, r in self.busy.values() if r.deadline is not None]
+                wait_seconds = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+                connections = [self.inbox] + [w.connection for w in self.workers]
+                for connection in wait(connections, wait_seconds):
+                    if connection is self.inbox:
+                        client, line = self.inbox.recv()
+                        if line is None:
+                            self.closing.add(client)
+                            self.release(client)
+                        elif line.strip():
+                            self.receive(client, line)
+                    else:
+                        self.answer(connection)
+
+                now = time.perf_counter()
+                self.stop(lambda r: r.deadline is not None and r.deadline <= now,
+                          (REQUEST_TIMEOUT, "request timed out"))
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Kill the workers, which are not daemons and would otherwise keep the server from exiting.
+        """
+        for worker in self.workers:
+            worker.kill()
+
+    def answer(self, connection: Connection) -> None:
+        worker = next(w for w in self.workers if w.connection is connection)
+        try:
+            kind, value = connection.recv()
+        except EOFError:
+            # the worker died, so is replaced; its request (if any) fails
+            self.workers.remove(worker)
+            self.workers.append(Worker(self.context))
+            worker.kill()
+            _, request = self.busy.pop(connection, (None, None))
+            if request is not None:
+                self.respond(request.client, request.id,
+                             error=(INTERNAL_ERROR, f"worker exited with code {worker.process.exitcode}"))
+                self.release(request.client)
+            return
+        if kind == "ready":
+            worker.ready = True
+            return
+        _, request = self.busy.pop(connection)
+        if kind == "result":
+            self.respond(request.client, request.id, value)
+        else:
+            self.respond(request.client, request.id, error=tuple(value))
+        self.release(request.client)
+
+
+def serve_socket(server: Server, path: str) -> None:
+    """
+    Accept clients on a Unix socket, each speaking JSON-RPC over its connection.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+
+    def accept() -> None:
+        for client in itertools.count(1):
+            connection, _ = listener.accept()
+            # the reader thread and the server loop use the connection at the same time, and a
+            # file object is not safe to share between threads, so each gets its own
+            server.add_client(client, connection.makefile("r"), connection.makefile("w"))
+
+    # client 0 keeps the server alive while waiting for connections
+    server.clients[0] = open(os.devnull, "w")
+    threading.Thread(target=accept, daemon=True).start()
+    try:
+        server.serve()
+    finally:
+        listener.close()
+        os.remove(path)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve synthesis and verification requests over JSON-RPC.")
+    parser.add_argument("--socket", help="listen on this Unix socket instead of stdin/stdout")
+    parser.add_argument("-j", "--workers", type=int, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--timeout", type=float, help="default seconds per request")
+    args = parser.parse_args(argv)
+
+    server = Server(args.workers, args.timeout)
+    try:
+        if args.socket:
+            serve_socket(server, args.socket)
+        else:
+            server.add_client(0, sys.stdin, sys.stdout)
+            server.serve()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from functools import reduce
 
 from syntax.tree import Tree
 from syntax.parsing.earley.earley import Grammar, Parser, ParseTrees
+from syntax.parsing.lazy import Lazy
 from syntax.parsing.silly import SillyLexer
 
 
@@ -27,7 +28,7 @@ class LambdaParser:
 
     def __init__(self) -> None:
         self.tokenizer = SillyLexer(self.TOKENS)
-        self.grammar = Grammar.from_string(self.GRAMMAR)
+        self.grammar = Grammar.from_string(self.GRAMMAR).compile()
 
     def __call__(self, program_text: str) -> typing.Optional[Tree]:
         tokens = list(self.tokenizer(program_text))
@@ -36,9 +37,8 @@ class LambdaParser:
         earley.parse()
 
         if earley.is_valid_sentence():
-            trees = ParseTrees(earley)
-            assert len(trees) == 1
-            return self.postprocess(trees.nodes[0])
+            assert len(earley.complete_parses) == 1
+            return self.postprocess(ParseTrees(earley).first())
         else:
             return None
 
@@ -58,9 +58,11 @@ class LambdaParser:
         return Tree(t.root, [self.postprocess(s) for s in t.subtrees])
 
 
+shared_parser = Lazy(LambdaParser)
+
+
 def parse(program_text: str) -> typing.Optional[Tree]:
-    parser = LambdaParser()
-    return parser(program_text)
+    return shared_parser()(program_text)
 
 
 def pretty(expr: Tree) -> str:
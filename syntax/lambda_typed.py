@@ -3,6 +3,7 @@ from functools import reduce
 
 from syntax.tree import Tree
 from syntax.parsing.earley.earley import Grammar, Parser, ParseTrees
+from syntax.parsing.lazy import Lazy
 from syntax.parsing.silly import SillyLexer
 
 __all__ = ["parse", "parse_type", "pretty"]
@@ -32,7 +33,7 @@ class LambdaParser:
 
     def __init__(self) -> None:
         self.tokenizer = SillyLexer(self.TOKENS)
-        self.grammar = Grammar.from_string(self.GRAMMAR)
+        self.grammar = Grammar.from_string(self.GRAMMAR).compile()
 
     def __call__(self, program_text: str) -> typing.Optional[Tree]:
         tokens = list(self.tokenizer(program_text))
@@ -41,9 +42,8 @@ class LambdaParser:
         earley.parse()
 
         if earley.is_valid_sentence():
-            trees = ParseTrees(earley)
-            assert len(trees) == 1
-            return self.postprocess(trees.nodes[0])
+            assert len(earley.complete_parses) == 1
+            return self.postprocess(ParseTrees(earley).first())
         else:
             return None
 
@@ -78,13 +78,16 @@ class LambdaParser:
         return Tree(t.root, [self.postprocess(s) for s in t.subtrees])
 
 
+shared_parser = Lazy(LambdaParser)
+
+
 def parse(program_text: str) -> Tree:
-    return LambdaParser()(program_text)
+    return shared_parser()(program_text)
 
 
 def parse_type(type_text: str) -> Tree:
     program_text = rf"\x: {type_text}. x"
-    return LambdaParser()(program_text).subtrees[0].subtrees[1]
+    return shared_parser()(program_text).subtrees[0].subtrees[1]
 
 
 def pretty(expr: Tree) -> str:
@@ -1,7 +1,17 @@
 class Chart:
     def __init__(self, rows):
-        """An Earley chart is a list of rows for every input word"""
-        self.rows = rows
+        """An Earley chart is a list of rows for every input word,
+        indexed by (rule, dot, start) for duplicate detection"""
+        self.rows = []
+        self.index = {}
+        # rows by the category after their dot, for completion
+        self.waiting = {}
+        # categories already predicted in this chart
+        self.predicted = set()
+        # categories completed without consuming input, by their completing row
+        self.empty = {}
+        for row in rows:
+            self.add_row(row)
 
     def __len__(self):
         """Chart length"""
@@ -15,12 +25,20 @@ class Chart:
         return st
 
     def add_row(self, row):
-        """Add a row to chart, only if wasn't already there"""
-        if row not in self.rows:
-            self.rows.append(row)
+        """Add a row to chart, only if wasn't already there.
+        Returns whether the row was added"""
+        key = row.key()
+        if key in self.index:
+            self.index[key].add_derivation(row.previous, row.completing)
+            return False
+        self.index[key] = row
+        self.rows.append(row)
+        return True
 
 
 class ChartRow:
+    __slots__ = ("rule", "dot", "start", "completing", "previous", "alternatives")
+
     def __init__(self, rule, dot=0, start=0, previous=None, completing=None):
         """Initialize a chart row, consisting of a rule, a position
         index inside the rule, index of starting chart and
@@ -30,6 +48,8 @@ class ChartRow:
         self.start = start
         self.completing = completing
         self.previous = previous
+        # other (previous, completing) pairs deriving the same row
+        self.alternatives = None
 
     def __len__(self):
         """A chart's length is its rule's length"""
@@ -47,12 +67,31 @@ class ChartRow:
 
     def __eq__(self, other):
         """Two rows are equal if they share the same rule, start and dot"""
-        if len(self) == len(other):
-            if self.dot == other.dot:
-                if self.start == other.start:
-                    if self.rule == other.rule:
-                        return True
-        return False
+        if not isinstance(other, ChartRow):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def key(self):
+        """The identity of a row within a chart"""
+        return self.rule, self.dot, self.start
+
+    def add_derivation(self, previous, completing):
+        """Record another way of deriving this row, making it a packed node"""
+        for p, c in self.derivations():
+            if p is previous and c is completing:
+                return
+        if self.alternatives is None:
+            self.alternatives = []
+        self.alternatives.append((previous, completing))
+
+    def derivations(self):
+        """All (previous, completing) pairs deriving this row, the first one first"""
+        yield self.previous, self.completing
+        if self.alternatives:
+            yield from self.alternatives
 
     def is_complete(self):
         """Returns true if rule was completely parsed, i.e. the dot is at the end"""
@@ -2,10 +2,14 @@ import sys
 
 
 class Rule:
+    __slots__ = ("lhs", "rhs", "index", "_hash")
+
     def __init__(self, lhs, rhs):
         """Initializes grammar rule: LHS -> [RHS]"""
         self.lhs = lhs
-        self.rhs = rhs
+        self.rhs = tuple(rhs)
+        self.index = None
+        self._hash = hash((self.lhs, self.rhs))
 
     def __len__(self):
         """A rule's length is its RHS's length"""
@@ -21,10 +25,12 @@ class Rule:
 
     def __eq__(self, other):
         """Rules are equal iff both their sides are equal"""
-        if self.lhs == other.lhs:
-            if self.rhs == other.rhs:
-                return True
-        return False
+        if not isinstance(other, Rule):
+            return NotImplemented
+        return self is other or (self.lhs == other.lhs and self.rhs == other.rhs)
+
+    def __hash__(self):
+        return self._hash
 
 
 class Grammar:
@@ -32,6 +38,11 @@ class Grammar:
         """A grammar is a collection of rules, sorted by LHS"""
         self.rules = {}
         self.start_symbol = None
+        self.nonterminals = frozenset()
+        # filled in by compile()
+        self.nullable = None
+        self.first = None
+        self.rule_first = None
 
     def __repr__(self):
         """Nice string representation"""
@@ -44,10 +55,7 @@ class Grammar:
 
     def __getitem__(self, lhs):
         """Return rules for a given LHS"""
-        if lhs in self.rules:
-            return self.rules[lhs]
-        else:
-            return None
+        return self.rules.get(lhs)
 
     def add_rule(self, rule):
         """Add a rule to the grammar"""
@@ -60,6 +68,51 @@ class Grammar:
         if self.start_symbol is None:
             self.start_symbol = lhs
 
+        self.first = None
+
+    def is_compiled(self):
+        """Whether compile() was called since the last rule was added"""
+        return self.first is not None
+
+    def compile(self):
+        """Prepare the grammar for repeated parsing: number the rules,
+        collect the nonterminals and compute the nullable nonterminals
+        and the FIRST set of every symbol and rule. Returns the grammar itself."""
+        self.nonterminals = frozenset(self.rules)
+        rules = [rule for group in self.rules.values() for rule in group]
+        for index, rule in enumerate(rules):
+            rule.index = index
+
+        self.nullable = set()
+        self.first = {lhs: set() for lhs in self.nonterminals}
+        changed = True
+        while changed:
+            changed = False
+            for rule in rules:
+                first, nullable = self.first_of(rule.rhs)
+                if not first <= self.first[rule.lhs]:
+                    self.first[rule.lhs] |= first
+                    changed = True
+                if nullable and rule.lhs not in self.nullable:
+                    self.nullable.add(rule.lhs)
+                    changed = True
+
+        self.rule_first = [self.first_of(rule.rhs) for rule in rules]
+        return self
+
+    def first_of(self, symbols):
+        """Returns the terminals that can start a derivation of a sequence
+        of symbols, and whether the sequence can derive the empty string"""
+        first = set()
+        for symbol in symbols:
+            if symbol not in self.nonterminals:
+                first.add(symbol)
+                return first, False
+            first |= self.first[symbol]
+            if symbol not in self.nullable:
+                return first, False
+        return first, True
+
     @staticmethod
     def from_file(filename):
         """Returns a Grammar instance created from a text file."""
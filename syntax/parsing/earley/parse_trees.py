@@ -1,50 +1,125 @@
+import math
+
 from syntax.tree import Tree
 
 
 class ParseTrees:
     def __init__(self, parser):
-        """Initialize a syntax tree parsing process"""
+        """Initialize a view of the parse trees of a parser's charts.
+        The completed chart rows form a shared packed parse forest: every row
+        stands for one rule over one span of the input, and lists all the
+        (previous, completing) row pairs deriving it. Trees are only built
+        when asked for."""
         self.parser = parser
         self.charts = parser.charts
         self.length = len(parser)
-
-        self.nodes = []
-        for root in parser.complete_parses:
-            self.nodes.extend(self.build_nodes(root))
+        self.roots = parser.complete_parses
+        self._counts = {}
 
     def __len__(self):
         """Trees count"""
-        return len(self.nodes)
+        return self.count()
+
+    def __iter__(self):
+        """All the parse trees, the one returned by first() first"""
+        for root in self.roots:
+            yield from self._trees(root)
+
+    @property
+    def nodes(self):
+        return list(self)
 
     def __repr__(self):
         """String representation of a list of trees with indexes"""
         return "<Parse Trees>\n{0}</Parse Trees>".format(
             "\n".join(
-                "Parse tree #{0}:\n{1}\n\n".format(i + 1, str(self.nodes[i]))
-                for i in range(len(self))
+                "Parse tree #{0}:\n{1}\n\n".format(i + 1, str(tree))
+                for i, tree in enumerate(self)
             )
         )
 
-    def build_nodes(self, root):
-        """Recursively create subtree for given parse chart row"""
-        # find subtrees of current symbol
-        if root.completing:
-            down = self.build_nodes(root.completing)
-        elif root.dot > 0:
-            down = [Tree(root.prev_category())]
-        else:
-            down = []
-
-        # prepend subtrees of previous symbols
-        prev = root.previous
-        left = []
-        if prev:
-            left[:0] = [x.subtrees for x in self.build_nodes(prev)]
-            prev = prev.previous
-        else:
-            left = [[]]
-
-        for x in left:
-            x.extend(down)
-
-        return [Tree(root.rule.lhs, subtrees) for subtrees in left]
+    def count(self):
+        """Number of distinct parse trees, computed without building them"""
+        return sum(self._count(root) for root in self.roots)
+
+    def first(self):
+        """Build the first parse tree only; each row contributes its first derivation"""
+        if not self.roots:
+            return None
+
+        trees = {}
+        stack = [self.roots[0]]
+        while stack:
+            row = stack[-1]
+            if id(row) in trees:
+                stack.pop()
+                continue
+            steps = self._steps(row)
+            pending = [r.completing for r in steps if r.completing is not None and id(r.completing) not in trees]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            subtrees = []
+            for r in steps:
+                if r.completing is not None:
+                    subtrees.append(trees[id(r.completing)])
+                elif r.dot > 0:
+                    subtrees.append(Tree(r.prev_category()))
+            trees[id(row)] = Tree(row.rule.lhs, subtrees)
+        return trees[id(self.roots[0])]
+
+    @staticmethod
+    def _steps(row):
+        """The rows along the first derivation of a row's RHS, left to right"""
+        steps = []
+        while row is not None:
+            steps.append(row)
+            row = row.previous
+        steps.reverse()
+        return steps
+
+    def _count(self, root):
+        """Number of derivations of a row; rows reachable from themselves have infinitely many"""
+        IN_PROGRESS = None
+        counts = self._counts
+        stack = [root]
+        while stack:
+            row = stack[-1]
+            if id(row) in counts and counts[id(row)] is not IN_PROGRESS:
+                stack.pop()
+                continue
+            counts[id(row)] = IN_PROGRESS
+            children = [r for pair in row.derivations() for r in pair if r is not None]
+            pending = [r for r in children if id(r) not in counts]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            total = 0
+            for previous, completing in row.derivations():
+                n = 1
+                for r in (previous, completing):
+                    if r is not None:
+                        c = counts[id(r)]
+                        n *= math.inf if c is IN_PROGRESS else c
+                total += n
+            counts[id(row)] = total
+        return counts[id(root)]
+
+    def _trees(self, row):
+        """Generate all subtrees for given parse chart row"""
+        for subtrees in self._subtree_lists(row):
+            yield Tree(row.rule.lhs, subtrees)
+
+    def _subtree_lists(self, row):
+        for previous, completing in row.derivations():
+            lefts = self._subtree_lists(previous) if previous is not None else [[]]
+            for left in lefts:
+                if completing is not None:
+                    for down in self._trees(completing):
+                        yield left + [down]
+                elif row.dot > 0:
+                    yield left + [Tree(row.prev_category())]
+                else:
+                    yield left
@@ -8,15 +8,23 @@ class Parser:
 
     def __init__(self, grammar, sentence, debug=False):
         """Initialize parser with grammar and sentence"""
+        if not grammar.is_compiled():
+            grammar.compile()
         self.grammar = grammar
-        self.sentence = (
-            sentence if isinstance(sentence, Sentence) else Sentence(sentence)
-        )
+        if isinstance(sentence, Sentence):
+            self.sentence, self.stream = sentence, None
+        elif isinstance(sentence, list):
+            self.sentence, self.stream = Sentence(sentence), None
+        else:
+            # any other iterable is read lazily, one word ahead of the parse
+            self.sentence, self.stream = Sentence([]), iter(sentence)
         self.debug = debug
 
         # prepare a chart for every input word
         self.charts = [Chart([]) for _ in range(len(self) + 1)]
         self.complete_parses = []
+        # predictions skipped because they cannot start with the next word
+        self.filtered = 0
 
     def __len__(self):
         """Length of input sentence"""
@@ -29,6 +37,17 @@ class Parser:
         )
         self.charts[0].add_row(row)
 
+    def read_word(self, position):
+        """Make sure the word at a given position has been read from the
+        input stream, adding a chart for every word read"""
+        while self.stream is not None and len(self) <= position:
+            word = next(self.stream, None)
+            if word is None:
+                self.stream = None
+            else:
+                self.sentence.add_word(word)
+                self.charts.append(Chart([]))
+
     def prescan(self, chart, position):
         """Scan current word in sentence, and add appropriate
         grammar categories to current chart"""
@@ -38,49 +57,67 @@ class Parser:
             for rule in rules:
                 chart.add_row(ChartRow(rule, 1, position - 1))
 
-    def predict(self, chart, position):
+    def predict(self, chart, position, row):
         """Predict next parse by looking up grammar rules
-        for pending categories in current chart"""
-        for row in chart.rows:
-            next_cat = row.next_category()
-            rules = self.grammar[next_cat]
-            if rules:
-                for rule in rules:
-                    new = ChartRow(rule, 0, position)
-                    chart.add_row(new)
-
-    def complete(self, chart, position):
+        for the category pending in a row, once per category and chart"""
+        next_cat = row.next_category()
+        chart.waiting.setdefault(next_cat, []).append(row)
+
+        if next_cat in chart.empty:
+            # the category was already completed here without consuming input
+            chart.add_row(ChartRow(row.rule, row.dot + 1, row.start, row, chart.empty[next_cat]))
+
+        if next_cat in chart.predicted:
+            return
+        chart.predicted.add(next_cat)
+        rules = self.grammar[next_cat]
+        if rules:
+            # only predict rules that can derive the empty string
+            # or start with a category of the next word
+            word = self.sentence[position]
+            lookahead = word.tags if word else ()
+            for rule in rules:
+                first, nullable = self.grammar.rule_first[rule.index]
+                if nullable or any(tag in first for tag in lookahead):
+                    chart.add_row(ChartRow(rule, 0, position))
+                else:
+                    self.filtered += 1
+
+    def complete(self, chart, position, row):
         """Complete a rule that was done parsing, and
-        promote previously pending rules"""
-        for row in chart.rows:
-            if row.is_complete():
-                completed = row.rule.lhs
-                for r in self.charts[row.start].rows:
-                    if completed == r.next_category():
-                        new = ChartRow(r.rule, r.dot + 1, r.start, r, row)
-                        chart.add_row(new)
+        promote the rows waiting for it in its starting chart"""
+        completed = row.rule.lhs
+        if row.start == position:
+            chart.empty.setdefault(completed, row)
+        for r in self.charts[row.start].waiting.get(completed, ()):
+            chart.add_row(ChartRow(r.rule, r.dot + 1, r.start, r, row))
 
     def parse(self):
         """Main Earley's Parser loop"""
         self.init_first_chart()
 
+        # we go word by word; the charts list grows as words are read
         i = 0
-        # we go word by word
         while i < len(self.charts):
+            self.read_word(i)  # the next word is needed for lookahead
             chart = self.charts[i]
             self.prescan(chart, i)  # scan current input
-
-            # predict & complete loop
-            # rinse & repeat until chart stops changing
-            length = len(chart)
-            old_length = -1
-            while old_length != length:
-                self.predict(chart, i)
-                self.complete(chart, i)
-
-                old_length = length
-                length = len(chart)
-
+            if i > 0 and not chart.rows:
+                # no parse can go on from here, so leave the rest of the input unread
+                self.stream = None
+                self.charts = self.charts[:i]
+                break
+
+            # every row is predicted or completed exactly once,
+            # including the rows added while processing the chart
+            j = 0
+            while j < len(chart):
+                row = chart.rows[j]
+                if row.is_complete():
+                    self.complete(chart, i, row)
+                else:
+                    self.predict(chart, i, row)
+                j += 1
             i += 1
 
         # finally, print charts for debuggers
@@ -91,9 +128,21 @@ class Parser:
                 print(self.charts[i])
                 print("-------------------------".format(i))
 
+    def statistics(self):
+        """Chart sizes of the last parse"""
+        sizes = [len(chart) for chart in self.charts]
+        return {
+            "charts": len(sizes),
+            "rows": sum(sizes),
+            "max_chart_rows": max(sizes),
+            "filtered_predictions": self.filtered,
+        }
+
     def is_valid_sentence(self):
         """Returns true if sentence has a complete parse tree"""
         res = False
+        if len(self.charts) <= len(self):
+            return res  # the parse stopped before the end of the sentence
         for row in self.charts[-1].rows:
             if row.start == 0:
                 if row.rule.lhs == self.GAMMA_SYMBOL:
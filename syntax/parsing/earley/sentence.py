@@ -2,10 +2,12 @@ import re
 
 
 class Word:
-    def __init__(self, word="", tags=()):
-        """Initialize a word with a list of tags"""
+    def __init__(self, word="", tags=(), span=None):
+        """Initialize a word with a list of tags, and optionally the
+        ((line, column), (end line, end column)) span it was read from"""
         self.word = word
         self.tags = tags or []
+        self.span = span
 
     def __repr__(self):
         """Nice string representation"""
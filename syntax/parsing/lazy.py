@@ -0,0 +1,22 @@
+import threading
+
+
+class Lazy:
+    """
+    A value that is built on first use, and only once even if several threads
+    ask for it at the same time.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.built = False
+        self.value = None
+
+    def __call__(self):
+        if not self.built:
+            with self.lock:
+                if not self.built:
+                    self.value = self.factory()
+                    self.built = True
+        return self.value
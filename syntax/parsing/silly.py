@@ -1,6 +1,12 @@
 import re
 from typing import Iterable
 
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
 from syntax.tree import Tree
 from syntax.parsing.earley.sentence import Word
 
@@ -29,7 +35,7 @@ class SillyLexer:
         for mo in self.token_re.finditer(input_text):
             (from_, to) = mo.span()
             if from_ > pos:
-                yield (self.TEXT, input_text[from_:pos])
+                yield (self.TEXT, input_text[pos:from_])
             yield (self.TOKEN, self.mktoken(mo))
             pos = to
 
@@ -37,6 +43,156 @@ class SillyLexer:
         return Word(mo.group(), [mo.lastgroup or mo.group()])
 
 
+class LexError(SyntaxError):
+    pass
+
+
+class StreamingLexer(SillyLexer):
+    """
+    A lexer that yields tokens as it reads them, each carrying its span as
+    ((line, column), (end line, end column)), 1-based. Whitespace between tokens is
+    skipped, and any other text no token matches raises a LexError on the spot.
+    Instead of trying the whole alternation at every position, the alternatives
+    that can start with each ASCII character are precompiled into a table.
+    """
+
+    WHITESPACE = re.compile(r"\s+")
+    ASCII = frozenset(map(chr, range(128)))
+
+    def __init__(self, token_regexp):
+        super().__init__(token_regexp)
+        if isinstance(token_regexp, str):
+            token_regexp = [token_regexp]
+        alternatives = list(token_regexp)
+        firsts = [self.first_chars(alt) for alt in alternatives]
+        self.table = {}
+        for c in sorted(self.ASCII):
+            matching = [alt for alt, first in zip(alternatives, firsts) if first is None or c in first]
+            if matching:
+                self.table[c] = re.compile("|".join(matching))
+
+    def __call__(self, input_text):
+        line, line_start = 1, 0
+        pos, end = 0, len(input_text)
+        lookup, fallback = self.table.get, self.token_re
+        skip_whitespace, mktoken = self.WHITESPACE.match, self.mktoken
+        while pos < end:
+            c = input_text[pos]
+            if c.isspace():
+                to = skip_whitespace(input_text, pos).end()
+                newlines = input_text.count("\n", pos, to)
+                if newlines:
+                    line += newlines
+                    line_start = input_text.rfind("\n", pos, to) + 1
+                pos = to
+                continue
+
+            mo = lookup(c, fallback).match(input_text, pos)
+            to = mo.end() if mo else pos
+            if to == pos:
+                line_end = input_text.find("\n", pos)
+                text = input_text[line_start:line_end if line_end >= 0 else end]
+                raise LexError("unexpected character %r" % c, (None, line, pos - line_start + 1, text))
+
+            token = mktoken(mo)
+            start = (line, pos - line_start + 1)
+            newlines = input_text.count("\n", pos, to)
+            if newlines:
+                line += newlines
+                line_start = input_text.rfind("\n", pos, to) + 1
+            token.span = (start, (line, to - line_start + 1))
+            yield token
+            pos = to
+
+    @classmethod
+    def first_chars(cls, regexp):
+        """The ASCII characters a match of a regular expression can start with,
+        or None if the expression can match the empty string or is not understood.
+        Non-ASCII characters are never in the table, and fall back to the full expression."""
+        try:
+            first, nullable = cls._first_chars(sre_parse.parse(regexp))
+        except (TypeError, ValueError):
+            return None
+        if first is None or nullable:
+            return None
+        return first & cls.ASCII
+
+    @classmethod
+    def _first_chars(cls, items):
+        c = sre_constants
+        first = set()
+        for op, av in items:
+            if op in (c.AT, c.ASSERT, c.ASSERT_NOT):
+                continue  # zero-width; over-approximating is safe
+            elif op is c.LITERAL:
+                first.add(chr(av))
+                return first, False
+            elif op is c.NOT_LITERAL:
+                first |= cls.ASCII - {chr(av)}
+                return first, False
+            elif op is c.ANY:
+                first |= cls.ASCII - {"\n"}
+                return first, False
+            elif op is c.IN:
+                first |= {ch for ch in cls.ASCII if cls._in_set(av, ch)}
+                return first, False
+            elif op is c.SUBPATTERN:
+                sub_first, nullable = cls._first_chars(av[-1])
+                if sub_first is None:
+                    return None, True
+                first |= sub_first
+                if not nullable:
+                    return first, False
+            elif op is c.BRANCH:
+                nullable = False
+                for alternative in av[1]:
+                    sub_first, sub_nullable = cls._first_chars(alternative)
+                    if sub_first is None:
+                        return None, True
+                    first |= sub_first
+                    nullable = nullable or sub_nullable
+                if not nullable:
+                    return first, False
+            elif op in (c.MAX_REPEAT, c.MIN_REPEAT, getattr(c, "POSSESSIVE_REPEAT", None)):
+                low, _, sub = av
+                sub_first, nullable = cls._first_chars(sub)
+                if sub_first is None:
+                    return None, True
+                first |= sub_first
+                if low > 0 and not nullable:
+                    return first, False
+            else:
+                return None, True
+        return first, True
+
+    @staticmethod
+    def _in_set(items, ch):
+        c = sre_constants
+        negate = matched = False
+        for op, av in items:
+            if op is c.NEGATE:
+                negate = True
+            elif op is c.LITERAL:
+                matched = matched or ch == chr(av)
+            elif op is c.RANGE:
+                matched = matched or av[0] <= ord(ch) <= av[1]
+            elif op is c.CATEGORY:
+                matched = matched or re.match("[%s]" % CATEGORY_CLASSES.get(av, r"\s\S"), ch) is not None
+            else:
+                return True
+        return matched != negate
+
+
+CATEGORY_CLASSES = {
+    sre_constants.CATEGORY_DIGIT: r"\d",
+    sre_constants.CATEGORY_NOT_DIGIT: r"\D",
+    sre_constants.CATEGORY_SPACE: r"\s",
+    sre_constants.CATEGORY_NOT_SPACE: r"\S",
+    sre_constants.CATEGORY_WORD: r"\w",
+    sre_constants.CATEGORY_NOT_WORD: r"\W",
+}
+
+
 class SillyBlocker:
 
     def __init__(self, open_token, close_token):
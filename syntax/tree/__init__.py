@@ -1,5 +1,13 @@
+import threading
+import weakref
+
+
 class Tree:
 
+    # `var` and `summary` are annotations set by the synthesizer (the Z3 variable of a hole,
+    # the identifiers of a subtree); nodes have no __dict__, so they are declared here
+    __slots__ = ("root", "subtrees", "var", "summary", "__weakref__")
+
     def __init__(self, root, subtrees=None):
         self.root = root
         if subtrees is None:
@@ -41,6 +49,10 @@ class Tree:
     def reconstruct(cls, t):
         return cls(t.root, [cls.reconstruct(s) for s in t.subtrees])
 
+    def iter_nodes(self):
+        """Iterate over the nodes in preorder, lazily."""
+        return iter(PreorderWalk(self))
+
     @property
     def nodes(self):
         return list(PreorderWalk(self))
@@ -60,9 +72,9 @@ class Tree:
         stack = [(0, self)]
         max_depth = 0
         while stack:
-            depth, top = stack[0]
+            depth, top = stack.pop()
             max_depth = max(depth, max_depth)
-            stack[:1] = [(depth + 1, x) for x in top.subtrees]
+            stack.extend((depth + 1, x) for x in top.subtrees)
         return max_depth
 
     def split(self, separator=None):
@@ -74,6 +86,77 @@ class Tree:
             return [self]
 
 
+class InternedTree(Tree):
+    """
+    A hash-consed tree node: constructing a node equal to a live one returns that node,
+    so equal subtrees are shared, equality is identity and the hash is computed once.
+    The subtrees are a tuple and must not be changed. A node is identified by its root
+    and the identities of its subtrees, so all of them should be interned; nodes that
+    are annotated per occurrence (such as holes) are left plain and stay distinct.
+    Roots that are equal but of different types, such as 1 and True, make distinct nodes.
+    Every live node has an entry in a weak table, which costs more memory than the sharing
+    saves on typical programs; what interning gives is O(1) hashing and equality. The
+    unfoldings of loops are shared whatever the class of the nodes (see `wp.unroll`).
+    """
+
+    __slots__ = ("_hash",)
+    _table = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
+
+    def __new__(cls, root, subtrees=None):
+        subtrees = tuple(subtrees or ())
+        # interned subtrees hash in O(1) and are only equal to themselves, so they are their
+        # own key; other subtrees are keyed by identity
+        if all(isinstance(s, InternedTree) for s in subtrees):
+            key = (type(root), root, *subtrees)
+        else:
+            key = (type(root), root, *map(id, subtrees))
+        with cls._lock:
+            node = cls._table.get(key)
+            if node is None:
+                node = super().__new__(cls)
+                node.root, node.subtrees = root, subtrees
+                node._hash = hash(key)
+                cls._table[key] = node
+        return node
+
+    def __init__(self, root, subtrees=None):
+        pass  # initialized once, in __new__
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return type(self), (self.root, self.subtrees)
+
+    @classmethod
+    def intern(cls, t, shared=lambda t: True):
+        """
+        The interned copy of a tree, built bottom-up without recursion. Subtrees for which
+        `shared` is false are kept as they are (their own subtrees are not visited).
+        """
+        interned = {}
+        stack = [(t, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in interned:
+                continue
+            if isinstance(node, cls) or not shared(node):
+                interned[id(node)] = node
+            elif ready:
+                interned[id(node)] = cls(node.root, [interned[id(s)] for s in node.subtrees])
+            else:
+                stack.append((node, True))
+                stack.extend((s, False) for s in node.subtrees)
+        return interned[id(t)]
+
+
 # @deprecated: clients should use .tree.walk.RichTreeWalk instead
 from .walk import PreorderWalk, RichTreeWalk as Walk
 
@@ -31,9 +31,9 @@ class PreorderWalk(TreeWalk):
     def __iter__(self):
         stack = [self.tree]
         while stack:
-            top = stack[0]
+            top = stack.pop()
             yield top
-            stack[:1] = top.subtrees
+            stack.extend(reversed(top.subtrees))
 
 
 class PostorderWalk(TreeWalk):
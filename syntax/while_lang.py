@@ -1,8 +1,9 @@
 import typing
 
-from syntax.tree import Tree
+from syntax.tree import InternedTree, Tree
 from syntax.parsing.earley.earley import Grammar, Parser, ParseTrees
-from syntax.parsing.silly import SillyLexer
+from syntax.parsing.lazy import Lazy
+from syntax.parsing.silly import LexError, StreamingLexer
 
 __all__ = ["parse"]
 
@@ -30,19 +31,22 @@ class WhileParser:
     """
 
     def __init__(self) -> None:
-        self.tokenizer = SillyLexer(self.TOKENS)
-        self.grammar = Grammar.from_string(self.GRAMMAR)
+        self.tokenizer = StreamingLexer(self.TOKENS)
+        self.grammar = Grammar.from_string(self.GRAMMAR).compile()
 
     def __call__(self, program_text: str) -> typing.Optional[Tree]:
-        tokens = list(self.tokenizer(program_text))
+        # tokens are streamed into the parser as it reaches them
+        tokens = self.tokenizer(program_text)
 
         earley = Parser(grammar=self.grammar, sentence=tokens, debug=False)
-        earley.parse()
+        try:
+            earley.parse()
+        except LexError:
+            return None
 
         if earley.is_valid_sentence():
-            trees = ParseTrees(earley)
-            assert len(trees) == 1
-            return self.postprocess(trees.nodes[0])
+            assert len(earley.complete_parses) == 1
+            return self.postprocess(ParseTrees(earley).first())
         else:
             return None
 
@@ -74,5 +78,157 @@ class WhileParser:
         return Tree(t.root, [self.postprocess(s) for s in t.subtrees])
 
 
-def parse(program_text: str) -> typing.Optional[Tree]:
-    return WhileParser()(program_text)
+class DirectParser:
+    """
+    A hand-written recursive-descent parser for the While grammar, producing the same trees as
+    WhileParser followed by its postprocessing, in a single left-to-right pass over the tokens.
+    Ambiguities are resolved the way the Earley parser resolves them: `and`, `or` and `mod`
+    share one precedence level and associate to the left, and `not` applies to a single
+    comparison (`E0 op E0`) or operand.
+    """
+
+    def __init__(self) -> None:
+        self.tokenizer = StreamingLexer(WhileParser.TOKENS)
+
+    def __call__(self, program_text: str) -> typing.Optional[Tree]:
+        try:
+            return Descent(self.tokenizer(program_text)).program()
+        except SyntaxError:  # including LexError
+            return None
+
+
+class Descent:
+    """
+    The state of one DirectParser run: the token stream and its current token.
+    """
+
+    BINARY = ("and", "or", "mod")
+
+    def __init__(self, tokens: typing.Iterator) -> None:
+        self.tokens = tokens
+        self.word = self.tag = None
+        self.advance()
+
+    def program(self) -> Tree:
+        t = self.statements()
+        if self.tag is not None:
+            raise SyntaxError("unexpected %r" % self.word)
+        return t
+
+    def advance(self) -> Tree:
+        """Consume the current token, returning it as a leaf tree of its category."""
+        current = Tree(self.tag, [Tree(self.word)]) if self.tag is not None else None
+        token = next(self.tokens, None)
+        self.word, self.tag = (token.word, token.tags[0]) if token else (None, None)
+        return current
+
+    def expect(self, tag: str) -> Tree:
+        if self.tag != tag:
+            raise SyntaxError("expected %r, got %r" % (tag, self.word))
+        return self.advance()
+
+    def statements(self) -> Tree:
+        """S -> S1 | S1 ; S"""
+        sequence = [self.statement()]
+        while self.tag == ";":
+            self.advance()
+            sequence.append(self.statement())
+        t = sequence.pop()
+        while sequence:
+            t = Tree(";", [sequence.pop(), t])
+        return t
+
+    def statement(self) -> Tree:
+        """S1 -> skip | Var := E | if E then S else S1 | while E do S1 | ( S ) | assert E"""
+        if self.tag == "skip":
+            return self.advance()
+        elif self.tag == "id":
+            var = self.var()
+            self.expect(":=")
+            return Tree(":=", [var, self.expr()])
+        elif self.tag == "if":
+            self.advance()
+            cond = self.expr()
+            self.expect("then")
+            then = self.statements()
+            self.expect("else")
+            return Tree("if", [cond, then, self.statement()])
+        elif self.tag == "while":
+            self.advance()
+            cond = self.expr()
+            self.expect("do")
+            return Tree("while", [cond, self.statement()])
+        elif self.tag == "(":
+            self.advance()
+            t = self.statements()
+            self.expect(")")
+            return t
+        elif self.tag == "assert":
+            self.advance()
+            return Tree("assert", [self.expr()])
+        raise SyntaxError("unexpected %r" % self.word)
+
+    def var(self) -> Tree:
+        """Var -> id [ E ] | id"""
+        name = self.expect("id")
+        if self.tag != "[":
+            return name
+        self.advance()
+        index = self.expr()
+        self.expect("]")
+        return Tree("array", [name, index])
+
+    def expr(self) -> Tree:
+        """E -> E and E | E or E | E mod E | unit"""
+        t = self.unit()
+        while self.tag in self.BINARY:
+            op = self.advance().root
+            t = Tree(op, [t, self.unit()])
+        return t
+
+    def unit(self) -> Tree:
+        """unit -> not unit | E0 | E0 op E0"""
+        if self.tag == "not":
+            self.advance()
+            return Tree("not", [self.unit()])
+        t = self.operand()
+        if self.tag != "op":
+            return t
+        op = self.advance().subtrees[0].root
+        return Tree(op, [t, self.operand()])
+
+    def operand(self) -> Tree:
+        """E0 -> Var | num | hole | false | true | ( E )"""
+        if self.tag == "id":
+            return self.var()
+        elif self.tag == "num":
+            return Tree("num", [Tree(int(self.advance().subtrees[0].root))])
+        elif self.tag in ("hole", "false", "true"):
+            return self.advance()
+        elif self.tag == "(":
+            self.advance()
+            t = self.expr()
+            self.expect(")")
+            return t
+        raise SyntaxError("unexpected %r" % self.word)
+
+
+shared_parser = Lazy(WhileParser)
+shared_direct_parser = Lazy(DirectParser)
+
+
+def is_hole(t: Tree) -> bool:
+    return t.root == "hole" and bool(t.subtrees)
+
+
+def parse(program_text: str, earley: bool = True, hashcons: bool = False) -> typing.Optional[Tree]:
+    """
+    Parse a While program, returning None if it is not valid. With `earley=False` the
+    hand-written DirectParser is used instead of the Earley parser; both give the same trees.
+    With `hashcons=True` the tree is made of InternedTree nodes, except for the holes,
+    which stay distinct plain nodes.
+    """
+    t = (shared_parser if earley else shared_direct_parser)()(program_text)
+    if t is not None and hashcons:
+        t = InternedTree.intern(t, lambda node: not is_hole(node))
+    return t
@@ -1,4 +1,27 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from syntax.parsing.earley.chart import Chart, ChartRow
+from syntax.parsing.earley.earley import Parser, ParseTrees
+from syntax.parsing.earley.grammar import Rule
+from syntax.parsing.silly import LexError, SillyLexer
+from syntax import lambda_pure
+from syntax.tree import InternedTree, Tree
+from syntax.while_lang import shared_parser
 from wp import *
+import batch
+import bmc
+from cache import MISS, VERSION_FILE, ResultCache
+from interp import AssertionFailed, IterationLimit, Undefined, check_model, compile_program, prescreen
+from peval import partial_eval, smt_div, smt_mod
+import vectorized
 
 
 def test_skip():
@@ -978,3 +1001,735 @@ def test_binary_search() -> None:
 
     for P, Q in zip(ins, outs):
         assert verify(P, ast, Q, linv)
+
+
+def test_cegis_feature_1_if() -> None:
+    ast = parse(
+        """
+        if x < ?? then 
+            y := ?? 
+        else
+            y := ??
+        """
+    )
+    assert ast is not None
+
+    ins = [lambda d: d["x"] == 0, lambda d: d["x"] == 1, lambda d: d["x"] == -4]
+    outs = [lambda d: d["y"] == 3, lambda d: d["y"] == 5, lambda d: d["y"] == 3]
+    linv = lambda d: True
+
+    model = synthesize(ast, linv, ins, outs, cegis=True)
+    assert model is not None
+    assert STATS["cegis_candidates"] == STATS["cegis_counterexamples"] + 1
+
+    full_program = pretty_repr(ast, model)
+    ast = parse(full_program)
+
+    for P, Q in zip(ins, outs):
+        assert verify(P, ast, Q, linv)
+
+
+def test_cegis_sort_swap() -> None:
+    ast = parse(
+        """
+        a[0] := 7;
+        a[1] := 5;
+        a[2] := 13;
+        a[3] := 17;
+        
+        a[??] := a[1];
+        a[??] := a[0];
+        a[0] := a[??];
+        
+        assert (a[0] < a[1]);
+        assert (a[1] < a[2]);
+        assert (a[2] < a[3])
+        """
+    )
+    assert ast is not None
+
+    linv = lambda d: True
+
+    model = synthesize(ast, linv, [], [], cegis=True)
+    assert model is not None
+
+    full_program = pretty_repr(ast, model)
+    ast = parse(full_program)
+
+    assert verify(lambda _: True, ast, lambda _: True, linv)
+
+
+def test_incremental_zeroing_out() -> None:
+    ast = parse(
+        """
+        x := ??;
+        y := x;
+        assert x > 2;
+        while x > 0 do (
+            x := x - 1;
+            y := y - ??
+        );
+        assert y = 0
+
+        """
+    )
+    assert ast is not None
+
+    linv = lambda d: True
+
+    model = synthesize(ast, linv, [], [], incremental=True)
+    assert model is not None
+
+    full_program = pretty_repr(ast, model)
+    ast = parse(full_program)
+
+    assert verify(lambda _: True, ast, lambda _: True, linv)
+
+
+def test_incremental_solver_params() -> None:
+    ast = parse("x := ??; y := x; assert x > 2; while x > 0 do (x := x - 1; y := y - ??); assert y = 0")
+    linv = lambda d: True
+    assert synthesize(ast, linv, [], [], incremental=True) is not None
+    # a resource limit of 1 stops the shared solver before it finds anything
+    assert synthesize(ast, linv, [], [], incremental=True, solver_configs=[{"rlimit": 1}]) is None
+    with pytest.raises(ValueError):
+        synthesize(ast, linv, [], [], incremental=True, solver_configs=[{}, {"rlimit": 1}])
+
+
+def test_portfolio_zeroing_out() -> None:
+    ast = parse(
+        """
+        x := ??;
+        y := x;
+        assert x > 2;
+        while x > 0 do (
+            x := x - 1;
+            y := y - ??
+        );
+        assert y = 0
+
+        """
+    )
+    assert ast is not None
+
+    linv = lambda d: True
+
+    model = synthesize(ast, linv, [], [], cegis=True, portfolio=True)
+    assert model is not None
+    assert STATS["cegis_candidates"] > 0
+
+    full_program = pretty_repr(ast, model)
+    ast = parse(full_program)
+
+    assert verify(lambda _: True, ast, lambda _: True, linv, portfolio=True)
+    assert not verify(lambda _: True, ast, lambda d: d['y'] != 0, linv, portfolio=True)
+
+
+def test_shared_parser() -> None:
+    assert shared_parser() is shared_parser()
+
+    programs = ["x := ??; y := x", "while i < n do i := i + 1", "a[0] := 1; assert a[0] = 1"] * 10
+    with ThreadPoolExecutor(4) as pool:
+        trees = list(pool.map(parse, programs))
+    assert trees == [parse(p) for p in programs]
+
+
+def test_chart_duplicate_rows() -> None:
+    chart = Chart([])
+    assert chart.add_row(ChartRow(Rule("S", ["S1", ";", "S"]), 1, 0))
+    assert not chart.add_row(ChartRow(Rule("S", ("S1", ";", "S")), 1, 0))
+    assert chart.add_row(ChartRow(Rule("S", ["S1", ";", "S"]), 1, 2))
+    assert len(chart) == 2
+
+
+def test_lookahead_prediction() -> None:
+    grammar = shared_parser().grammar
+    assert "S" not in grammar.nullable
+    assert grammar.first["E0"] == {"id", "num", "hole", "false", "true", "("}
+
+    earley = Parser(grammar, list(shared_parser().tokenizer("x := 1")))
+    earley.parse()
+    assert earley.is_valid_sentence()
+    assert earley.statistics()["filtered_predictions"] > 0
+
+    assert lambda_pure.shared_parser().grammar.nullable == {"L"}
+    assert str(lambda_pure.parse(r"\x y. x y")) == r"\{id{x}, \{id{y}, @{id{x}, id{y}}}}"
+
+
+def test_parse_forest() -> None:
+    parser = shared_parser()
+    earley = Parser(parser.grammar, list(parser.tokenizer("assert a and b and c and d and e")))
+    earley.parse()
+    assert earley.is_valid_sentence()
+
+    trees = ParseTrees(earley)
+    assert trees.count() == 14
+    assert len(set(map(str, trees))) == 14
+    assert trees.first() == next(iter(trees))
+    assert str(parser.postprocess(trees.first())) == "assert{and{and{and{and{id{a}, id{b}}, id{c}}, id{d}}, id{e}}}"
+
+
+def test_streaming_lexer() -> None:
+    lexer = shared_parser().tokenizer
+    program = "x := 1;\n  while x > ?? do\n    x := x - 1"
+    tokens = list(lexer(program))
+    assert [(t.word, t.tags) for t in tokens] == [(t.word, t.tags) for t in SillyLexer(shared_parser().TOKENS)(program)]
+    assert tokens[3].span == ((1, 7), (1, 8))
+    assert tokens[4].span == ((2, 3), (2, 8))
+    assert tokens[-1].span == ((3, 14), (3, 15))
+
+    try:
+        list(lexer("x := 1;\ny := 2 $ 3"))
+        assert False
+    except LexError as e:
+        assert (e.lineno, e.offset) == (2, 8)
+    assert parse("x := 1 $ 2") is None
+
+    earley = Parser(shared_parser().grammar, lexer("x := 1; y := x"))
+    earley.parse()
+    assert earley.is_valid_sentence()
+
+
+def test_direct_parser() -> None:
+    with open(__file__) as f:
+        source = f.read()
+    programs = re.findall(r'"""(.*?)"""', source, re.S) + re.findall(r'"([^"\n]*)"', source)
+    parsed = 0
+    for program in programs:
+        expected = parse(program)
+        assert repr(parse(program, earley=False)) == repr(expected), program
+        parsed += expected is not None
+    assert parsed > 30
+
+    assert str(parse("assert not a or not b and c", earley=False)) == "assert{and{or{not{id{a}}, not{id{b}}}, id{c}}}"
+    assert parse("x := 1 $ 2", earley=False) is None
+    assert parse("x := a + b + c", earley=False) is None
+
+
+def test_hashcons() -> None:
+    program = "x := ??; y := x + 1; while y < 10 do (y := y + 1; x := x + ??); assert (x + 1) > y"
+    ast = parse(program, hashcons=True)
+    assert repr(ast) == repr(parse(program))
+    assert isinstance(ast, InternedTree)
+    sums = [n for n in ast.nodes if n.root == "+" and n.subtrees[0] == InternedTree("id", [InternedTree("x")])]
+    assert len(sums) == 3 and sums[0] is sums[2]
+    assert InternedTree("id", [InternedTree("x")]) is InternedTree("id", [InternedTree("x")])
+    assert InternedTree(1) is not InternedTree(True) and InternedTree(0) is not InternedTree(False)
+    assert InternedTree("num", [InternedTree(1)]) is not InternedTree("num", [InternedTree(True)])
+    assert not hasattr(ast, "__dict__") and not hasattr(Tree("x"), "__dict__")
+
+    holes = [n for n in ast.nodes if n.root == "hole"]
+    assert len(holes) == 2 and holes[0] is not holes[1]
+    assert not any(isinstance(h, InternedTree) for h in holes)
+
+    unfolded = unfold_while(ast, 3)
+    assert repr(unfolded) == repr(unfold_while(parse(program), 3))
+    assert unfolded.subtrees[0] is ast.subtrees[0]
+    steps = [n for n in unfolded.nodes if n.root == "if"]
+    assert len(steps) == 3 and steps[0] is steps[1] is steps[2]
+
+    # plain trees share the iterations of the unfoldings of a run as well
+    reset_run()
+    ast = parse(program)
+    unfolded = [unfold_while(ast, depth) for depth in range(4)]
+    chains = [tree.subtrees[1].subtrees[1].subtrees[0] for tree in unfolded]
+    assert all(chains[depth].subtrees[1] is chains[depth - 1] for depth in range(1, 4))
+    assert len({id(n) for tree in unfolded for n in tree.nodes if n.root == "if"}) == 1
+
+
+def test_tree_walks() -> None:
+    wide = Tree(";", [Tree("skip", [Tree(i)]) for i in range(20000)])
+    assert [n.root for n in wide.iter_nodes()][:4] == [";", "skip", 0, "skip"]
+    assert len(wide.nodes) == 40001
+    assert wide.depth == 2
+
+    ast = parse("x := ??; a[x] := y; while x < n do x := x + ??")
+    assert summarize(ast) is summarize(ast)
+    assert get_all_ids(ast) == {"x", "a", "y", "n"}
+    assert get_array_ids(ast) == {"a"}
+    assert get_non_array_ids(ast) == {"x", "y", "n"}
+    assert len(summarize(ast).holes) == 2
+
+
+def test_variable_analysis() -> None:
+    ast = parse("i := 0; while i < n do (a[i] := b[i + k] + x; i := i + ??)")
+    loop = ast.subtrees[1]
+    assert summarize(loop).writes == {"a", "i"}
+    assert summarize(loop).reads == {"a", "b", "i", "k", "n", "x"}
+    assert summarize(loop).array_ids == {"a", "b"}
+    assert summarize(loop).loops and not summarize(loop.subtrees[1]).loops
+    assert summarize(loop.subtrees[1]) is loop.subtrees[1].summary
+
+    assert verify(lambda d: d['n'] >= 0, parse("i := 0; while i < n do i := i + 1"),
+                  lambda d: d['i'] == d['n'], lambda d: d['i'] <= d['n'])
+
+
+def test_wp_cache() -> None:
+    program = ";\n".join(f"if x > {i} then y := y + 1 else skip" for i in range(12))
+    assert verify(lambda d: d['y'] == 0, parse(program), lambda d: d['y'] >= 0, lambda _: True)
+    assert STATS["wp_closures_created"] == 4 * 12 - 1  # one per command node
+    assert STATS["wp_results_reused"] > 0
+
+    ast = parse(program)
+    Q = lambda d: d['y'] >= 0
+    assert wp(ast, Q) is wp(ast, Q)
+
+
+def test_dag_encoding() -> None:
+    true = lambda _: True
+    ast = parse("a := 1; (if a = 1 then a := 2 else skip); (if a = 2 then (a := 3; assert a = 3) else skip)")
+    assert not verify(true, ast, lambda d: d['a'] == 1, true, dag=True)
+    assert verify(true, ast, lambda d: d['a'] == 3, true, dag=True)
+    assert not verify(true, parse("if x > 0 then assert x > 1 else skip"), true, true, dag=True)
+
+    program = ";\n".join(f"if x > {i} then y := y + 1 else y := y - 1" for i in range(32))
+    assert verify(lambda d: d['y'] == 0, parse(program), lambda d: And(d['y'] >= -32, d['y'] <= 32), true, dag=True)
+
+    ast = parse("x := ??; if x > 5 then y := x + ?? else y := x - ??; assert y = 10; assert x = 3")
+    model = synthesize(ast, true, [], [], dag=True)
+    assert model is not None
+    assert verify(true, parse(pretty_repr(ast, model)), true, true, dag=True)
+
+
+def test_bmc_backend() -> None:
+    true = lambda _: True
+    ast = parse("a := 1; (if a = 1 then a := 2 else skip); (if a = 2 then (a := 3; assert a = 3) else skip)")
+    assert not bmc.verify(true, ast, lambda d: d['a'] == 1, true)
+    assert bmc.verify(true, ast, lambda d: d['a'] == 3, true)
+    assert not bmc.verify(true, parse("if x > 0 then assert x > 1 else skip"), true, true)
+
+    final_env, variables, definitions, _ = bmc.ssa(parse("x := x + 1; x := x * 2"), {'x': Int('x')})
+    assert [str(v) for v in variables] == ['x!1', 'x!2'] and final_env['x'].eq(variables[-1])
+    assert len(definitions) == 2
+
+    ast = parse("x := ??; y := x; assert x > 2; while x > 0 do (x := x - 1; y := y - ??); assert y = 0")
+    model = bmc.synthesize(ast, true, [], [])
+    assert model is not None
+    assert verify(true, parse(pretty_repr(ast, model)), true, true)
+
+
+def test_result_cache() -> None:
+    true = lambda _: True
+    program = "x := ??; y := x; assert x > 2; while x > 0 do (x := x - 1; y := y - ??); assert y = 0"
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory)
+        model = synthesize(parse(program), true, [], [], cache=cache)
+        assert STATS["cache_misses"] == 4 and STATS["cache_hits"] == 0
+
+        ast = parse(program)
+        cached_model = synthesize(ast, true, [], [], cache=ResultCache(directory))
+        assert STATS["cache_hits"] == 4 and STATS["cache_misses"] == 0
+        assert STATS["wp_closures_created"] == 0
+        assert pretty_repr(ast, cached_model) == pretty_repr(ast, model)
+
+        # a different spec is a different query
+        synthesize(parse(program), lambda d: d['x'] >= 0, [], [], cache=cache)
+        assert STATS["cache_misses"] == 4
+
+        ast = parse("a := 1; if a = 1 then a := 2 else skip")
+        for _ in range(2):
+            assert verify(true, ast, lambda d: d['a'] == 2, true, cache=cache)
+            assert not verify(true, ast, lambda d: d['a'] == 1, true, cache=cache)
+        assert STATS["cache_hits"] == MAX_UNFOLDING
+
+        # a cache filled by another solver version is emptied
+        with open(os.path.join(directory, VERSION_FILE), "w") as f:
+            f.write("0.0.0")
+        assert ResultCache(directory).get(cache.key("anything")) is MISS
+        assert not list(ResultCache(directory).entries())
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory, max_bytes=100)
+        for i in range(20):
+            cache.put(cache.key(i), {"value": i})
+            cache.get(cache.key(0))
+        assert sum(entry.stat().st_size for entry in cache.entries()) <= 100
+        assert cache.get(cache.key(0)) == {"value": 0}
+        assert cache.get(cache.key(19)) == {"value": 19}
+        assert cache.get(cache.key(1)) is MISS
+
+
+def test_expr_cache() -> None:
+    reset_run()
+    cond = parse("assert (x + y) > (z * 2)").subtrees[0]
+    env = {'x': Int('x'), 'y': Int('y'), 'z': Int('z')}
+    first = eval_expr(cond, env)
+    assert STATS["expr_cache_misses"] == 3 and STATS["expr_cache_hits"] == 0
+    assert eval_expr(cond, env | {'z': Int('z')}) is first
+    assert STATS["expr_cache_hits"] == 1
+
+    # only the changed operand is translated again
+    second = eval_expr(cond, env | {'x': Int('w')})
+    assert second.eq(Int('w') + Int('y') > Int('z') * 2)
+    assert STATS["expr_cache_misses"] == 5 and STATS["expr_cache_hits"] == 2
+    assert STATS["expr_cache_entries"] == 5
+
+    # the variable of a hole is part of the key
+    ast = parse("assert (x + ??) > 0")
+    [hole] = summarize(ast).holes
+    hole.var = Int('h0')
+    first = eval_expr(ast.subtrees[0], env)
+    hole.var = Int('h1')
+    second = eval_expr(ast.subtrees[0], env)
+    assert not second.eq(first) and "h1" in str(second)
+
+
+def test_runs_per_thread() -> None:
+    reset_run()
+    STATS["marker"] = 1
+    cond = parse("assert (x + y) > 0").subtrees[0]
+    env = {'x': Int('x'), 'y': Int('y')}
+    eval_expr(cond, env)
+
+    def run_in_thread(_) -> tuple[int, int]:
+        ast = parse("x := ??; y := x + 1; assert y = 3")
+        model = synthesize(ast, lambda _: True, [], [])
+        return STATS["marker"], get_hole_values(model, get_holes(ast))["__hole_0"]
+
+    with ThreadPoolExecutor(2) as pool:
+        assert list(pool.map(run_in_thread, range(4))) == [(0, 2)] * 4
+    # the runs of the other threads neither reset nor filled the caches of this one
+    assert STATS["marker"] == 1 and STATS["expr_cache_entries"] == 2
+    assert eval_expr(cond, env) is eval_expr(cond, env | {'x': Int('x')})
+
+
+# no cubes add up to a cube, which the solver cannot prove, so every unfolding depth times out
+CUBES_PROGRAM = ("x := ??; y := ??; z := ??; assert x > 0; assert y > 0; assert z > 0; "
+                 "assert (((x * x) * x) + ((y * y) * y)) = ((z * z) * z)")
+
+
+def test_batch() -> None:
+    jobs = [
+        {"id": "pbe", "program": "y := x + ??", "pbes": [["x = 1", "y = 3"]]},
+        {"id": "loop", "program": "x := ??; y := x; while x > 0 do (x := x - 1; y := y - ??); assert y = 0",
+         "invariant": "y >= 0", "options": {"dag": True}},
+        {"id": "unsolved", "program": "x := ??; assert x > x"},
+        {"id": "invalid", "program": "x := := 1"},
+        {"id": "slow", "program": CUBES_PROGRAM, "timeout": 1},
+        {"id": "broken", "error": "invalid job"},
+        {"id": "portfolio", "program": "x := ??; y := 0; while x > 0 do (x := x - 1; y := y + 2); assert y = 4",
+         "options": {"portfolio": True}},
+        {"id": "bad timeout", "program": "x := ??", "timeout": "5"},
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = os.path.join(directory, "jobs.jsonl")
+        with open(manifest, "w") as f:
+            f.writelines(json.dumps(job) + "\n" for job in jobs[:3])
+        assert [job["id"] for job in batch.load_manifest(manifest)] == ["pbe", "loop", "unsolved"]
+
+        results = {r["id"]: r for r in batch.run_batch(jobs, workers=2)}
+        assert {id: r["verdict"] for id, r in results.items()} == \
+               {"pbe": "solved", "loop": "solved", "unsolved": "unsolved", "invalid": "error", "slow": "timeout",
+                "broken": "error", "portfolio": "solved", "bad timeout": "error"}
+        assert results["pbe"]["holes"] == {"__hole_0": 2} and results["pbe"]["depth"] == 0
+        assert results["portfolio"]["holes"] == {"__hole_0": 2} and results["portfolio"]["depth"] == 2
+        true = lambda _: True
+        assert verify(true, parse(results["loop"]["program"]), true, lambda d: d['y'] >= 0)
+
+        output = os.path.join(directory, "results.jsonl")
+        with open(output, "w") as f:
+            f.write(json.dumps({"id": "pbe", "verdict": "solved"}) + "\n" + '{"id": "lo')
+        batch.main([manifest, "-o", output, "-j", "2"])
+        assert batch.finished_ids(output) == {"pbe", "loop", "unsolved"}
+        with open(output) as f:
+            assert sum(1 for line in f if '"pbe"' in line) == 1
+
+        jobs_directory = os.path.join(directory, "jobs")
+        os.makedirs(os.path.join(jobs_directory, "nested.json"))
+        for name, text in [("a.json", json.dumps(jobs[0])), ("b.while", "x := ??"), ("c.json", "{"),
+                           ("d.json", "[1]"), (".DS_Store", "\0\1"), ("notes.txt", "not a job")]:
+            with open(os.path.join(jobs_directory, name), "w") as f:
+                f.write(text)
+        loaded = batch.load_manifest(jobs_directory)
+        assert [job["id"] for job in loaded] == ["pbe", "b", "c", "d"]
+        assert "error" in loaded[2] and "error" in loaded[3] and "error" not in loaded[0]
+
+
+def test_server() -> None:
+    server = subprocess.Popen([sys.executable, "server.py", "-j", "1"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    def call(request_id, method: str, **params) -> dict:
+        server.stdin.write(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}) + "\n")
+        server.stdin.flush()
+        return json.loads(server.stdout.readline())
+
+    try:
+        response = call(1, "synthesize", program="y := x + ??", pbes=[["x = 1", "y = 3"]])
+        assert response["id"] == 1 and response["result"]["holes"] == {"__hole_0": 2}
+        assert call(2, "verify", program="x := 1", post="x = 1")["result"] == {"valid": True}
+        assert call(3, "verify", program="x := 1", post="x = 2")["result"] == {"valid": False}
+        assert call(4, "verify", program="x := := 1")["error"]["code"] == -32602
+        assert call(5, "frobnicate")["error"]["code"] == -32601
+
+        assert call(6, "synthesize", program=CUBES_PROGRAM, timeout=1)["error"]["code"] == -32001
+        for timeout in ["5", None, True, -1, [1]]:
+            assert call(6, "verify", program="x := 1", timeout=timeout)["error"]["code"] == -32602
+        assert call(6, "verify", program="x := 1", post="x = 1", timeout=5)["result"] == {"valid": True}
+
+        server.stdin.write(json.dumps({"jsonrpc": "2.0", "id": 7, "method": "synthesize",
+                                       "params": {"program": CUBES_PROGRAM}}) + "\n")
+        response = call(8, "cancel", id=7)
+        assert response == {"jsonrpc": "2.0", "id": 7, "error": {"code": -32800, "message": "request cancelled"}}
+        assert json.loads(server.stdout.readline())["result"] is True
+
+        program = "x := ??; y := 0; while x > 0 do (x := x - 1; y := y + 2); assert y = 4"
+        response = call(8, "synthesize", program=program, options={"portfolio": True})
+        assert response["result"]["holes"] == {"__hole_0": 2}
+
+        # the killed worker was replaced
+        assert call(9, "synthesize", program="x := ??; assert x = 5")["result"]["holes"] == {"__hole_0": 5}
+        assert call(10, "shutdown")["result"] is True
+        assert server.wait(10) == 0
+    finally:
+        server.kill()
+
+
+def test_server_pipe() -> None:
+    requests = [{"jsonrpc": "2.0", "id": 1, "method": "synthesize",
+                 "params": {"program": "y := x + ??", "pbes": [["x = 1", "y = 3"]]}},
+                {"jsonrpc": "2.0", "method": "verify", "params": {"program": "x := 1", "post": "x = 2"}},
+                {"jsonrpc": "2.0", "method": "frobnicate"},
+                {"jsonrpc": "2.0", "id": 2, "method": "verify", "params": {"program": "x := 1", "post": "x = 1"}}]
+    # the input ends before the workers are warm, so the requests are answered after it is closed
+    finished = subprocess.run([sys.executable, "server.py", "-j", "1"],
+                              input="".join(json.dumps(request) + "\n" for request in requests),
+                              capture_output=True, text=True, timeout=60,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert finished.returncode == 0
+    # notifications are carried out but not answered
+    responses = sorted((json.loads(line) for line in finished.stdout.splitlines()), key=lambda r: r["id"])
+    assert [r["id"] for r in responses] == [1, 2]
+    assert responses[0]["result"]["holes"] == {"__hole_0": 2} and responses[1]["result"] == {"valid": True}
+
+
+def test_per_loop_unfolding() -> None:
+    # the first loop has no bound, so it must be kept, while the second must be unfolded three times
+    ast = parse("""
+        i := 0;
+        while i < n do i := i + 1;
+        x := ??;
+        y := 0;
+        while x > 0 do (x := x - 1; y := y + 2);
+        assert y = 6
+    """)
+    true = lambda _: True
+    assert synthesize(ast, true, [], []) is None
+    model = synthesize(ast, true, [], [], per_loop=True)
+    assert model is not None and STATS["unfolding_depth"] == 3
+    full_program = parse(pretty_repr(ast, model))
+    assert verify(true, full_program, true, true, per_loop=True)
+    assert not verify(true, full_program, true, true)
+
+    assert depth_vectors(0) == [()]
+    assert depth_vectors(1) == [(d,) for d in range(MAX_UNFOLDING)]
+    assert depth_vectors(2)[:6] == [(0, 0), (0, 1), (1, 0), (1, 1), (0, 2), (2, 0)]
+    assert len(depth_vectors(3)) == MAX_DEPTH_VECTORS
+
+    nested = parse("while i < n do (j := 0; while j < m do j := j + 1; i := i + 1)")
+    assert loop_paths(nested) == [(), (1, 1, 0)]
+    unfolded = unfold_to_depth(nested, (3, 2))
+    steps = [node for node in unfolded.nodes if node.root == "if"]
+    bodies = {id(step.subtrees[1]) for step in steps}
+    # the three outer steps are one node, whose body unfolds the inner loop twice with one step node
+    assert len(steps) == 3 + 3 * 2 and len({id(step) for step in steps}) == 2 and len(bodies) == 2
+    assert not summarize(unfolded).loops
+    assert unfold_to_depth(nested, (0, 0)) is nested
+
+
+def test_partial_eval() -> None:
+    ast = parse("a[0] := 1; a[1] := 2; n := 2; i := n - 1; if i > 0 then x := a[i] else x := ??; y := x + z")
+    residual = partial_eval(ast)
+    # the branch and every computation but the one reading the input are folded away
+    assert not any(node.root in ("if", "hole") for node in residual.nodes)
+    assignments = [node for node in residual.nodes if node.root == ":="]
+    assert len(assignments) == 6 and parse("x := 2") in assignments
+    assert summarize(residual).ids == summarize(ast).ids
+
+    # a variable whose only use is folded away is kept
+    dead = partial_eval(parse("x := 1; if x > 2 then y := 3 else skip"))
+    assert summarize(dead).writes == {"x", "y"}
+    assert smt_div(7, -2) == -3 and smt_mod(-7, 3) == 2 and smt_div(-7, 2) == -4
+
+    ast = parse("""
+        a[0] := 7;
+        a[1] := 5;
+        n := 2;
+        i := n - 1;
+        a[??] := a[i];
+        a[??] := a[0];
+        a[0] := a[??];
+        while i > 0 do i := i - 1;
+        assert a[0] < a[1]
+    """)
+    true = lambda _: True
+    model = synthesize(ast, true, [], [], prepass=partial_eval)
+    assert model is not None
+    full_program = parse(pretty_repr(ast, model))
+    assert verify(true, full_program, true, true)
+    assert verify(true, full_program, true, true, prepass=partial_eval)
+
+
+def test_array_scalarization() -> None:
+    ast = parse("""
+        a[0] := 7;
+        a[1] := 5;
+        a[2] := 13;
+        a[3] := 17;
+        a[??] := a[??];
+        a[??] := a[??];
+        a[??] := a[??];
+        assert (a[0] < a[1]);
+        assert (a[1] < a[2]);
+        assert (a[2] < a[3])
+    """)
+    true = lambda _: True
+    # the same sketch as in `test_hard_sort_swap`, out of reach of the array encoding
+    model = synthesize(ast, true, [], [], scalarize=True)
+    assert model is not None and STATS["scalarized_arrays"] > 0
+    assert verify(true, parse(pretty_repr(ast, model)), true, true)
+    # counterexample-guided search keeps the array theory
+    assert synthesize(ast, true, [], [], cegis=True, scalarize=True) is not None
+    assert STATS["scalarized_arrays"] == 0
+
+    two_swaps = parse("""
+        a[0] := 7;
+        a[1] := 5;
+        a[2] := 17;
+        a[3] := 13;
+        a[4] := a[0]; a[0] := a[1]; a[1] := a[4];
+        a[4] := a[2]; a[2] := a[3]; a[3] := a[4];
+        assert (a[0] < a[1]);
+        assert (a[1] < a[2]);
+        assert (a[2] < a[3])
+    """)
+    assert verify(true, two_swaps, true, true, scalarize=True)
+    assert not verify(true, parse("a[1] := 2; a[0] := a[1]; assert a[0] = a[2]"), true, true, scalarize=True)
+
+    ast = parse("a[2] := ??; a[??] := a[5]; b[i] := a[??]; x := b[0]")
+    for idx, hole in enumerate(summarize(ast).holes):
+        hole.var = Int(f'__hole_{idx}')
+    [_, write, read] = [hole.var for hole in summarize(ast).holes]
+    # two unused positions: one for the written hole and one for the read hole
+    assert scalar_array_positions(ast, [true]) == {"a": ([2, 5, 6, 7], [(read, [2, 5, 6, 7]), (write, [2, 5, 6])])}
+    assert scalar_array_positions(ast, [lambda d: Select(d["a"], 0) == 1]) == {}
+    assert scalar_array_positions(parse("a[0] := 1; while a[0] < n do a[0] := a[0] + 1"), [true]) == {}
+    assert scalar_array_positions(parse("a[0] := 1; b := a; x := b[0]"), [true]) == {}
+
+
+def test_interpreter() -> None:
+    run = compile_program(parse("s := 0; i := 0; while i < n do (s := s + i; i := i + 1)"))
+    state = {"n": 10}
+    assert run(state) == {"n": 10, "s": 45, "i": 10} and state == {"n": 10}
+
+    run = compile_program(parse("x := -7 / 2; y := -7 mod 3; b := a; b[0] := x"))
+    state = {"a": {0: 5}}
+    assert run(state) == {"a": {0: 5}, "b": {0: -4}, "x": -4, "y": 2} and state == {"a": {0: 5}}
+
+    for program, error in [("assert x > 1", AssertionFailed), ("x := 1 / x", Undefined), ("x := y", Undefined),
+                           ("while x > 0 do x := x + 1", IterationLimit)]:
+        try:
+            compile_program(parse(program), max_iterations=5)({"x": 1 if error is IterationLimit else 0})
+        except error:
+            pass
+        else:
+            assert False, program
+
+    ast = parse("if x < ?? then y := ?? else y := ??")
+    ins = [lambda d: d["x"] == 0, lambda d: d["x"] == 1, lambda d: d["x"] == -4]
+    outs = [lambda d: d["y"] == 3, lambda d: d["y"] == 5, lambda d: d["y"] == 3]
+    model = synthesize(ast, lambda _: True, ins, outs, cegis=True, prescreen=prescreen)
+    assert model is not None and STATS["cegis_prescreened"] > 0
+    assert STATS["cegis_candidates"] == STATS["cegis_counterexamples"] + 1
+    assert check_model(ast, model, ins, outs)
+    assert check_model(ast, {"__hole_0": 1, "__hole_1": 3, "__hole_2": 5}, ins, outs)
+    assert check_model(ast, {"__hole_0": 1, "__hole_1": 5, "__hole_2": 3}, ins, outs) is False
+    # y is left open by the inputs, so its assertion cannot be decided
+    assert check_model(parse("assert y > x"), {}, ins, outs) is None
+
+    # a freshly parsed program, which synthesis never saw, names its holes by their positions
+    run = compile_program(parse("x := ??; y := x + 1; if y > ?? then z := 1 else z := 2"),
+                          {"__hole_0": 3, "__hole_1": 10})
+    assert run({}) == {"x": 3, "y": 4, "z": 2}
+    assert get_holes(parse("x := ??; y := ??")) == [Int("__hole_0"), Int("__hole_1")]
+    with pytest.raises(ValueError, match="__hole_1"):
+        compile_program(parse("x := ??; y := ??"), {"__hole_0": 3})
+
+
+def test_vectorized() -> None:
+    np = pytest.importorskip("numpy")
+    states = [{"n": n} for n in [0, 3, 10, -1]]
+    final = vectorized.compile_batch(parse("s := 0; i := 0; while i < n do (s := s + i; i := i + 1)"))(
+        vectorized.Batch.from_states(states))
+    assert [final.state(lane) for lane in range(4)] == [{"n": 0, "s": 0, "i": 0}, {"n": 3, "s": 3, "i": 3},
+                                                         {"n": 10, "s": 45, "i": 10}, {"n": -1, "s": 0, "i": 0}]
+    assert states[0] == {"n": 0}
+
+    pairs = [(a, b) for a in range(-5, 6) for b in range(-3, 4)]
+    final = vectorized.compile_batch(parse("q := a / b; r := a mod b"))(
+        vectorized.Batch.from_states([{"a": a, "b": b} for a, b in pairs]))
+    for lane, (a, b) in enumerate(pairs):
+        if b == 0:
+            assert final.status[lane] == vectorized.UNDEFINED
+        else:
+            assert final.state(lane) == {"a": a, "b": b, "q": smt_div(a, b), "r": smt_mod(a, b)}
+
+    # every lane stops for its own reason, and the others run on
+    program = parse("i := 0; if x > 0 then (while i < x do (a[i] := i * y; i := i + 1)) else y := 1 / x; "
+                    "assert a[x - 1] != 4")
+    states = [{"x": 3, "y": 1, "a": {}}, {"x": 3, "y": 2, "a": {}}, {"x": 0, "y": 1, "a": {}},
+              {"x": -1, "y": 1, "a": {}}, {"x": 9, "y": 1, "a": {}}, {"x": 3, "y": 2 ** 62, "a": {}}]
+    final = vectorized.compile_batch(program, max_iterations=5)(vectorized.Batch.from_states(states))
+    assert final.status.tolist() == [vectorized.RUNNING, vectorized.FAILED, vectorized.UNDEFINED,
+                                     vectorized.UNDEFINED, vectorized.LIMIT, vectorized.UNDEFINED]
+    assert final.state(0) == {"x": 3, "y": 1, "i": 3, "a": {0: 0, 1: 1, 2: 2}}
+
+    ast = parse("y := (?? * x) + ??")
+    ins = [(lambda x: lambda d: d["x"] == x)(x) for x in range(-50, 50)]
+    outs = [(lambda x: lambda d: d["y"] == 2 * x + 1)(x) for x in range(-50, 50)]
+    model = synthesize(ast, lambda _: True, ins[:10], outs[:10], cegis=True, prescreen=vectorized.prescreen)
+    assert model is not None and STATS["cegis_prescreened"] > 0
+    assert STATS["cegis_candidates"] == STATS["cegis_counterexamples"] + 1
+    assert vectorized.check_examples(ast, model, ins, outs)[0].all()
+    passed, failed = vectorized.check_examples(ast, {"__hole_0": 2, "__hole_1": 1}, ins, outs)
+    assert passed.all() and not failed.any()
+    passed, failed = vectorized.check_examples(ast, {"__hole_0": 2, "__hole_1": 1}, ins,
+                                               outs[:-1] + [lambda d: d["y"] > 1000])
+    assert passed.sum() == 99 and np.flatnonzero(failed).tolist() == [99]
+    passed, failed = vectorized.check_examples(ast, {"__hole_0": 0, "__hole_1": 1}, ins, outs)
+    assert np.flatnonzero(passed).tolist() == [50] and failed.sum() == 99
+
+
+def test_vectorized_matches_interpreter() -> None:
+    pytest.importorskip("numpy")
+    programs = [
+        "b := true; if b then x := 1 else x := 2",
+        "b := x < y; if not b then z := x else z := y",
+        "b := (x > 0) and (y > 0); c := b or (x = y); if c then z := 1 else z := 0; assert not (b and (z = 0))",
+        "b := false; i := 0; while not b do (i := i + 1; b := i >= x)",
+        "b := x > y; d := not b; assert b or d; if d and (y > 0) then z := y / x else z := 0",
+        "b := x = 1; c := b; while c do (c := false; y := y + 1); assert not c",
+        "b := x != y; if b then assert x != y else skip; b := not (not b); assert b = (x != y)",
+    ]
+    states = [{"x": x, "y": y} for x in [-2, 0, 1, 2, 30] for y in [-1, 0, 1, 2]]
+    errors = {AssertionFailed: vectorized.FAILED, Undefined: vectorized.UNDEFINED, IterationLimit: vectorized.LIMIT}
+    for program in programs:
+        ast = parse(program)
+        run, run_batch = compile_program(ast, max_iterations=20), vectorized.compile_batch(ast, max_iterations=20)
+        final = run_batch(vectorized.Batch.from_states(states))
+        for lane, state in enumerate(states):
+            try:
+                expected, status = run(state), vectorized.RUNNING
+            except tuple(errors) as e:
+                expected, status = None, errors[type(e)]
+            assert final.status[lane] == status, (program, state)
+            if expected is not None:
+                # booleans come back as 0 and 1
+                assert final.state(lane) == expected, (program, state)
+
+    # holes are named by their positions in a program that was not synthesized
+    final = vectorized.compile_batch(parse("x := ??; b := x > ??"), {"__hole_0": 3, "__hole_1": 2})(
+        vectorized.Batch.from_states([{}]))
+    assert final.state(0) == {"x": 3, "b": True}
+    with pytest.raises(ValueError, match="__hole_1"):
+        vectorized.compile_batch(parse("x := ??; b := x > ??"), {"__hole_0": 3})
@@ -0,0 +1,553 @@
+"""
+Vectorized evaluation of While programs over batches of states, with NumPy.
+A batch keeps a column for every scalar variable and for every array cell, with a lane for
+each state, and a program compiled once runs on all the lanes at the same time: the branches
+of an `if` run under complementary masks of the lanes, and a `while` iterates as long as some
+lane enters its body, counting the iterations of every lane. A lane that fails an assertion,
+reads a value its state does not give, divides by zero, overflows 64 bits or loops too long
+stops there, and its status says why.
+
+`check_examples` checks a model against thousands of PBEs at once, and `prescreen` screens
+the candidates of counterexample-guided synthesis like `interp.prescreen`
+(`synthesize(..., cegis=True, prescreen=vectorized.prescreen)`).
+NumPy is optional: without it, `prescreen` is `interp.prescreen`.
+"""
+import collections
+import operator
+import typing
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, see `prescreen`
+    np = None
+
+from z3 import (Ast, ModelRef, is_and, is_array, is_const, is_eq, is_false, is_int_value, is_true, simplify,
+                substitute)
+
+import interp
+from interp import MAX_ITERATIONS, Screen, State, holds, pbe_states, pinned_values, sample_states, state_env
+from syntax.tree import Tree
+from wp import (Env, Formula, Invariant, STATS, get_hole_values, get_holes, get_id, hole_names, mk_program_env,
+                summarize)
+
+SAMPLES = 256
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+# the status of a lane
+RUNNING, FAILED, UNDEFINED, LIMIT = range(4)
+
+# the values of the lanes, and the lanes whose value is known
+Column: typing.TypeAlias = tuple["np.ndarray", "np.ndarray"]
+Operation: typing.TypeAlias = typing.Callable[["np.ndarray", "np.ndarray"], tuple["np.ndarray", "np.ndarray | bool"]]
+
+
+def to_column(values: list[int | None]) -> Column:
+    """
+    A column of Python integers, where None, or a value beyond 64 bits, is unknown.
+    """
+    known = [v is not None and INT64_MIN <= v <= INT64_MAX for v in values]
+    return (np.array([v if k else 0 for v, k in zip(values, known)], np.int64),
+            np.array(known, bool))
+
+
+def truth(column: Column) -> Column:
+    """
+    The truth values of a column as a mask. A boolean variable is stored in an integer column,
+    once it is merged with the column it is assigned to, so its values are tested against zero.
+    """
+    values, known = column
+    return values != 0, known
+
+
+def choose(mask: "np.ndarray", then_column: Column, else_column: Column) -> Column:
+    return np.where(mask, then_column[0], else_column[0]), np.where(mask, then_column[1], else_column[1])
+
+
+class Cells:
+    """
+    An array over a batch: a column for every index some lane has a value at, and the default
+    of the lanes, where they have one, for the other indices.
+    Columns are never modified in place, so copies of the array share them.
+    """
+
+    def __init__(self, columns: dict[int, Column], default: Column):
+        self.columns = columns
+        self.default = default
+
+    def copy(self) -> "Cells":
+        return Cells(dict(self.columns), self.default)
+
+    def cell(self, index: int) -> Column:
+        return self.columns.get(index, self.default)
+
+    def select(self, index: "np.ndarray", mask: "np.ndarray") -> Column:
+        values, known = np.zeros_like(index), np.zeros_like(mask)
+        for i in np.unique(index[mask]).tolist():
+            lanes = mask & (index == i)
+            values, known = choose(lanes, self.cell(i), (values, known))
+        return values, known
+
+    def store(self, index: "np.ndarray", values: "np.ndarray", mask: "np.ndarray") -> None:
+        for i in np.unique(index[mask]).tolist():
+            lanes = mask & (index == i)
+            cell_values, cell_known = self.cell(i)
+            self.columns[i] = np.where(lanes, values, cell_values), cell_known | lanes
+
+    def where(self, mask: "np.ndarray", other: "Cells") -> "Cells":
+        """
+        The cells of this array on the lanes of the mask, and of the other array elsewhere.
+        """
+        return Cells({i: choose(mask, self.cell(i), other.cell(i)) for i in self.columns.keys() | other.columns.keys()},
+                     choose(mask, self.default, other.default))
+
+
+class Batch:
+    """
+    The states of a batch of lanes: a column for every scalar variable, `Cells` for every
+    array, and the status of every lane.
+    """
+
+    def __init__(self, size: int, variables: dict[str, Column | Cells], status: "np.ndarray | None" = None):
+        self.size = size
+        self.variables = variables
+        self.status = np.full(size, RUNNING, np.int8) if status is None else status
+
+    @classmethod
+    def from_states(cls, states: list[State]) -> "Batch":
+        """
+        The batch of concrete states, as `interp` represents them; a variable one state does
+        not give is unknown on its lane.
+        """
+        variables = {}
+        for name in sorted({name for state in states for name in state}):
+            values = [state.get(name) for state in states]
+            if not any(isinstance(value, dict) for value in values):
+                variables[name] = to_column(values)
+                continue
+            arrays = [value if isinstance(value, dict) else {} for value in values]
+            defaults = [getattr(cells, "default_factory", None) for cells in arrays]
+            variables[name] = Cells({i: to_column([cells.get(i) for cells in arrays])
+                                     for i in sorted({i for cells in arrays for i in cells})},
+                                    to_column([None if default is None else default() for default in defaults]))
+        return cls(len(states), variables)
+
+    def copy(self) -> "Batch":
+        return Batch(self.size, {name: variable.copy() if isinstance(variable, Cells) else variable
+                                 for name, variable in self.variables.items()}, self.status.copy())
+
+    def state(self, lane: int) -> State:
+        """
+        The concrete state of a lane.
+        """
+        state = {}
+        for name, variable in self.variables.items():
+            if isinstance(variable, Cells):
+                default_values, default_known = variable.default
+                cells = {} if not default_known[lane] else \
+                    collections.defaultdict(lambda value=int(default_values[lane]): value)
+                for index, (values, known) in variable.columns.items():
+                    if known[lane]:
+                        cells[index] = int(values[lane])
+                state[name] = cells
+            elif variable[1][lane]:
+                state[name] = int(variable[0][lane])
+        return state
+
+    def constant(self, value: int | bool) -> Column:
+        values, known = (np.array([value]), np.array([True])) if isinstance(value, bool) else to_column([value])
+        return np.broadcast_to(values, self.size), np.broadcast_to(known, self.size)
+
+    def column(self, name: str) -> Column:
+        if name in self.variables:
+            return self.variables[name]
+        return np.zeros(self.size, np.int64), np.zeros(self.size, bool)
+
+    def cells(self, name: str) -> Cells:
+        if name not in self.variables:
+            self.variables[name] = Cells({}, (np.zeros(self.size, np.int64), np.zeros(self.size, bool)))
+        return self.variables[name]
+
+    def running(self) -> "np.ndarray":
+        return self.status == RUNNING
+
+    def stop(self, lanes: "np.ndarray", status: int) -> None:
+        self.status[lanes & self.running()] = status
+
+    def defined(self, mask: "np.ndarray", known: "np.ndarray") -> "np.ndarray":
+        """
+        Stop the lanes of the mask whose value is unknown, and return the others.
+        """
+        self.stop(mask & ~known, UNDEFINED)
+        return mask & known
+
+
+def add(a: "np.ndarray", b: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    result = a + b
+    return result, ((a ^ result) & (b ^ result)) >= 0
+
+
+def sub(a: "np.ndarray", b: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    result = a - b
+    return result, ((a ^ b) & (a ^ result)) >= 0
+
+
+def mul(a: "np.ndarray", b: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    result = a * b
+    return result, (a == 0) | (result // np.where(a == 0, 1, a) == b) & ~((a == -1) & (b == INT64_MIN))
+
+
+def smt_div(a: "np.ndarray", b: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    # as `peval.smt_div`: the quotient of `a` by `|b|` rounds down, so the remainder is never negative
+    divisor = np.where(b == 0, 1, b)
+    return (np.floor_divide(a, np.abs(divisor)) * np.sign(divisor),
+            (b != 0) & (b != INT64_MIN) & ~((a == INT64_MIN) & (b == -1)))
+
+
+def smt_mod(a: "np.ndarray", b: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    divisor = np.where(b == 0, 1, b)
+    return np.mod(a, np.abs(divisor)), (b != 0) & (b != INT64_MIN)
+
+
+def exact(op: typing.Callable[[typing.Any, typing.Any], typing.Any]) -> Operation:
+    return lambda a, b: (op(a, b), True)
+
+
+OPERATIONS: dict[str, Operation] = {
+    "+": add,
+    "-": sub,
+    "*": mul,
+    "/": smt_div,
+    "mod": smt_mod,
+    "!=": exact(operator.ne),
+    ">": exact(operator.gt),
+    "<": exact(operator.lt),
+    "<=": exact(operator.le),
+    ">=": exact(operator.ge),
+    "=": exact(operator.eq),
+}
+
+Expression: typing.TypeAlias = typing.Callable[[Batch, "np.ndarray"], Column]
+Command: typing.TypeAlias = typing.Callable[[Batch, "np.ndarray"], None]
+
+
+class Compiler:
+    """
+    Compiles the nodes of a program AST, like `interp.Compiler`, to functions of a batch and
+    of a mask of the running lanes to evaluate or execute them on.
+    """
+
+    def __init__(self, ast: Tree, holes: dict[str, int], max_iterations: int):
+        self.arrays = summarize(ast).array_ids
+        self.holes = holes
+        self.hole_names = hole_names(ast)
+        self.max_iterations = max_iterations
+        self.compiled: dict[int, Expression | Command] = {}
+
+    def hole_value(self, hole: Tree) -> int:
+        name = self.hole_names[id(hole)]
+        if name not in self.holes:
+            raise ValueError(f"no value for the hole {name}")
+        return self.holes[name]
+
+    def expr(self, ast: Tree) -> Expression:
+        if id(ast) not in self.compiled:
+            self.compiled[id(ast)] = self.compile_expr(ast)
+        return self.compiled[id(ast)]
+
+    def command(self, ast: Tree) -> Command:
+        if id(ast) not in self.compiled:
+            self.compiled[id(ast)] = self.compile_command(ast)
+        return self.compiled[id(ast)]
+
+    def compile_expr(self, ast: Tree) -> Expression:
+        match ast.root, ast.subtrees:
+            case "id", _:
+                name = get_id(ast)
+                return lambda batch, mask: batch.column(name)
+            case "num", [num_tree]:
+                value = int(num_tree.root)
+                return lambda batch, mask: batch.constant(value)
+            case "true", _:
+                return lambda batch, mask: batch.constant(True)
+            case "false", _:
+                return lambda batch, mask: batch.constant(False)
+            case "hole", _:
+                value = self.hole_value(ast)
+                return lambda batch, mask: batch.constant(value)
+            case "array", [id, idx]:
+                name, index = get_id(id), self.expr(idx)
+
+                def select(batch: Batch, mask: "np.ndarray") -> Column:
+                    values, known = index(batch, mask)
+                    return batch.cells(name).select(values, mask & known)
+
+                return select
+            case "not", [cond]:
+                operand = self.expr(cond)
+
+                def negate(batch: Batch, mask: "np.ndarray") -> Column:
+                    values, known = operand(batch, mask)
+                    return values == 0, known
+
+                return negate
+            case "and", [l, r]:
+                left, right = self.expr(l), self.expr(r)
+
+                def conjunction(batch: Batch, mask: "np.ndarray") -> Column:
+                    # the right operand only matters, and is only evaluated, where the left one holds
+                    left_values, left_known = truth(left(batch, mask))
+                    right_values, right_known = truth(right(batch, mask & left_known & left_values))
+                    return left_values & right_values, left_known & (~left_values | right_known)
+
+                return conjunction
+            case "or", [l, r]:
+                left, right = self.expr(l), self.expr(r)
+
+                def disjunction(batch: Batch, mask: "np.ndarray") -> Column:
+                    left_values, left_known = truth(left(batch, mask))
+                    right_values, right_known = truth(right(batch, mask & left_known & ~left_values))
+                    return left_values | right_values, left_known & (left_values | right_known)
+
+                return disjunction
+            case op, [l, r]:
+                left, right, operation = self.expr(l), self.expr(r), OPERATIONS[op]
+
+                def apply(batch: Batch, mask: "np.ndarray") -> Column:
+                    (left_values, left_known), (right_values, right_known) = left(batch, mask), right(batch, mask)
+                    values, ok = operation(left_values, right_values)
+                    return values, left_known & right_known & ok
+
+                return apply
+            case _:
+                assert False, f"Unknown expression AST node: {ast}"
+
+    def compile_command(self, ast: Tree) -> Command:
+        match ast.root, ast.subtrees:
+            case "skip", _:
+                return lambda batch, mask: None
+            case ":=", [x, e] if x.root == "array":
+                name, index, value = get_id(x.subtrees[0]), self.expr(x.subtrees[1]), self.expr(e)
+
+                def assign(batch: Batch, mask: "np.ndarray") -> None:
+                    (index_values, index_known), (values, known) = index(batch, mask), value(batch, mask)
+                    mask = batch.defined(mask, index_known & known)
+                    batch.cells(name).store(index_values, values, mask)
+
+                return assign
+            case ":=", [x, e]:
+                name = get_id(x)
+                if name in self.arrays:
+                    source = get_id(e)
+
+                    def copy_array(batch: Batch, mask: "np.ndarray") -> None:
+                        batch.variables[name] = batch.cells(source).where(mask, batch.cells(name))
+
+                    return copy_array
+                value = self.expr(e)
+
+                def assign(batch: Batch, mask: "np.ndarray") -> None:
+                    values, known = value(batch, mask)
+                    mask = batch.defined(mask, known)
+                    old_values, old_known = batch.column(name)
+                    batch.variables[name] = np.where(mask, values, old_values), old_known | mask
+
+                return assign
+            case ";", _:
+                commands = []
+                while ast.root == ";":
+                    commands.append(self.command(ast.subtrees[0]))
+                    ast = ast.subtrees[1]
+                commands.append(self.command(ast))
+
+                def sequence(batch: Batch, mask: "np.ndarray") -> None:
+                    for command in commands:
+                        mask = mask & batch.running()
+                        if not mask.any():
+                            return
+                        command(batch, mask)
+
+                return sequence
+            case "if", [cond, then_branch, else_branch]:
+                test, then_command, else_command = self.expr(cond), self.command(then_branch), self.command(else_branch)
+
+                def branch(batch: Batch, mask: "np.ndarray") -> None:
+                    values, known = truth(test(batch, mask))
+                    mask = batch.defined(mask, known)
+                    # the masks are disjoint, so neither branch stops lanes of the other
+                    for command, lanes in [(then_command, mask & values), (else_command, mask & ~values)]:
+                        if lanes.any():
+                            command(batch, lanes)
+
+                return branch
+            case "while", [cond, body]:
+                test, body_command, max_iterations = self.expr(cond), self.command(body), self.max_iterations
+
+                def loop(batch: Batch, mask: "np.ndarray") -> None:
+                    iterations = np.zeros(batch.size, np.int64)
+                    while True:
+                        values, known = truth(test(batch, mask))
+                        mask = batch.defined(mask, known) & values
+                        batch.stop(mask & (iterations >= max_iterations), LIMIT)
+                        mask &= batch.running()
+                        if not mask.any():
+                            return
+                        iterations += mask
+                        body_command(batch, mask)
+                        mask &= batch.running()
+
+                return loop
+            case "assert", [cond]:
+                test = self.expr(cond)
+
+                def check(batch: Batch, mask: "np.ndarray") -> None:
+                    values, known = truth(test(batch, mask))
+                    batch.stop(batch.defined(mask, known) & ~values, FAILED)
+
+                return check
+            case _:
+                assert False, f"Unknown command AST node: {ast}"
+
+
+def compile_batch(ast: Tree, holes: dict[str, int] | ModelRef | None = None,
+                  max_iterations: int = MAX_ITERATIONS) -> typing.Callable[[Batch], Batch]:
+    """
+    Compile a program AST, with the values of its holes given by a model or by a dict from the
+    names of the hole variables, to a function from a batch of initial states to the batch of
+    their final states. The lanes that stop are `FAILED` (an assertion), `LIMIT` (more than
+    `max_iterations` iterations of a loop) or `UNDEFINED`; the initial batch is not modified.
+    The holes of a program that `synthesize` has not seen are named `__hole_0`, `__hole_1`, ...
+    in preorder, as it would name them. Raises `ValueError` if the dict has no value for a hole.
+    """
+    if isinstance(holes, ModelRef):
+        holes = get_hole_values(holes, get_holes(ast))
+    program = Compiler(ast, holes or {}, max_iterations).command(ast)
+
+    def run(batch: Batch) -> Batch:
+        batch = batch.copy()
+        mask = batch.running()
+        if mask.any():
+            with np.errstate(all="ignore"):  # overflows are checked for, and stop their lanes
+                program(batch, mask)
+        return batch
+
+    return run
+
+
+def equalities(formula: Ast) -> dict[str, int] | None:
+    values = {}
+    for conjunct in formula.children() if is_and(formula) else [formula]:
+        if not is_eq(conjunct):
+            return None
+        var, value = conjunct.children()
+        if is_int_value(var):
+            var, value = value, var
+        if not is_const(var) or is_int_value(var) or not is_int_value(value) \
+                or values.setdefault(var.decl().name(), value.as_long()) != value.as_long():
+            return None
+    return values
+
+
+def pinned_conjunction(formula: Formula) -> dict[str, int] | None:
+    """
+    The values a formula fixes the variables to, if it is nothing but a conjunction of
+    equalities of variables to values. PBEs usually are, and are read without simplifying them.
+    """
+    if isinstance(formula, bool):
+        return {} if formula else None
+    values = equalities(formula)
+    if values is None:
+        formula = simplify(formula)
+        values = {} if is_true(formula) else equalities(formula)
+    return values
+
+
+def pinned_state(ast: Tree, input: Invariant, env: Env) -> State | None:
+    """
+    The state `interp.pbe_states` gives a PBE input, if the input holds on it.
+    """
+    values = pinned_conjunction(input(env))
+    if values is not None:
+        return {name: collections.defaultdict(int) if is_array(value) else 0 for name, value in env.items()} | values
+    state = pbe_states(ast, [input])[0]
+    return state if holds(input, state, env) else None
+
+
+class Expectations:
+    """
+    The PBE outputs of the lanes of a batch: the values that the outputs that are conjunctions
+    of equalities fix, as a batch, and the other outputs, which are checked one lane at a time.
+    """
+
+    def __init__(self, outputs: list[Invariant], env: Env):
+        pinned = [pinned_conjunction(output(env)) for output in outputs]
+        self.env = env
+        self.values = Batch.from_states([values or {} for values in pinned])
+        self.others = [(lane, output) for lane, (output, values) in enumerate(zip(outputs, pinned)) if values is None]
+
+    def check(self, final: Batch) -> tuple["np.ndarray", "np.ndarray"]:
+        """
+        The lanes of a final batch that pass their PBEs, and the lanes that fail them.
+        """
+        running = final.running()
+        passed, failed = running.copy(), final.status == FAILED
+        for name, (values, pinned) in self.values.variables.items():
+            actual, known = final.column(name)
+            failed |= running & pinned & known & (actual != values)
+            passed &= ~pinned | known & (actual == values)
+        for lane, output in self.others:
+            if running[lane]:
+                result = holds(output, final.state(lane), self.env)
+                passed[lane], failed[lane] = result is True, result is False
+        return passed, failed
+
+
+def check_examples(ast: Tree, model: ModelRef | dict[str, int], inputs: list[Invariant], outputs: list[Invariant],
+                   max_iterations: int = MAX_ITERATIONS) -> tuple["np.ndarray", "np.ndarray"]:
+    """
+    Check the model of a program against PBEs like `interp.check_model`, on all of them at
+    once. Returns a vector of the PBEs it passes and a vector of the PBEs it fails; a PBE in
+    neither is undecided.
+    """
+    env = mk_program_env(ast)
+    states = []
+    for input in inputs:
+        values = pinned_conjunction(input(env))
+        states.append(pinned_values(input(env)) if values is None else values)
+    batch = Batch.from_states(states)
+    return Expectations(outputs, env).check(compile_batch(ast, model, max_iterations)(batch))
+
+
+def prescreen(ast: Tree, inputs: list[Invariant], outputs: list[Invariant], free_vars: list[Ast],
+              formula: Formula) -> Screen:
+    """
+    Build a screen for the candidates of counterexample-guided synthesis, like
+    `interp.prescreen`, that runs a candidate on the states the PBE inputs fix, or without PBEs
+    on `SAMPLES` random states, all at once.
+    """
+    if np is None:
+        return interp.prescreen(ast, inputs, outputs, free_vars, formula)
+    env = mk_program_env(ast)
+    if {str(v) for v in free_vars} != env.keys():
+        # the variables are not the program's (see `wp.mk_search_env`), so states do not map to them
+        return lambda candidate: None
+
+    if inputs:
+        screened = [(pinned_state(ast, input, env), output) for input, output in zip(inputs, outputs)]
+        screened = [(state, output) for state, output in screened if state is not None]
+    else:
+        screened = [(state, lambda _: True) for state in sample_states(ast, SAMPLES)]
+    states = [state for state, _ in screened]
+    batch, expectations = Batch.from_states(states), Expectations([output for _, output in screened], env)
+
+    def screen(candidate: ModelRef) -> Formula | None:
+        _, failed = expectations.check(compile_batch(ast, candidate)(batch))
+        for lane in np.flatnonzero(failed).tolist():
+            terms = state_env(states[lane], env)
+            instance = substitute(formula, *[(v, terms[str(v)]) for v in free_vars])
+            # the evaluator is only trusted as far as the formula agrees with it
+            if is_false(candidate.eval(instance, model_completion=True)):
+                STATS["cegis_prescreened"] += 1
+                return instance
+        return None
+
+    return screen
@@ -1,10 +1,18 @@
+import contextvars
+import functools
+import itertools
+import multiprocessing
 import operator
+import os
 import typing
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
 from typing import Union
 
 from z3 import Int, IntVal, Implies, Not, And, Or, Solver, unsat, sat, Ast, ForAll, Array, IntSort, Store, \
-    Select, is_array, ModelRef
+    Select, is_array, ModelRef, substitute, Bool, ExprRef, If, is_int_value
 
+from cache import MISS, ResultCache, default_cache
 from syntax.tree import Tree
 from syntax.while_lang import parse
 
@@ -15,8 +23,12 @@ Invariant: typing.TypeAlias = typing.Callable[[Env], Formula]
 
 MAX_UNFOLDING = 10
 TIMEOUT = 2000
+EXPR_CACHE_SIZE = 1 << 14
+MAX_DEPTH_VECTORS = 100
+CEGIS_MAX_ITERATIONS = 100
 
 INVARIANT_KEY = "linv"
+DAG_KEY = "__dag__"
 
 OP = {
     "+": operator.add,
@@ -34,6 +46,89 @@ OP = {
     "or": Or,
 }
 
+class Run:
+    """
+    The state of a synthesis or verification run: its counters, the transformers built by `wp`,
+    keyed by the ids of their AST node and postcondition, the least recently used
+    translations of compound expressions, keyed by the id of the expression node and the ids
+    of the terms of the variables and holes it reads, and the unrollings of loops, keyed by the
+    ids of their condition and body. The entries keep the nodes and the terms alive, so that
+    their ids are not reused.
+    Every run has its own, so runs in different threads do not share or evict each other's entries.
+    """
+
+    def __init__(self):
+        self.stats: Counter = Counter()
+        self.wp_cache: dict[tuple[int, int], tuple[Tree, Invariant, Invariant]] = {}
+        self.expr_cache: OrderedDict[tuple, tuple[Tree, tuple, Formula]] = OrderedDict()
+        self.unrollings: dict[tuple[int, int], tuple[Tree, Tree, list[Tree]]] = {}
+
+
+_current_run: contextvars.ContextVar[Run] = contextvars.ContextVar("run")
+
+
+def current_run() -> Run:
+    """
+    The run of the current thread (or context), which `synthesize` and `verify` start afresh.
+    """
+    try:
+        return _current_run.get()
+    except LookupError:
+        return reset_run()
+
+
+def reset_run() -> Run:
+    """
+    Start a new run in the current thread, forgetting the counters, the cached transformers
+    and the cached expressions of the previous one.
+    """
+    run = Run()
+    _current_run.set(run)
+    return run
+
+
+class RunStats(MutableMapping):
+    """
+    The counters of the current run, such as `unfolding_depth` or `cegis_iterations`,
+    with missing counters read as 0.
+    """
+
+    def __getitem__(self, key: str) -> int:
+        return current_run().stats[key]
+
+    def __setitem__(self, key: str, value: int) -> None:
+        current_run().stats[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del current_run().stats[key]
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(current_run().stats)
+
+    def __len__(self) -> int:
+        return len(current_run().stats)
+
+    def __repr__(self) -> str:
+        return repr(current_run().stats)
+
+    def clear(self) -> None:
+        current_run().stats.clear()
+
+    def copy(self) -> Counter:
+        return current_run().stats.copy()
+
+    def update(self, counts: typing.Mapping[str, int]) -> None:
+        """
+        Add counts to the counters, like `Counter.update`.
+        """
+        current_run().stats.update(counts)
+
+
+STATS = RunStats()
+"""
+Counters describing the last synthesis run of the current thread (reset by `synthesize` and `verify`).
+"""
+
 
 def get_unique_id(env: Env, var: str) -> str:
     """
@@ -52,6 +147,14 @@ def mk_env(pvars: set[PVar], parrays: set[PVar]) -> Env:
     return {v: Int(v) for v in pvars} | {v: Array(v, IntSort(), IntSort()) for v in parrays}
 
 
+def mk_program_env(ast: Tree) -> Env:
+    """
+    Create an environment with the variables of a program AST.
+    """
+    summary = summarize(ast)
+    return mk_env(summary.non_array_ids, summary.array_ids)
+
+
 def upd(d: Env, k: PVar, v: Formula) -> Env:
     """
     Update the value of a key in the environment.
@@ -69,30 +172,189 @@ def get_id(ast: Tree) -> str:
     return ast.subtrees[0].root
 
 
-def get_all_ids(ast: Tree) -> set[str]:
+class Summary(typing.NamedTuple):
+    ids: frozenset[str]
+    array_ids: frozenset[str]
+    reads: frozenset[str]
+    writes: frozenset[str]
+    holes: tuple[Tree, ...]
+    loops: bool
+
+    @property
+    def non_array_ids(self) -> frozenset[str]:
+        return self.ids - self.array_ids
+
+
+NO_IDS: frozenset[str] = frozenset()
+LEAF_SUMMARY = Summary(NO_IDS, NO_IDS, NO_IDS, NO_IDS, (), False)
+
+
+def union(sets: list[frozenset[str]]) -> frozenset[str]:
+    """
+    Union of sets, reusing the set itself when at most one of them is not empty.
+    """
+    non_empty = [s for s in sets if s]
+    if len(non_empty) <= 1:
+        return non_empty[0] if non_empty else NO_IDS
+    return non_empty[0].union(*non_empty[1:])
+
+
+def summarize_node(ast: Tree, subtrees: list[Summary]) -> Summary:
+    """
+    Summarize an AST node given the summaries of its subtrees.
+    """
+    match ast.root, ast.subtrees:
+        case "id", [name]:
+            ids = frozenset([name.root])
+            return Summary(ids, NO_IDS, ids, NO_IDS, (), False)
+        case "array", [id, _]:
+            index = subtrees[1]
+            name = get_id(id)
+            return Summary(index.ids | {name}, index.array_ids | {name}, index.reads | {name}, index.writes,
+                           index.holes, index.loops)
+        case "hole", _:
+            return Summary(NO_IDS, NO_IDS, NO_IDS, NO_IDS, (ast,), False)
+        case ":=", [x, _]:
+            target, value = subtrees
+            # the target of a scalar assignment is only written; an array is updated in place
+            reads = union([target.reads, value.reads]) if x.root == "array" else value.reads
+            writes = frozenset([get_id(x.subtrees[0] if x.root == "array" else x)])
+            return Summary(union([target.ids, value.ids]), union([target.array_ids, value.array_ids]), reads,
+                           writes, target.holes + value.holes, False)
+    return Summary(union([s.ids for s in subtrees]), union([s.array_ids for s in subtrees]),
+                   union([s.reads for s in subtrees]), union([s.writes for s in subtrees]),
+                   tuple(hole for s in subtrees for hole in s.holes),
+                   ast.root == "while" or any(s.loops for s in subtrees))
+
+
+def summarize(ast: Tree) -> Summary:
+    """
+    Get the identifiers, the variables read and written, and the hole nodes of an AST.
+    Every inner node of the AST is annotated with its summary in a single bottom-up pass,
+    as ASTs are not modified once parsed; leaves are all summarized by LEAF_SUMMARY.
+    """
+    if not ast.subtrees:
+        return LEAF_SUMMARY
+    if getattr(ast, "summary", None) is None:
+        stack = [(ast, False)]
+        while stack:
+            node, ready = stack.pop()
+            if ready:
+                node.summary = summarize_node(node, [summarize(s) for s in node.subtrees])
+            elif node.subtrees and getattr(node, "summary", None) is None:
+                stack.append((node, True))
+                stack.extend((s, False) for s in node.subtrees)
+    return ast.summary
+
+
+def get_all_ids(ast: Tree) -> frozenset[str]:
     """
     Get all identifiers from an AST.
     """
-    return {get_id(ast) for ast in ast.nodes if ast.root == "id"}
+    return summarize(ast).ids
 
 
-def get_array_ids(ast: Tree) -> set[str]:
+def get_array_ids(ast: Tree) -> frozenset[str]:
     """
     Get all array identifiers from an AST.
     """
-    return {get_id(ast.subtrees[0]) for ast in ast.nodes if ast.root == "array"}
+    return summarize(ast).array_ids
 
 
-def get_non_array_ids(ast: Tree) -> set[str]:
+def get_non_array_ids(ast: Tree) -> frozenset[str]:
     """
     Get all non-array identifiers from an AST.
     """
-    return get_all_ids(ast) - get_array_ids(ast)
+    return summarize(ast).non_array_ids
+
+
+class ScalarArray(typing.NamedTuple):
+    """
+    The value of an array that is only ever indexed at a fixed set of positions, as one term
+    per position. Reading or writing it at a symbolic index is a case split over the positions.
+    """
+    positions: tuple[int, ...]
+    cells: tuple[Formula, ...]
+
+    @staticmethod
+    def fresh(name: PVar, positions: list[int]) -> "ScalarArray":
+        return ScalarArray(tuple(positions), tuple(Int(f"{name}[{p}]") for p in positions))
+
+    def select(self, index: Formula) -> Formula:
+        if is_int_value(index):
+            return self.cells[self.positions.index(index.as_long())]
+        # the index is one of the positions, so the last case needs no test
+        value = self.cells[-1]
+        for position, cell in reversed(list(zip(self.positions[:-1], self.cells[:-1]))):
+            value = If(index == position, cell, value)
+        return value
+
+    def store(self, index: Formula, value: Formula) -> "ScalarArray":
+        if is_int_value(index):
+            i = self.positions.index(index.as_long())
+            return self._replace(cells=self.cells[:i] + (value,) + self.cells[i + 1:])
+        return self._replace(cells=tuple(If(index == position, value, cell)
+                                         for position, cell in zip(self.positions, self.cells)))
+
+    def join(self, b: Formula, other: "ScalarArray") -> "ScalarArray":
+        return self._replace(cells=tuple(cell if cell.eq(other_cell) else If(b, cell, other_cell)
+                                         for cell, other_cell in zip(self.cells, other.cells)))
+
+
+def select(array: Formula | ScalarArray, index: Formula) -> Formula:
+    return array.select(index) if isinstance(array, ScalarArray) else Select(array, index)
+
+
+def store(array: Formula | ScalarArray, index: Formula, value: Formula) -> Formula | ScalarArray:
+    return array.store(index, value) if isinstance(array, ScalarArray) else Store(array, index, value)
+
+
+def term_key(value: typing.Any) -> typing.Hashable:
+    """
+    Identify the value of a variable; Z3 terms are hash-consed, so equal terms have the same id.
+    """
+    if isinstance(value, ExprRef):
+        return value.get_id()
+    if isinstance(value, ScalarArray):
+        return tuple(cell.get_id() for cell in value.cells)
+    return id(value)
+
+
+ATOMS = frozenset(["id", "num", "hole", "true", "false"])
 
 
 def eval_expr(ast: Tree, env: Env) -> Formula:
     """
     Evaluate an expression AST node.
+    The translation of a compound expression is reused for any environment that gives the
+    variables it reads the same terms, as long as its holes have the same variables.
+    """
+    if ast.root in ATOMS:
+        return translate_expr(ast, env)
+
+    summary = summarize(ast)
+    values = tuple(env[name] for name in summary.reads) + tuple(hole.var for hole in summary.holes)
+    key = (id(ast), *(term_key(v) for v in values))
+    run = current_run()
+    entry = run.expr_cache.get(key)
+    if entry is not None:
+        run.stats["expr_cache_hits"] += 1
+        run.expr_cache.move_to_end(key)
+        return entry[2]
+
+    run.stats["expr_cache_misses"] += 1
+    formula = translate_expr(ast, env)
+    run.expr_cache[key] = (ast, values, formula)
+    if len(run.expr_cache) > EXPR_CACHE_SIZE:
+        run.expr_cache.popitem(last=False)
+        run.stats["expr_cache_evictions"] += 1
+    run.stats["expr_cache_entries"] = len(run.expr_cache)
+    return formula
+
+
+def translate_expr(ast: Tree, env: Env) -> Formula:
+    """
+    Build the Z3 term of an expression AST node.
     """
     match ast.root, ast.subtrees:
         case "id", _:
@@ -100,7 +362,7 @@ def eval_expr(ast: Tree, env: Env) -> Formula:
         case "num", [num_tree]:
             return IntVal(num_tree.root)
         case "array", [id, idx]:
-            return Select(env[get_id(id)], eval_expr(idx, env))
+            return select(env[get_id(id)], eval_expr(idx, env))
         case "hole", _:
             return ast.var
         case "not", [cond]:
@@ -115,9 +377,83 @@ def eval_expr(ast: Tree, env: Env) -> Formula:
             assert False, f"Unknown expression AST node: {ast}"
 
 
+def execute(ast: Tree, env: Env) -> tuple[Env, Formula]:
+    """
+    Symbolically execute a loop-free command AST node forward from an environment.
+    Returns the final environment and the condition for the assertions on the way to hold.
+    The environments of the two branches of an `if` are joined with `If` terms, so whatever
+    follows the `if` is evaluated once rather than once per branch.
+    """
+    match ast.root, ast.subtrees:
+        case "skip", _:
+            return env, True
+        case ":=", [x, e]:
+            if x.root == "array":
+                id = get_id(x.subtrees[0])
+                return upd(env, id, store(env[id], eval_expr(x.subtrees[1], env), eval_expr(e, env))), True
+            if is_array(env[get_id(x)]):
+                assert is_array(env[get_id(e)])
+            return upd(env, get_id(x), eval_expr(e, env)), True
+        case ";", [c1, c2]:
+            mid_env, first = execute(c1, env)
+            final_env, second = execute(c2, mid_env)
+            return final_env, And(first, second)
+        case "if", [cond, then_branch, else_branch]:
+            b = eval_expr(cond, env)
+            then_env, then_asserted = execute(then_branch, env)
+            else_env, else_asserted = execute(else_branch, env)
+            joined = {k: v if v is else_env[k] or (isinstance(v, ExprRef) and v.eq(else_env[k]))
+                      else v.join(b, else_env[k]) if isinstance(v, ScalarArray) else If(b, v, else_env[k])
+                      for k, v in then_env.items()}
+            return joined, And(Implies(b, then_asserted), Implies(Not(b), else_asserted))
+        case "assert", [cond]:
+            return env, eval_expr(cond, env)
+        case _:
+            assert False, f"Unknown loop-free command AST node: {ast}"
+
+
+def env_key(env: Env) -> tuple:
+    """
+    Identify an environment by the identities of its values.
+    """
+    return tuple((k, term_key(v)) for k, v in env.items())
+
+
+def memoize_wp(transformer: Invariant) -> Invariant:
+    """
+    Wrap a transformer so that it is applied once per environment.
+    """
+    results = {}
+
+    def memoized(env: Env) -> Formula:
+        key = env_key(env)
+        if key in results:
+            STATS["wp_results_reused"] += 1
+        else:
+            STATS["wp_closures_evaluated"] += 1
+            # the values are kept so that the ids in the key are not reused
+            results[key] = (tuple(env.values()), transformer(env))
+        return results[key][1]
+
+    return memoized
+
+
 def wp(ast: Tree, Q: Invariant) -> Invariant:
     """
     Compute the weakest precondition of a command AST node.
+    The transformer is built once per node and postcondition in a run.
+    """
+    key = (id(ast), id(Q))
+    run = current_run()
+    if key not in run.wp_cache:
+        run.stats["wp_closures_created"] += 1
+        run.wp_cache[key] = (ast, Q, memoize_wp(build_wp(ast, Q)))
+    return run.wp_cache[key][2]
+
+
+def build_wp(ast: Tree, Q: Invariant) -> Invariant:
+    """
+    Build the weakest precondition transformer of a command AST node.
     """
     match ast.root, ast.subtrees:
         case "skip", _:
@@ -127,7 +463,7 @@ def wp(ast: Tree, Q: Invariant) -> Invariant:
                 def new_Q(env: Env) -> Formula:
                     id = get_id(x.subtrees[0])
                     idx = eval_expr(x.subtrees[1], env)
-                    return Q(upd(env, id, Store(env[id], idx, eval_expr(e, env))))
+                    return Q(upd(env, id, store(env[id], idx, eval_expr(e, env))))
 
                 return new_Q
 
@@ -141,20 +477,31 @@ def wp(ast: Tree, Q: Invariant) -> Invariant:
         case ";", [c1, c2]:
             return wp(c1, wp(c2, Q))
         case "if", [cond, then_branch, else_branch]:
+            Q_then = wp(then_branch, Q)
+            Q_else = wp(else_branch, Q)
+
             def new_Q(env: Env) -> Formula:
+                if env.get(DAG_KEY) and not summarize(ast).loops:
+                    final_env, asserted = execute(ast, env)
+                    return And(asserted, Q(final_env))
                 b = eval_expr(cond, env)
-                Q_then = wp(then_branch, Q)
-                Q_else = wp(else_branch, Q)
                 return Or(And(b, Q_then(env)), And(Not(b), Q_else(env)))
 
             return new_Q
         case "while", [cond, body]:
+            body_Q = wp(body, Q)
+
+            def cond_Q(env: Env) -> Formula:
+                return eval_expr(cond, env)
+
+            body_cond = wp(body, cond_Q)
+
             def new_Q(env: Env) -> Formula:
                 inv = env[INVARIANT_KEY]
 
-                body_vars = {id: Int(get_unique_id(env, id)) for id in get_non_array_ids(body)}
-                body_vars = body_vars | {id: Array(get_unique_id(env, id), IntSort(), IntSort()) for id in
-                                         get_array_ids(body)}
+                # only the variables the body writes change between iterations
+                body_vars = {id: Array(get_unique_id(env, id), IntSort(), IntSort()) if is_array(env[id])
+                             else Int(get_unique_id(env, id)) for id in sorted(summarize(body).writes)}
                 sub_env = env | body_vars
 
                 body_wpi = wp(body, inv)
@@ -168,10 +515,26 @@ def wp(ast: Tree, Q: Invariant) -> Invariant:
                 start_P = inv(sub_env)
                 start_B = eval_expr(cond, sub_env)
 
-                after_one_P = wp(body, inv)(sub_env)
-                after_one_B = wp(body, lambda exp_env: eval_expr(cond, exp_env))(sub_env)
+                after_one_P = body_wp
+                after_one_B = body_cond(sub_env)
 
                 bounded_vars = list(body_vars.values())
+                step = And(
+                    Implies(
+                        And(start_P, start_B, body_wp),
+                        And(
+                            after_one_P,
+                            Or(
+                                double_wp,
+                                Not(after_one_B)
+                            )
+                        )
+                    ),
+                    Implies(
+                        And(after_one_P, Not(after_one_B), body_wp),
+                        body_Q(sub_env)
+                    )
+                )
                 return Or(
                     And(
                         P_init,
@@ -182,25 +545,7 @@ def wp(ast: Tree, Q: Invariant) -> Invariant:
                         P_init,
                         b_init,
                         body_wpi(env),
-                        ForAll(
-                            bounded_vars,
-                            And(
-                                Implies(
-                                    And(start_P, start_B, body_wp),
-                                    And(
-                                        after_one_P,
-                                        Or(
-                                            double_wp,
-                                            Not(after_one_B)
-                                        )
-                                    )
-                                ),
-                                Implies(
-                                    And(after_one_P, Not(after_one_B), body_wp),
-                                    wp(body, Q)(sub_env)
-                                )
-                            )
-                        ) if bounded_vars else True
+                        ForAll(bounded_vars, step) if bounded_vars else step
                     )
                 )
 
@@ -211,24 +556,156 @@ def wp(ast: Tree, Q: Invariant) -> Invariant:
             assert False, f"Unknown command AST node: {ast}"
 
 
-def inner_synthesize(ast: Tree, linv: Invariant, inputs: list[Invariant], outputs: list[Invariant]) -> ModelRef | None:
+def hole_name(index: int) -> str:
+    """
+    The name of the variable of the hole at some position among the holes of a program, in preorder.
+    """
+    return f"__hole_{index}"
+
+
+def hole_names(ast: Tree) -> dict[int, str]:
+    """
+    Get the names of the hole variables of an AST, by the ids of the hole nodes: the variable
+    `synthesize` gave a hole, which unfolded copies of the program keep, or for a hole it has
+    not seen, the name it would give it, from the hole's position.
+    """
+    names = {}
+    for index, node in enumerate(summarize(ast).holes):
+        var = getattr(node, "var", None)
+        names.setdefault(id(node), hole_name(index) if var is None else str(var))
+    return names
+
+
+def get_holes(ast: Tree) -> list[Ast]:
+    """
+    Get the distinct hole variables of an AST, in preorder.
+    """
+    return [Int(name) for name in dict.fromkeys(hole_names(ast).values())]
+
+
+def scalar_array_positions(ast: Tree,
+                           specs: list[Invariant]) -> dict[PVar, tuple[list[int], list[tuple[Ast, list[int]]]]]:
+    """
+    Find the arrays of a loop-free program AST whose every index is a constant or a hole, and
+    which are neither copied as a whole nor read by the specifications. Returns the positions
+    each of them is used at, and the holes indexing it with the positions they may take.
+    Such an array only tells its positions apart by the constant indices, so the holes lose no
+    solution by taking the constants or an unused position: one per hole that is written to,
+    of which the n-th written hole uses at most n + 1, and one more that is only read, which
+    stands for all the positions nothing is written to.
+    """
+    summary = summarize(ast)
+    if summary.loops or not summary.array_ids:
+        return {}
+    constants: dict[PVar, set[int]] = {name: set() for name in summary.array_ids}
+    holes: dict[PVar, dict[str, Ast]] = {name: {} for name in summary.array_ids}
+    written: dict[PVar, dict[str, Ast]] = {name: {} for name in summary.array_ids}
+    excluded = set()
+    seen = set()
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen or not node.subtrees:
+            continue
+        seen.add(id(node))
+        stack.extend(node.subtrees)
+        match node.root, node.subtrees:
+            case "array", [array, idx]:
+                if idx.root == "num":
+                    constants[get_id(array)].add(int(idx.subtrees[0].root))
+                elif idx.root == "hole":
+                    holes[get_id(array)].setdefault(str(idx.var), idx.var)
+                else:
+                    excluded.add(get_id(array))
+            case ":=", [x, e] if x.root == "id" and get_id(x) in constants:
+                excluded.update([get_id(x), get_id(e)])
+            case ":=", [x, _] if x.root == "array" and x.subtrees[1].root == "hole":
+                written[get_id(x.subtrees[0])].setdefault(str(x.subtrees[1].var), x.subtrees[1].var)
+
+    # a specification sees the arrays themselves, so if it reads one of them none is scalarized
+    env = {name: value for name, value in mk_program_env(ast).items() if name not in constants}
+    try:
+        for spec in specs:
+            spec(env)
+    except KeyError:
+        return {}
+
+    found = {}
+    for name in sorted(constants.keys() - excluded):
+        used = sorted(constants[name])
+        read_only = holes[name].keys() - written[name].keys()
+        first_unused = max(used, default=-1) + 1
+        unused = list(range(first_unused, first_unused + len(written[name]) + (1 if read_only else 0)))
+        positions = used + unused
+        order = {key: n for n, key in enumerate(written[name])}
+        found[name] = positions, [(hole, used + unused[:order[key] + 1] if key in order else positions)
+                                  for key, hole in holes[name].items()]
+    return found
+
+
+def mk_search_env(ast: Tree, specs: list[Invariant], scalarize: bool) -> tuple[Env, list[Ast], Formula]:
+    """
+    Create the environment a program AST is searched from, along with its variables and the
+    condition on its holes.
+    With `scalarize`, the arrays found by `scalar_array_positions` are represented by a term per
+    position, and the holes indexing them range over their positions.
+    """
+    env = mk_program_env(ast)
+    variables = {name: [value] for name, value in env.items()}
+    domain = []
+    if scalarize:
+        for name, (positions, holes) in scalar_array_positions(ast, specs).items():
+            env[name] = ScalarArray.fresh(name, positions)
+            variables[name] = list(env[name].cells)
+            domain += [Or([hole == position for position in hole_positions]) for hole, hole_positions in holes]
+            STATS["scalarized_arrays"] += 1
+    return env, [v for name in env for v in variables[name]], And(domain) if domain else True
+
+
+def synthesis_formula(ast: Tree, linv: Invariant, inputs: list[Invariant],
+                      outputs: list[Invariant], dag: bool = False,
+                      scalarize: bool = False) -> tuple[list[Ast], Formula]:
+    """
+    Build the condition the holes of a program AST must satisfy, together with the
+    program variables it has to hold for.
+    With `dag`, loop-free `if`s are encoded by joining the states of their branches, and with
+    `scalarize`, arrays indexed only by constants and holes are encoded without the array theory.
+    """
     assert len(inputs) == len(outputs)
     if not inputs:
         inputs = [lambda _: True]
         outputs = [lambda _: True]
 
-    env = mk_env(get_non_array_ids(ast), get_array_ids(ast))
-    free_vars = list(env.values())
+    env, free_vars, domain = mk_search_env(ast, inputs + outputs, scalarize)
 
     env[INVARIANT_KEY] = linv
+    env[DAG_KEY] = dag
 
-    sub_formula = True
+    # the holes' domain does not depend on the program variables, so it can go under their quantifier
+    sub_formula = domain
     for input, output in zip(inputs, outputs):
         wp_out = wp(ast, output)
         sub_formula = And(sub_formula, Implies(input(env), wp_out(env)))
 
+    return free_vars, sub_formula
+
+
+def mk_solver(solver_params: dict | None = None) -> Solver:
+    """
+    Create a solver with the default timeout and the given extra parameters.
+    """
     s = Solver()
     s.set("timeout", TIMEOUT)
+    for key, value in (solver_params or {}).items():
+        s.set(key, value)
+    return s
+
+
+def inner_synthesize(ast: Tree, linv: Invariant, inputs: list[Invariant], outputs: list[Invariant],
+                     solver_params: dict | None = None, dag: bool = False, scalarize: bool = False) -> ModelRef | None:
+    free_vars, sub_formula = synthesis_formula(ast, linv, inputs, outputs, dag, scalarize)
+
+    s = mk_solver(solver_params)
     s.add(
         ForAll(
             free_vars,
@@ -241,51 +718,427 @@ def inner_synthesize(ast: Tree, linv: Invariant, inputs: list[Invariant], output
         return None
 
 
+Prescreen: typing.TypeAlias = typing.Callable[[Tree, list[Invariant], list[Invariant], list[Ast], Formula],
+                                               typing.Callable[[ModelRef], Formula | None]]
+
+
+def inner_synthesize_cegis(ast: Tree, linv: Invariant, inputs: list[Invariant], outputs: list[Invariant],
+                           solver_params: dict | None = None, dag: bool = False, scalarize: bool = False,
+                           prescreen: Prescreen | None = None) -> ModelRef | None:
+    """
+    Counterexample-guided variant of `inner_synthesize`.
+    Hole values are solved for against a growing set of concrete program states, and every
+    candidate is checked with the holes fixed; a failing check yields the next state.
+    A `prescreen` builds a screen from the program, the PBEs, the variables and the formula;
+    a candidate the screen refutes, by returning an instance of the formula it violates, is
+    not checked.
+    """
+    free_vars, sub_formula = synthesis_formula(ast, linv, inputs, outputs, dag, scalarize)
+    holes = get_holes(ast)
+    screen = None if prescreen is None else prescreen(ast, inputs, outputs, free_vars, sub_formula)
+
+    synth = mk_solver(solver_params)
+    check = mk_solver(solver_params)
+
+    for _ in range(CEGIS_MAX_ITERATIONS):
+        STATS["cegis_iterations"] += 1
+        if synth.check() != sat:
+            return None
+        candidate = synth.model()
+        STATS["cegis_candidates"] += 1
+        refutation = None if screen is None else screen(candidate)
+        if refutation is not None:
+            STATS["cegis_counterexamples"] += 1
+            synth.add(refutation)
+            continue
+
+        check.push()
+        check.add(Not(substitute(sub_formula, *[(h, candidate.eval(h, model_completion=True)) for h in holes])))
+        result = check.check()
+        if result == unsat:
+            return candidate
+        if result != sat:
+            return None
+        counterexample = check.model()
+        check.pop()
+
+        STATS["cegis_counterexamples"] += 1
+        synth.add(substitute(sub_formula, *[(v, counterexample.eval(v, model_completion=True)) for v in free_vars]))
+
+    return None
+
+
+def unroll(cond: Tree, body: Tree, iterations: int, cls: type[Tree]) -> Tree:
+    """
+    Unroll a loop for a given number of iterations: a guarded step per iteration, followed by
+    the assertion that the loop exits. The unrollings of a loop are kept for the run and built
+    from each other, so all the depths searched share one step node and the rest of their chain.
+    """
+    run = current_run()
+    key = (id(cond), id(body))
+    if key not in run.unrollings:
+        run.unrollings[key] = (cond, body, [cls("assert", [cls("not", [cond])])])
+    chain = run.unrollings[key][2]
+    if len(chain) <= iterations:
+        step = chain[1].subtrees[0] if len(chain) > 1 else cls("if", [cond, body, cls("skip", [])])
+        while len(chain) <= iterations:
+            chain.append(cls(";", [step, chain[-1]]))
+    return chain[iterations]
+
+
 def unfold_while(ast: Tree, iterations: int) -> Tree:
     """
     Unfold a while loop for a given number of iterations.
+    Loop-free subtrees are returned as they are instead of being copied, and new nodes are of
+    the class of the program's nodes. The iterations are shared with the other unfoldings of
+    the run (see `unroll`).
     """
+    cls = type(ast)
     if ast.root == "while":
         [cond, body] = ast.subtrees
-        if iterations == 0:
-            return Tree("assert", [Tree("not", [cond])])
-        else:
-            return Tree(";", [Tree("if", [cond, body, Tree("skip", [])]), unfold_while(ast, iterations - 1)])
-    elif ast.root == "hole":
+        return unroll(cond, body, iterations, cls)
+    elif not summarize(ast).loops:
         return ast
-    return Tree(ast.root, [unfold_while(subtree, iterations) for subtree in ast.subtrees])
+    return cls(ast.root, [unfold_while(subtree, iterations) for subtree in ast.subtrees])
+
 
+Path: typing.TypeAlias = tuple[int, ...]
+Depth: typing.TypeAlias = int | tuple[int, ...]
 
-def synthesize(ast: Tree, linv: Invariant, inputs: list[Invariant], outputs: list[Invariant]) -> ModelRef | None:
+
+def loop_paths(ast: Tree) -> list[Path]:
     """
-    Synthesize a model for a program AST node.
+    Get the positions of the loops of an AST in preorder, including loops nested in loop bodies.
+    A position is the sequence of subtree indices leading to the loop from the root.
+    """
+    paths = []
+    stack = [(ast, ())]
+    while stack:
+        node, path = stack.pop()
+        if node.root == "while":
+            paths.append(path)
+        stack.extend((s, path + (i,)) for i, s in reversed(list(enumerate(node.subtrees))) if summarize(s).loops)
+    return paths
+
+
+def unfold_loops(ast: Tree, depths: dict[Path, int], path: Path = ()) -> Tree:
+    """
+    Unfold every loop for its own number of iterations, given by its position; loops without
+    a depth are kept. The body of a loop is unfolded once and then shared by all its iterations,
+    which are unrolled by `unroll`.
+    """
+    if not summarize(ast).loops:
+        return ast
+    cls = type(ast)
+    if ast.root == "while":
+        [cond, body] = ast.subtrees
+        unfolded_body = unfold_loops(body, depths, path + (1,))
+        iterations = depths.get(path, 0)
+        if iterations == 0:
+            return ast if unfolded_body is body else cls("while", [cond, unfolded_body])
+        return unroll(cond, unfolded_body, iterations, cls)
+    subtrees = [unfold_loops(s, depths, path + (i,)) for i, s in enumerate(ast.subtrees)]
+    return ast if all(u is s for u, s in zip(subtrees, ast.subtrees)) else cls(ast.root, subtrees)
+
+
+def depth_vectors(loops: int) -> list[tuple[int, ...]]:
+    """
+    The per-loop depths to search for a program with some number of loops, cheapest first:
+    by total number of unfoldings, then by the largest depth. At most MAX_DEPTH_VECTORS are returned.
+    """
+    def compositions(total: int, parts: int) -> typing.Iterator[tuple[int, ...]]:
+        if parts == 0:
+            if total == 0:
+                yield ()
+            return
+        for first in range(min(total, MAX_UNFOLDING - 1) + 1):
+            for rest in compositions(total - first, parts - 1):
+                yield (first,) + rest
+
+    vectors = []
+    for total in range(loops * (MAX_UNFOLDING - 1) + 1):
+        vectors.extend(sorted(compositions(total, loops), key=lambda v: (max(v, default=0), v)))
+        if len(vectors) >= MAX_DEPTH_VECTORS:
+            return vectors[:MAX_DEPTH_VECTORS]
+    return vectors
+
+
+def depth_plan(ast: Tree, per_loop: bool) -> list[Depth]:
+    """
+    The unfolding depths to search: the same depth for every loop, or with `per_loop`
+    a separate depth for each loop (see `depth_vectors`).
+    """
+    return depth_vectors(len(loop_paths(ast))) if per_loop else list(range(MAX_UNFOLDING))
+
+
+def unfold_to_depth(ast: Tree, depth: Depth) -> Tree:
+    """
+    Get the program searched at a given unfolding depth, where depth 0 keeps the loops.
+    A tuple gives the depth of every loop, in the order of `loop_paths`.
+    """
+    if isinstance(depth, tuple):
+        return unfold_loops(ast, dict(zip(loop_paths(ast), depth)))
+    return ast if depth == 0 else unfold_while(ast, depth)
+
+
+def unfold_for_search(ast: Tree, depth: Depth, prepass: typing.Callable[[Tree], Tree] | None) -> Tree:
+    """
+    Get the program searched at a given unfolding depth, rewritten by the pre-pass if there is one.
+    """
+    unfolded = unfold_to_depth(ast, depth)
+    return unfolded if prepass is None else prepass(unfolded)
+
+
+def hook_name(hook: typing.Callable | None) -> str | None:
+    return None if hook is None else f"{hook.__module__}.{hook.__qualname__}"
+
+
+def incremental_synthesizer() -> typing.Callable[[Tree, Invariant, list[Invariant], list[Invariant]], ModelRef | None]:
+    """
+    Create a replacement for `inner_synthesize` that keeps one solver alive across calls.
+    Every query is asserted behind its own assumption literal, so what the solver learned
+    while refuting one unfolding depth is still available at the next, and subterms common
+    to several depths (the straight-line prefix, the PBE inputs) are internalized once.
+    The solver is reset after a query times out. It is set up with the `solver_params` of
+    the call, and replaced by a fresh one if a call gives different parameters.
+    """
+    s, params = mk_solver(), {}
+    depths = itertools.count()
+
+    def inner(ast: Tree, linv: Invariant, inputs: list[Invariant], outputs: list[Invariant],
+              solver_params: dict | None = None, dag: bool = False, scalarize: bool = False) -> ModelRef | None:
+        nonlocal s, params
+        if (solver_params or {}) != params:
+            # Z3 parameters cannot be unset, so other parameters need another solver
+            s, params = mk_solver(solver_params), dict(solver_params or {})
+        free_vars, sub_formula = synthesis_formula(ast, linv, inputs, outputs, dag, scalarize)
+        guard = Bool(f"__depth_{next(depths)}")
+        s.add(Implies(guard, ForAll(free_vars, sub_formula)))
+        result = s.check(guard)
+        if result == sat:
+            return s.model()
+        if result != unsat:
+            # A timed out search leaves nothing worth reusing, only instantiations that slow down the next depth
+            s = mk_solver(solver_params)
+        return None
+
+    return inner
+
+
+_portfolio_task: typing.Callable[[int, dict], typing.Any] | None = None
+
+
+def _run_portfolio_task(job: tuple[int, dict]) -> tuple[int, typing.Any, Counter]:
+    depth, solver_params = job
+    STATS.clear()
+    return depth, _portfolio_task(depth, solver_params), STATS.copy()
+
+
+def run_portfolio(task: typing.Callable[[int, dict], typing.Any], depths: typing.Iterable[int],
+                  solver_configs: list[dict], workers: int | None = None) -> tuple[int, typing.Any] | None:
+    """
+    Run `task(depth, solver_params)` for every depth and solver configuration in a pool of
+    processes, and return the smallest depth for which some configuration gave a result other
+    than None, along with that result. Tasks still running at that point are killed.
+    The task is handed to the workers by forking, so it does not need to be picklable,
+    but its result does.
+    """
+    global _portfolio_task
+    depths = sorted(depths)
+    jobs = [(depth, solver_params) for depth in depths for solver_params in solver_configs]
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        for depth, solver_params in jobs:
+            result = task(depth, solver_params)
+            if result is not None:
+                return depth, result
+        return None
+
+    pending = {depth: len(solver_configs) for depth in depths}
+    found = {}
+    _portfolio_task = task
+    try:
+        with multiprocessing.get_context("fork").Pool(workers or os.cpu_count()) as pool:
+            for depth, result, stats in pool.imap_unordered(_run_portfolio_task, jobs):
+                STATS.update(stats)
+                pending[depth] -= 1
+                if result is not None:
+                    found.setdefault(depth, result)
+                for d in depths:
+                    if d in found:
+                        return d, found[d]
+                    if pending[d]:
+                        break
+    finally:
+        _portfolio_task = None
+    return None
+
+
+def get_hole_values(model: ModelRef | None, holes: list[Ast]) -> dict[str, int] | None:
+    """
+    Get the values a model assigns to hole variables.
+    """
+    if model is None:
+        return None
+    return {str(h): model.eval(h, model_completion=True).as_long() for h in holes}
+
+
+def model_from_hole_values(values: dict[str, int]) -> ModelRef:
+    """
+    Build a model assigning the given values to hole variables.
+    """
+    s = Solver()
+    s.add(*[Int(name) == value for name, value in values.items()])
+    assert s.check() == sat
+    return s.model()
+
+
+def query_id(ast: Tree, invariants: list[Invariant]) -> list | None:
+    """
+    The part of a cache key that identifies a query: the program and the formulas of its invariants.
+    Returns None if an invariant refers to a variable the program does not mention.
     """
-    holes = [ast for ast in ast.nodes if ast.root == "hole"]
-    for idx, hole in enumerate(holes):
-        hole.var = Int(f'__hole_{idx}')
+    env = mk_program_env(ast)
+    try:
+        formulas = [invariant(env) for invariant in invariants]
+    except KeyError:
+        return None
+    return [[[str(node.root), len(node.subtrees)] for node in ast.nodes],
+            [f.sexpr() if isinstance(f, ExprRef) else repr(f) for f in formulas]]
+
+
+def cached_query(cache: ResultCache, key: str, solve: typing.Callable[[], typing.Any],
+                 encode: typing.Callable, decode: typing.Callable) -> typing.Any:
+    """
+    Get the result of a query from the cache, or solve it and store the encoded result.
+    """
+    value = cache.get(key)
+    if value is not MISS:
+        STATS["cache_hits"] += 1
+        return decode(value)
+    STATS["cache_misses"] += 1
+    result = solve()
+    cache.put(key, encode(result))
+    return result
+
+
+def sequential_solver_params(portfolio: bool, solver_configs: list[dict] | None) -> dict | None:
+    """
+    The solver parameters of a search that is not a portfolio: the only configuration, if there is one.
+    """
+    if portfolio or not solver_configs:
+        return None
+    if len(solver_configs) > 1:
+        raise ValueError("several solver configurations are only supported by the portfolio search")
+    return solver_configs[0]
 
-    model = inner_synthesize(ast, linv, inputs, outputs)
-    if model is not None:
+
+def report_depth(depth: Depth) -> None:
+    total = sum(depth) if isinstance(depth, tuple) else depth
+    STATS["unfolding_depth"] = total
+    if total == 0:
         print(">> Synthesized with no unfolding.")
-        return model
+    elif isinstance(depth, tuple) and len(depth) > 1:
+        print(f">> Synthesized with {', '.join(map(str, depth))} unfoldings of the loops.")
+    else:
+        print(f">> Synthesized with {total} unfoldings.")
+
+
+def synthesize(ast: Tree, linv: Invariant, inputs: list[Invariant], outputs: list[Invariant],
+               cegis: bool = False, incremental: bool = False, portfolio: bool = False,
+               solver_configs: list[dict] | None = None, dag: bool = False,
+               cache: ResultCache | None = None, per_loop: bool = False,
+               prepass: typing.Callable[[Tree], Tree] | None = None, scalarize: bool = False,
+               prescreen: Prescreen | None = None) -> ModelRef | None:
+    """
+    Synthesize a model for a program AST node.
+    With `cegis`, every unfolding depth is solved by counterexample-guided search
+    instead of a single quantified query.
+    With `incremental`, all unfolding depths are solved by the same solver.
+    With `portfolio`, all unfolding depths are solved in parallel, each once per
+    solver configuration (a dict of Z3 solver parameters) in `solver_configs`; otherwise
+    `solver_configs` may give a single configuration, which every depth is solved with.
+    With `dag`, the branches of loop-free `if`s are joined instead of each carrying a copy
+    of the rest of the program, which keeps the formula linear in the number of `if`s.
+    The result of every unfolding depth is looked up in `cache`, which defaults to the
+    cache named by the `WHILE_CACHE_DIR` environment variable.
+    With `per_loop`, every loop is unfolded to its own depth, and the combinations of depths
+    are searched cheapest first.
+    A `prepass`, such as `peval.partial_eval`, rewrites every unfolded program before its
+    formula is built; it must keep the program's variables and final state. There is none by
+    default, as partial evaluation only pays off for programs with concrete prefixes.
+    With `scalarize`, the arrays of loop-free programs that are only indexed by constants and
+    holes, and that the PBEs do not read, are encoded as a variable per index; the other
+    arrays, and the depths that keep loops, use the array theory. It only applies to the
+    quantified query: the ground queries of `cegis` are slower with the case splits it adds.
+    With `cegis`, a `prescreen` such as `interp.prescreen` refutes candidates before they are
+    checked by the solver.
+    """
+    if incremental and (cegis or portfolio):
+        raise ValueError("incremental unfolding is only supported for the sequential quantified query")
+    if prescreen is not None and not cegis:
+        raise ValueError("prescreening is only supported for counterexample-guided search")
+    solver_params = sequential_solver_params(portfolio, solver_configs)
+    scalarize = scalarize and not cegis
+
+    reset_run()
+    for idx, hole in enumerate(summarize(ast).holes):
+        hole.var = Int(hole_name(idx))
+
+    if cegis:
+        inner = functools.partial(inner_synthesize_cegis, prescreen=prescreen)
+    elif incremental:
+        inner = incremental_synthesizer()
+    else:
+        inner = inner_synthesize
+
+    cache = default_cache() if cache is None else cache
+    query = query_id(ast, [linv, *inputs, *outputs]) if cache is not None else None
+    settings = {"cegis": cegis, "incremental": incremental, "dag": dag, "timeout": TIMEOUT,
+                "cegis_max_iterations": CEGIS_MAX_ITERATIONS, "prepass": hook_name(prepass),
+                "scalarize": scalarize, "prescreen": hook_name(prescreen)}
+    hole_vars = get_holes(ast)
+    plan = depth_plan(ast, per_loop)
+
+    def search(depth: Depth, solver_params: dict | None = None) -> ModelRef | None:
+        def solve() -> ModelRef | None:
+            return inner(unfold_for_search(ast, depth, prepass), linv, inputs, outputs, solver_params, dag=dag,
+                         scalarize=scalarize)
+
+        if query is None:
+            return solve()
+        key = cache.key("synthesize", query, depth, settings, solver_params or {})
+        return cached_query(cache, key, solve, lambda model: get_hole_values(model, hole_vars),
+                            lambda values: None if values is None else model_from_hole_values(values))
+
+    if portfolio:
+        def task(step: int, solver_params: dict) -> dict[str, int] | None:
+            return get_hole_values(search(plan[step], solver_params), hole_vars)
 
-    for i in range(1, MAX_UNFOLDING):
-        unfolded_ast = unfold_while(ast, i)
-        model = inner_synthesize(unfolded_ast, linv, inputs, outputs)
+        found = run_portfolio(task, range(len(plan)), solver_configs or [{}])
+        if found is None:
+            return None
+        step, values = found
+        report_depth(plan[step])
+        return model_from_hole_values(values)
+
+    for depth in plan:
+        model = search(depth, solver_params)
         if model is not None:
-            print(f">> Synthesized with {i} unfoldings.")
+            report_depth(depth)
             return model
 
     return None
 
 
-def inner_verify(P: Invariant, ast: Tree, Q: Invariant, linv: Invariant) -> bool:
-    env = mk_env(get_non_array_ids(ast), get_array_ids(ast))
+def inner_verify(P: Invariant, ast: Tree, Q: Invariant, linv: Invariant, solver_params: dict | None = None,
+                 dag: bool = False, scalarize: bool = False) -> bool:
+    env, _, _ = mk_search_env(ast, [P, Q], scalarize)
     env[INVARIANT_KEY] = linv
+    env[DAG_KEY] = dag
     wp_inv = wp(ast, Q)
 
-    s = Solver()
-    s.set("timeout", TIMEOUT)
+    s = mk_solver(solver_params)
     s.add(Not(Implies(P(env), wp_inv(env))))
     if s.check() == unsat:
         return True
@@ -293,24 +1146,46 @@ def inner_verify(P: Invariant, ast: Tree, Q: Invariant, linv: Invariant) -> bool
         return False
 
 
-def verify(P: Invariant, ast: Tree, Q: Invariant, linv: Invariant) -> bool:
+def verify(P: Invariant, ast: Tree, Q: Invariant, linv: Invariant, portfolio: bool = False,
+           solver_configs: list[dict] | None = None, dag: bool = False, cache: ResultCache | None = None,
+           per_loop: bool = False, prepass: typing.Callable[[Tree], Tree] | None = None,
+           scalarize: bool = False) -> bool:
     """Verify a Hoare triple {P} c {Q}
     Where P, Q are assertions (see below for examples)
     and ast is the AST of the command c.
     Returns `True` iff the triple is valid.
     Also prints the counterexample (model) returned from Z3 in case
     it is not.
+    With `portfolio`, the unfolding depths are tried in parallel, each once per configuration
+    in `solver_configs` (otherwise there may be a single one), and `dag` selects the
+    encoding of `if`s, `cache` the cache of results, `per_loop` the depths of the loops,
+    `prepass` a rewriting of the unfolded programs and `scalarize` the encoding of arrays
+    (see `synthesize`).
     """
+    solver_params = sequential_solver_params(portfolio, solver_configs)
+    reset_run()
 
-    if inner_verify(P, ast, Q, linv):
-        return True
+    cache = default_cache() if cache is None else cache
+    query = query_id(ast, [P, Q, linv]) if cache is not None else None
+    settings = {"dag": dag, "timeout": TIMEOUT, "prepass": hook_name(prepass), "scalarize": scalarize}
+    plan = depth_plan(ast, per_loop)
 
-    for i in range(1, 10):
-        unfolded_ast = unfold_while(ast, i)
-        if inner_verify(P, unfolded_ast, Q, linv):
-            return True
+    def check(depth: Depth, solver_params: dict | None = None) -> bool:
+        def solve() -> bool:
+            return inner_verify(P, unfold_for_search(ast, depth, prepass), Q, linv, solver_params, dag, scalarize)
+
+        if query is None:
+            return solve()
+        key = cache.key("verify", query, depth, settings, solver_params or {})
+        return cached_query(cache, key, solve, bool, bool)
+
+    if portfolio:
+        def task(step: int, solver_params: dict) -> bool | None:
+            return check(plan[step], solver_params) or None
+
+        return run_portfolio(task, range(len(plan)), solver_configs or [{}]) is not None
 
-    return False
+    return any(check(depth, solver_params) for depth in plan)
 
 
 def pretty_repr(ast: Tree, model: ModelRef, depth=0) -> str: